@@ -1,9 +1,14 @@
 from flask import Blueprint, jsonify, request, session
 from functools import wraps
 from datetime import datetime, timezone
+import os
 import uuid
 from bson import ObjectId
 
+from cache import TTLCache
+from language import context_language
+from passwords import PasswordHasherBusy, hash_password
+
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 # These will be initialized when the blueprint is registered
@@ -11,6 +16,34 @@ users_collection = None
 projects_collection = None
 collaborators_collection = None
 api_keys_collection = None
+invalidate_project_access = None
+
+# Identity and role per username, so session polling and admin checks don't
+# hit the users collection on every request. Admin edits invalidate entries
+# in this worker; the TTL bounds how long other workers can lag.
+user_profiles = TTLCache(
+    maxsize=int(os.getenv("USER_PROFILE_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("USER_PROFILE_CACHE_TTL", 60))
+)
+
+def get_user_profile(username):
+    """Cached ``{"username", "email", "role"}`` for a user, or None."""
+    profile = user_profiles.get(username)
+    if profile is None:
+        user = users_collection.find_one(
+            {"username": username},
+            {"_id": 0, "username": 1, "email": 1, "role": 1}
+        )
+        profile = {
+            "username": user["username"],
+            "email": user.get("email") or user["username"],
+            "role": user.get("role", "user")
+        } if user else False
+        user_profiles.set(username, profile)
+    return profile or None
+
+def invalidate_user_profile(username):
+    user_profiles.pop(username)
 
 def admin_required(f):
     @wraps(f)
@@ -18,7 +51,7 @@ def admin_required(f):
         if "user" not in session:
             return jsonify({"error": "Unauthorized"}), 401
             
-        user = users_collection.find_one({"username": session["user"]})
+        user = get_user_profile(session["user"])
         if not user or user.get("role") != "admin":
             return jsonify({"error": "Admin access required"}), 403
             
@@ -63,6 +96,9 @@ def get_user(user_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def hasher_busy_response():
+    return jsonify({"error": "Too many password operations in progress, please retry"}), 503, {"Retry-After": "1"}
+
 @admin_bp.route("/users", methods=["POST"])
 @admin_required
 def create_user():
@@ -78,10 +114,15 @@ def create_user():
     if existing_user:
         return jsonify({"error": "Username already exists"}), 400
     
+    try:
+        password = hash_password(data["password"])
+    except PasswordHasherBusy:
+        return hasher_busy_response()
+    
     # Create new user
     new_user = {
         "username": data["username"],
-        "password": data["password"],
+        "password": password,
         "email": data.get("email", data["username"]),
         "role": data.get("role", "user"),
         "created_at": datetime.now(timezone.utc),
@@ -89,6 +130,7 @@ def create_user():
     }
     
     result = users_collection.insert_one(new_user)
+    invalidate_user_profile(new_user["username"])
     new_user["_id"] = str(result.inserted_id)
     
     # Remove password from response
@@ -124,7 +166,10 @@ def update_user(user_id):
         if "role" in data:
             update_data["role"] = data["role"]
         if "password" in data:
-            update_data["password"] = data["password"]
+            try:
+                update_data["password"] = hash_password(data["password"])
+            except PasswordHasherBusy:
+                return hasher_busy_response()
         
         # Add updated_at timestamp
         update_data["updated_at"] = datetime.now(timezone.utc)
@@ -133,6 +178,7 @@ def update_user(user_id):
         # Update the user
         if update_data:
             users_collection.update_one(user_filter, {"$set": update_data})
+            invalidate_user_profile(user["username"])
             
         # Get updated user
         updated_user = users_collection.find_one(user_filter)
@@ -169,6 +215,7 @@ def delete_user(user_id):
             
         # Delete the user
         users_collection.delete_one(user_filter)
+        invalidate_user_profile(user["username"])
         
         return jsonify({"message": "User deleted successfully"})
     except Exception as e:
@@ -231,6 +278,8 @@ def update_project(project_id):
             update_data["name"] = data["name"]
         if "context" in data:
             update_data["context"] = data["context"]
+        if "context" in update_data:
+            update_data["language"] = context_language(update_data["context"])
         
         # Add updated_at timestamp
         update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
@@ -260,6 +309,8 @@ def delete_project(project_id):
             
         # Delete the project
         projects_collection.delete_one({"id": project_id})
+        if invalidate_project_access:
+            invalidate_project_access(project_id)
         
         # Delete project collaborators
         collaborators_collection.delete_many({"project_id": project_id})
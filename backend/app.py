@@ -1,26 +1,56 @@
 import os
 from datetime import datetime, timezone
-from functools import wraps
+from functools import wraps, lru_cache
 import uuid
 import json
 from bson import ObjectId
-import langdetect
 import anthropic
-import PyPDF2
-import docx
 from flask import Flask, request, jsonify, session, Response
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
 import base64
-from admin import admin_bp
-import re
-import io
+import hashlib
+import httpx
+from admin import admin_bp, admin_required, get_user_profile
+from cache import TTLCache
+from sse import CodeBlockParser, DeltaCoalescer, SSE_DONE, sse_event
+from scenarios import render_test_cases, test_case_changes, test_case_fields, update_scenario
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import admin
+import conversations
+import versions
+from documents import (
+    EXTRACT_FRAME_CHARS,
+    ExtractionError,
+    cached_pieces,
+    document_kind,
+    document_unit,
+    extract_document,
+    extraction_cache,
+    extraction_cache_key,
+    iter_document,
+    join_pieces,
+    parse_page_range,
+    spool_upload,
+)
+from segmentation import segment_requirements
+from exports import EXPORT_CONTENT_TYPES, iter_export
+from spreadsheets import iter_rows, parse_requirement_row, spreadsheet_kind
+from language import context_language, detect_language, enough_context
+from priority import detect_priority
+from passwords import PasswordHasherBusy, rehash_in_background, verify_password
+from indexes import apply_indexes
+from usage import generation_usage, usage_counts
 
 load_dotenv()
 
@@ -47,7 +77,8 @@ app.config.update(
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE='Lax',
     PERMANENT_SESSION_LIFETIME=86400,
-    SESSION_REFRESH_EACH_REQUEST=True
+    SESSION_REFRESH_EACH_REQUEST=True,
+    RATELIMIT_ENABLED=os.getenv("RATELIMIT_ENABLED", "true").lower() != "false"
 )
 
 # CORS configuration
@@ -73,22 +104,14 @@ requirements_collection = db["requirements"]
 versions_collection = db["versions"]
 collaborators_collection = db["collaborators"]
 api_keys_collection = db["api_keys"]
+conversations_collection = db["conversations"]
 
 admin.users_collection = users_collection
 admin.projects_collection = projects_collection
 admin.collaborators_collection = collaborators_collection
 admin.api_keys_collection = api_keys_collection
-# Create indexes
-history_collection.create_index([("user", 1)])
-history_collection.create_index([("timestamp", -1)])
-projects_collection.create_index([("user", 1)])
-requirements_collection.create_index([("project_id", 1)])
-requirements_collection.create_index([("user", 1)])
-versions_collection.create_index([("requirement_id", 1)])
-versions_collection.create_index([("timestamp", -1)])
-collaborators_collection.create_index([("project_id", 1)])
-collaborators_collection.create_index([("email", 1)])
-api_keys_collection.create_index([("user", 1)])
+versions.versions_collection = versions_collection
+conversations.conversations_collection = conversations_collection
 
 def login_required(f):
     @wraps(f)
@@ -100,9 +123,10 @@ def login_required(f):
 
 def is_admin(username):
     """Check if a user has admin role"""
-    user = users_collection.find_one({"username": username})
+    user = get_user_profile(username)
     return user and user.get("role") == "admin"
 
+@lru_cache(maxsize=1)
 def get_encryption_key():
     """Get or generate an encryption key for API keys."""
     key = os.getenv("ENCRYPTION_KEY")
@@ -124,14 +148,18 @@ def get_encryption_key():
     
     return key.encode() if isinstance(key, str) else key
 
+@lru_cache(maxsize=1)
+def get_fernet():
+    """Return the process-wide Fernet instance built from the encryption key."""
+    return Fernet(get_encryption_key())
+
 def encrypt_api_key(api_key):
     """Encrypt an API key."""
     if not api_key:
         return None
     
     try:
-        f = Fernet(get_encryption_key())
-        return f.encrypt(api_key.encode()).decode()
+        return get_fernet().encrypt(api_key.encode()).decode()
     except Exception as e:
         print(f"Error encrypting API key: {e}")
         return None
@@ -142,14 +170,40 @@ def decrypt_api_key(encrypted_key):
         return None
     
     try:
-        f = Fernet(get_encryption_key())
-        return f.decrypt(encrypted_key.encode()).decode()
+        return get_fernet().decrypt(encrypted_key.encode()).decode()
     except Exception as e:
         print(f"Error decrypting API key: {e}")
         return None
     
+# Resolved (decrypted) API keys per (user, project). Writes through /api_keys
+# invalidate the affected entries; other workers catch up within the TTL.
+api_key_cache = TTLCache(
+    maxsize=int(os.getenv("API_KEY_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("API_KEY_CACHE_TTL", 300))
+)
+
+def invalidate_api_key_cache(username, project_id=None):
+    """Drop cached keys affected by a change to a user's project or default key."""
+    if project_id:
+        api_key_cache.pop((username, project_id))
+    else:
+        # The default key is the fallback for every project of this user
+        api_key_cache.discard_where(lambda key: key[0] == username)
+
 def get_user_api_key(username, project_id=None):
     """Get a user's API key, with optional project-specific override."""
+    cache_key = (username, project_id or None)
+    cached_key = api_key_cache.get(cache_key)
+    if cached_key:
+        return cached_key
+    
+    api_key = _resolve_user_api_key(username, project_id)
+    if api_key:
+        api_key_cache.set(cache_key, api_key)
+    return api_key
+
+def _resolve_user_api_key(username, project_id=None):
+    """Look up and decrypt a user's API key from the database."""
     # First try to get a project-specific key if project_id is provided
     if project_id:
         project_key = api_keys_collection.find_one({
@@ -174,79 +228,422 @@ def get_user_api_key(username, project_id=None):
     # If no user keys, use the default from .env
     return os.getenv("CLAUDE_API_KEY")
 
+# Process-wide Anthropic clients keyed by API key, so repeated calls reuse the
+# same httpx connection pool instead of paying a TLS handshake every time.
+# Evicted clients are only dropped, never closed: a stream still running on
+# one keeps it alive and the pool is closed once it is garbage collected.
+anthropic_clients = TTLCache(
+    maxsize=int(os.getenv("ANTHROPIC_CLIENT_POOL_SIZE", 32)),
+    ttl=int(os.getenv("ANTHROPIC_CLIENT_IDLE_TTL", 900)),
+    sliding=True
+)
+
+def _api_key_fingerprint(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def get_client_for_api_key(api_key):
+    """Return the pooled Anthropic client for an API key, creating it if needed."""
+    fingerprint = _api_key_fingerprint(api_key)
+    client = anthropic_clients.get(fingerprint)
+    if client is None:
+        client = anthropic.Anthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=float(os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", 60))
+                )
+            )
+        )
+        anthropic_clients.set(fingerprint, client)
+    return client
+
+# Async clients for the asyncio serving mode (asgi.py). Each worker process
+# runs a single event loop, so one pool per process is enough.
+anthropic_async_clients = TTLCache(
+    maxsize=int(os.getenv("ANTHROPIC_CLIENT_POOL_SIZE", 32)),
+    ttl=int(os.getenv("ANTHROPIC_CLIENT_IDLE_TTL", 900)),
+    sliding=True
+)
+
+def get_async_client_for_api_key(api_key):
+    """Return the pooled AsyncAnthropic client for an API key, creating it if needed."""
+    fingerprint = _api_key_fingerprint(api_key)
+    client = anthropic_async_clients.get(fingerprint)
+    if client is None:
+        client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=1000,
+                    max_keepalive_connections=100,
+                    keepalive_expiry=float(os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", 60))
+                )
+            )
+        )
+        anthropic_async_clients.set(fingerprint, client)
+    return client
+
+def evict_anthropic_client(api_key):
+    """Forget the pooled clients for an API key that was replaced or deleted."""
+    if api_key:
+        anthropic_clients.pop(_api_key_fingerprint(api_key))
+        anthropic_async_clients.pop(_api_key_fingerprint(api_key))
+
 def get_anthropic_client(username, project_id=None):
     """Get an Anthropic client using the appropriate API key."""
     api_key = get_user_api_key(username, project_id)
     if not api_key:
         raise ValueError("No API key available")
-    return anthropic.Anthropic(api_key=api_key)
+    return get_client_for_api_key(api_key)
+
+CLAUDE_MODEL = "claude-3-haiku-20240307"
+
+# Finished generations keyed by a hash of the exact prompt and model, so a
+# repeated request can be replayed without another call to the API.
+generation_cache = TTLCache(
+    maxsize=int(os.getenv("GENERATION_CACHE_SIZE", 512)),
+    ttl=int(os.getenv("GENERATION_CACHE_TTL", 86400)),
+    max_bytes=int(os.getenv("GENERATION_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    sizeof=lambda text: len(text.encode("utf-8"))
+)
+GENERATION_CACHE_REPLAY_CHUNK = 256
+
+def generation_cache_key(*prompt, model=CLAUDE_MODEL):
+    """Content address of a generation: the model name plus the exact prompt parts."""
+    return hashlib.sha256("\0".join((model, *prompt)).encode("utf-8")).hexdigest()
+
+def prompt_cache_blocks(*texts):
+    """Text blocks that each end a prompt cache breakpoint; empty texts are left out.
+    
+    The API caches the prompt prefix up to each marked block, so stable
+    parts (instructions, format examples, project context) go first and the
+    parts that change on every call after the last breakpoint. At most four
+    blocks per request may be marked.
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}} for text in texts if text]
+
+def replay_cached_generation(text):
+    """Yield a cached generation as SSE chunks, mirroring a live stream."""
+    yield f"data: {json.dumps({'cached': True})}\n\n"
+    for i in range(0, len(text), GENERATION_CACHE_REPLAY_CHUNK):
+        yield f"data: {json.dumps({'chunk': text[i:i + GENERATION_CACHE_REPLAY_CHUNK]})}\n\n"
+
+# Key set on the WSGI environ by the asyncio server in asgi.py. Views that
+# stream a model response then hand back their GenerationJob instead of
+# running it on the worker thread.
+ASYNC_STREAM_ENVIRON_KEY = "chatproject.async_stream"
+STREAM_INTERRUPTED_MESSAGE = "Generation interrupted by a server restart. Partial output was saved."
+
+class GenerationJob:
+    """A prepared model call plus the hooks that persist its result.
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from a PDF file object without saving to disk"""
-    text = ""
+    Views build one after validating the request and return it through
+    generation_response(). The job is then streamed either on the worker
+    thread (iter_generation_sse) or by the asyncio engine in asgi.py, with
+    the same frames in both cases.
+    """
+
+    def __init__(self, api_key, messages, on_complete=None, on_checkpoint=None, cache_key=None,
+                 bypass_cache=False, error_prefix="", done_on_error=False, max_tokens=4000,
+                 on_code_block=None, stop_after_code_block=False, system=None, usage_kind="generation"):
+        self.api_key = api_key
+        self.request = {
+            "model": CLAUDE_MODEL,
+            "max_tokens": max_tokens,
+            "messages": messages
+        }
+        if system:
+            self.request["system"] = system
+        self.usage_kind = usage_kind
+        self.usage = None
+        self.started = time.perf_counter()
+        self.first_token_seconds = None
+        self.on_complete = on_complete
+        self.on_checkpoint = on_checkpoint
+        self.cache_key = cache_key
+        self.cached_text = None
+        # Without a key the stream fails in client(); a cached generation
+        # (possibly paid for by another user) isn't served instead
+        if cache_key and not bypass_cache and api_key:
+            self.cached_text = generation_cache.get(cache_key)
+        self.error_prefix = error_prefix
+        self.done_on_error = done_on_error
+        self.writer = DeltaCoalescer()
+        self.on_code_block = on_code_block
+        self.code_block = CodeBlockParser() if on_code_block else None
+        self.code_block_delivered = False
+        self.stop_after_code_block = stop_after_code_block
+        self.stopped_early = False
+        self.interrupted = False
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def client(self):
+        if not self.api_key:
+            raise ValueError("No API key available")
+        return get_client_for_api_key(self.api_key)
+
+    def async_client(self):
+        if not self.api_key:
+            raise ValueError("No API key available")
+        return get_async_client_for_api_key(self.api_key)
+
+    def track(self, event):
+        """Collect token usage from the stream's message_start and message_delta events."""
+        if event.type == "message_start":
+            self.usage = usage_counts(event.message.usage)
+        elif event.type == "message_delta" and self.usage is not None and event.usage:
+            self.usage["output_tokens"] = event.usage.output_tokens
+    
+    def record_usage(self):
+        if self.usage is not None:
+            if self.stopped_early:
+                # Closed before message_delta, which carries the output count:
+                # estimate it from the text received
+                self.usage["output_tokens"] = max(self.usage["output_tokens"],
+                                                  conversations.estimate_tokens(self.writer.text()))
+            generation_usage.record(self.usage_kind, self.usage, self.first_token_seconds,
+                                    time.perf_counter() - self.started, estimated=self.stopped_early)
+            self.usage = None
+    
+    def feed(self, text):
+        """Buffer a text delta; returns the chunk frames to send now."""
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+        if self.code_block:
+            self.code_block.feed(text)
+        frame = self.writer.add(text)
+        return [frame] if frame else []
+
+    def code_block_ready(self):
+        return bool(self.code_block and self.code_block.closed and not self.code_block_delivered)
+
+    def deliver_code_block(self):
+        """Run the code block hook as soon as the block closes.
+
+        Pending text is flushed first so the client sees the block before
+        the event. May block on the database, like finish().
+        """
+        self.code_block_delivered = True
+        frames = []
+        frame = self.writer.flush()
+        if frame:
+            frames.append(frame)
+        frames.extend(sse_event(payload) for payload in self.on_code_block(self.code_block.block) or [])
+        if self.stop_after_code_block:
+            self.stopped_early = True
+        return frames
+
+    def _settle(self):
+        with self._lock:
+            if self._settled:
+                return False
+            self._settled = True
+            return True
+
+    def finish(self, full_response, stop_reason):
+        """Run the completion hook and return the closing frames.
+
+        May block on the database; the asyncio engine calls it in a thread.
+        """
+        if not self._settle():
+            return self.interrupted_frames()
+        self.record_usage()
+        if self.cache_key and self.cached_text is None and stop_reason == "end_turn":
+            generation_cache.set(self.cache_key, full_response)
+        frames = []
+        if self.on_complete:
+            frames.extend(sse_event(payload) for payload in self.on_complete(full_response) or [])
+        frames.append(SSE_DONE)
+        return frames
+
+    def fail(self, error):
+        error_msg = f"{self.error_prefix}{str(error)}"
+        print(f"ERROR: {error_msg}")
+        frames = [sse_event({'error': error_msg})]
+        if self.done_on_error:
+            frames.append(SSE_DONE)
+        return frames
+
+    def interrupt(self):
+        """Stop the stream at its next event and save the partial output."""
+        self.interrupted = True
+        if not self._settle():
+            return
+        if self.on_checkpoint and self.writer.parts:
+            try:
+                self.on_checkpoint(self.writer.text())
+            except Exception as e:
+                print(f"Error checkpointing generation: {e}")
+
+    def interrupted_frames(self):
+        return [sse_event({'error': STREAM_INTERRUPTED_MESSAGE, 'interrupted': True}), SSE_DONE]
+
+# Streams currently running in this worker, checkpointed on shutdown
+active_generations = set()
+active_generations_lock = threading.Lock()
+
+def register_generation(job):
+    with active_generations_lock:
+        active_generations.add(job)
+
+def unregister_generation(job):
+    with active_generations_lock:
+        active_generations.discard(job)
+
+def checkpoint_active_generations():
+    """Interrupt every stream still running and save what it produced so far."""
+    with active_generations_lock:
+        jobs = list(active_generations)
+    for job in jobs:
+        job.interrupt()
+    if jobs:
+        print(f"Checkpointed {len(jobs)} in-flight generation(s) before shutdown")
+
+def install_drain_handler(grace_period):
+    """Chain onto SIGTERM so streams get ``grace_period`` seconds to finish.
+
+    In-flight generations that are still running when the grace period runs
+    out are checkpointed and closed, before the server's own graceful
+    timeout kills the worker.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    
+    def handle_sigterm(signum, frame):
+        timer = threading.Timer(grace_period, checkpoint_active_generations)
+        timer.daemon = True
+        timer.start()
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+    
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+def iter_generation_sse(job):
+    """Stream a GenerationJob as SSE frames on the current thread."""
+    register_generation(job)
     try:
-        # PyPDF2 can read from a file-like object directly
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        for page in pdf_reader.pages:   
-            text += page.extract_text() + "\n"
+        if job.cached_text is not None:
+            yield from replay_cached_generation(job.cached_text)
+            yield from job.finish(job.cached_text, "end_turn")
+            return
+        
+        stop_reason = None
+        with job.client().messages.stream(**job.request) as stream:
+            for event in stream:
+                if job.interrupted:
+                    yield from job.interrupted_frames()
+                    return
+                job.track(event)
+                if event.type == "content_block_delta":
+                    text = getattr(event.delta, "text", None)
+                    if text:
+                        yield from job.feed(text)
+                        if job.code_block_ready():
+                            yield from job.deliver_code_block()
+                            if job.stopped_early:
+                                # Leaving the context manager closes the upstream request
+                                break
+            else:
+                stop_reason = stream.get_final_message().stop_reason
+        
+        frame = job.writer.flush()
+        if frame:
+            yield frame
+        yield from job.finish(job.writer.text(), stop_reason)
     except Exception as e:
-        return f"Error extracting text from PDF: {str(e)}"
-    return text.strip()
+        yield from job.fail(e)
+    finally:
+        unregister_generation(job)
+
+def generation_response(job, headers=None):
+    """Return the SSE response for a job, deferring to asgi.py when it serves the request."""
+    if request.environ.get(ASYNC_STREAM_ENVIRON_KEY):
+        response = Response(iter(()), content_type="text/event-stream", headers=headers)
+        response.generation_job = job
+        return response
+    return Response(iter_generation_sse(job), content_type="text/event-stream", headers=headers)
 
-def extract_text_from_docx(docx_file):
-    """Extract text from a DOCX file object without saving to disk"""
-    text = ""
+def iter_extraction_sse(kind, upload, ranges, filename, cache_key):
+    """Stream a document's text as SSE frames, with progress, as it is extracted.
+    
+    Each frame carries the text of one page, or of several consecutive
+    paragraphs/blocks up to EXTRACT_FRAME_CHARS, along with the number of the
+    last piece it contains and the total when it is known. Cached documents
+    are replayed in the same frames.
+    """
+    unit = document_unit(kind)
+    pieces = cached_pieces(cache_key)
+    cached = pieces is not None
+    pending = []
+    pending_chars = 0
+    chars = 0
+    count = 0
+    last = None
     try:
-        file_content = docx_file.read()
-        docx_io = io.BytesIO(file_content)
-        doc = docx.Document(docx_io)
-        for para in doc.paragraphs:
-            text += para.text + "\n"
+        yield sse_event({"filename": filename, "unit": unit, "cached": cached})
+        if not cached:
+            pieces = iter_document(kind, upload, ranges, cache_key)
+        for number, total, text in pieces:
+            pending.append(text)
+            pending_chars += len(text)
+            chars += len(text)
+            count += 1
+            last = number
+            if unit == "page" or pending_chars >= EXTRACT_FRAME_CHARS:
+                yield sse_event({"unit": unit, "index": number, "total": total, "chunk": "".join(pending)})
+                pending, pending_chars = [], 0
+        if pending:
+            yield sse_event({"unit": unit, "index": last, "total": total, "chunk": "".join(pending)})
+        yield sse_event({"done": True, "filename": filename, "unit": unit, "count": count, "chars": chars})
     except Exception as e:
-        return f"Error extracting text from DOCX: {str(e)}"
-    return text.strip()
+        print(f"Error extracting text from {filename}: {str(e)}")
+        yield sse_event({"error": str(e) if isinstance(e, ExtractionError) else f"Failed to extract text: {str(e)}"})
+    finally:
+        upload.close()
+    yield SSE_DONE
+
+
+def requirement_language(requirement):
+    """Stored prompt language of a requirement; detected and saved for older documents."""
+    language = requirement.get("language")
+    if language is None:
+        language = detect_language(requirement.get("title", ""), requirement.get("description", ""))
+        requirements_collection.update_one({"id": requirement["id"]}, {"$set": {"language": language}})
+    return language
 
+def project_language(username, project_id):
+    """Language of a project the user can access, or None to detect it from the requirements.
 
-def detect_priority(text):
+    Projects whose context is too short to detect from have no language.
     """
-    Analyze text to automatically detect the priority level.
-    Returns 'high', 'medium', or 'low'.
+    if not project_id or not get_project_access(username, project_id):
+        return None
+    project = projects_collection.find_one({"id": project_id}, {"_id": 0, "context": 1, "language": 1})
+    if project is None:
+        return None
+    if not enough_context(project.get("context")):
+        return None
+    language = project.get("language")
+    if language is None:
+        language = context_language(project["context"])
+        projects_collection.update_one({"id": project_id}, {"$set": {"language": language}})
+    return language
+
+def generate_test_case_prompt(requirements, format_type, context="", example_case="", lang=None):
+    """Utility function to generate the prompt for test case generation.
+    
+    Returns ``(system, user)``: the instructions and format example, which
+    are the same for every requirement with the same format and language
+    and go in the cached system prefix, then the requirement itself.
+    ``lang`` is the stored language of the requirement or project; ad-hoc
+    text is detected (and cached) instead.
     """
-    text_lower = text.lower()
-    
-    high_priority_keywords = [
-        'critique', 'crucial', 'urgent', 'obligatoire', 'immédiat', 'vital',
-        'impératif', 'essentiel', 'doit', 'prioritaire', 'sécurité', 'fatal',
-        'risque', 'danger', 'critical', 'must', 'required', 'mandatory',
-        'immediately', 'security', 'safety', 'urgent', 'high priority'
-    ]
-    
-    low_priority_keywords = [
-        'optionnel', 'facultatif', 'souhaitable', 'suggéré', 'bonus', 
-        'accessoire', 'mineur', 'pourrait', 'éventuel', 'agréable', 'simple',
-        'optional', 'nice to have', 'could', 'minor', 'suggested', 'eventually',
-        'future', 'low priority', 'when possible', 'later'
-    ]
-    
-    high_count = sum(1 for word in high_priority_keywords if word in text_lower)
-    low_count = sum(1 for word in low_priority_keywords if word in text_lower)
-    
-    if high_count > low_count:
-        return 'high'
-    elif low_count > high_count:
-        return 'low'
-    else:
-        return 'medium'
-    
-    
-def generate_test_case_prompt(requirements, format_type, context="", example_case=""):
-    """Utility function to generate the prompt for test case generation"""
-    try:
-        input_text = context + " " + requirements
-        detected_lang = langdetect.detect(input_text)
-        lang = "en" if detected_lang == "en" else "fr"
-    except:
-        lang = "fr"
+    if lang is None:
+        lang = detect_language(context, requirements)
 
     if lang == "fr":
         example_format_default = """
@@ -295,13 +692,23 @@ Expected Result: An error message is displayed, and the user remains on the logi
         example_format = example_format_default
 
     instruction = f"""
-Generate test cases for the following requirement using the specified format.
-{"Functional context: " + context if context else ""} 
-Requirement: {requirements}
+Generate test cases for the requirement in the user message using the specified format.
 Format:
 {example_format}
 """
-    return instruction
+    requirement = f"""
+{"Functional context: " + context if context else ""} 
+Requirement: {requirements}
+"""
+    return instruction, requirement
+
+def test_case_request(prompt):
+    """``system`` and ``messages`` arguments for a test case prompt from generate_test_case_prompt()."""
+    instruction, requirement = prompt
+    return {
+        "system": prompt_cache_blocks(instruction),
+        "messages": [{"role": "user", "content": requirement}]
+    }
 
 # Auth Endpoints
 @app.route("/login", methods=["POST"])
@@ -310,10 +717,24 @@ def login():
     username = data.get("username")
     password = data.get("password")
 
-    user = users_collection.find_one({"username": username, "password": password})
-    if user:
+    user = users_collection.find_one({"username": username}) if username else None
+    try:
+        valid, needs_rehash = verify_password(password, user.get("password") if user else None)
+    except PasswordHasherBusy:
+        return jsonify({"error": "Too many logins in progress, please retry"}), 503, {"Retry-After": "1"}
+    
+    if valid:
+        if needs_rehash:
+            # Plaintext or old-cost password: store a fresh hash, unless it changed meanwhile
+            stored = user["password"]
+            rehash_in_background(password, lambda hashed: users_collection.update_one(
+                {"_id": user["_id"], "password": stored},
+                {"$set": {"password": hashed}}
+            ))
         session["user"] = username
         session.permanent = True
+        # Start the new session from the stored role, not a cached one
+        admin.invalidate_user_profile(username)
         return jsonify({
             "message": "Login successful", 
             "username": username,
@@ -336,13 +757,13 @@ def check_session():
         return jsonify({}), 200
 
     if "user" in session:
-        user = users_collection.find_one({"username": session["user"]})
+        user = get_user_profile(session["user"])
         if user:
             return jsonify({
                 "logged_in": True,
                 "username": session["user"],
-                "email": user.get("email") or session["user"],
-                "role": user.get("role", "user"),
+                "email": user["email"],
+                "role": user["role"],
                 "is_admin": user.get("role") == "admin"
             }), 200
     return jsonify({"logged_in": False, "error": "Not authenticated"}), 401
@@ -396,6 +817,7 @@ def create_api_key():
             {"_id": existing_key["_id"]},
             {"$set": {"api_key": encrypted_key}}
         )
+        evict_anthropic_client(decrypt_api_key(existing_key.get("api_key")))
     else:
         key_data = {
             "user": username,
@@ -407,6 +829,8 @@ def create_api_key():
         
         api_keys_collection.insert_one(key_data)
     
+    invalidate_api_key_cache(username, project_id)
+    
     return jsonify({"message": "API key saved successfully"})
 
 @app.route("/api_keys/<key_id>", methods=["DELETE"])
@@ -419,31 +843,95 @@ def delete_api_key(key_id):
     except:
         return jsonify({"error": "Invalid key ID"}), 400
     
-    result = api_keys_collection.delete_one({
+    deleted_key = api_keys_collection.find_one_and_delete({
         "_id": object_id,
         "user": username
     })
     
-    if result.deleted_count == 0:
+    if not deleted_key:
         return jsonify({"error": "Key not found or not authorized"}), 404
     
+    evict_anthropic_client(decrypt_api_key(deleted_key.get("api_key")))
+    invalidate_api_key_cache(username, deleted_key.get("project_id"))
+    
     return jsonify({"message": "API key deleted successfully"})
 
+# Who can open which project: (username, project_id) -> "owner", "collaborator"
+# or False. The TTL is short because other workers don't see the
+# invalidations done here.
+project_access_cache = TTLCache(
+    maxsize=int(os.getenv("PROJECT_ACCESS_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("PROJECT_ACCESS_CACHE_TTL", 30))
+)
+
+def project_role(project, username):
+    if not project:
+        return None
+    if project.get("user") == username:
+        return "owner"
+    if username in (project.get("collaborators") or []):
+        return "collaborator"
+    return None
+
+def get_project_access(username, project_id):
+    """Role of ``username`` on a project ("owner" or "collaborator"), or None."""
+    key = (username, project_id)
+    role = project_access_cache.get(key)
+    if role is None:
+        project = projects_collection.find_one(
+            {"id": project_id},
+            {"_id": 0, "user": 1, "collaborators": 1}
+        )
+        role = project_role(project, username) or False
+        project_access_cache.set(key, role)
+    return role or None
+
+def invalidate_project_access(project_id, username=None):
+    project_access_cache.discard_where(
+        lambda key: key[1] == project_id and (username is None or key[0] == username)
+    )
+
+def find_requirement_for_user(requirement_id, username):
+    """Fetch a requirement and the user's role on its project in one query.
+
+    Returns ``(requirement, role)``; requirement is None if it doesn't exist
+    and role is None if the user can't access its project.
+    """
+    results = list(requirements_collection.aggregate([
+        {"$match": {"id": requirement_id}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": projects_collection.name,
+            "localField": "project_id",
+            "foreignField": "id",
+            "as": "project"
+        }},
+        # Only the membership fields leave the server
+        {"$addFields": {"project": {"$arrayElemAt": [
+            {"$map": {
+                "input": "$project",
+                "as": "p",
+                "in": {"user": "$$p.user", "collaborators": "$$p.collaborators"}
+            }},
+            0
+        ]}}}
+    ]))
+    if not results:
+        return None, None
+    requirement = results[0]
+    role = project_role(requirement.pop("project", None), username)
+    project_access_cache.set((username, requirement["project_id"]), role or False)
+    return requirement, role
+
+admin.invalidate_project_access = invalidate_project_access
+
 # Project Collaboration
 @app.route("/projects/<project_id>/collaborators", methods=["GET"])
 @login_required
 def get_collaborators(project_id):
     username = session["user"]
     
-    project = projects_collection.find_one({
-        "id": project_id,
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not get_project_access(username, project_id):
         return jsonify({"error": "Project not found or access denied"}), 404
     
     collaborators = list(collaborators_collection.find({"project_id": project_id}))
@@ -499,6 +987,7 @@ def add_collaborator(project_id):
         {"id": project_id},
         {"$addToSet": {"collaborators": collaborator_username}}
     )
+    invalidate_project_access(project_id, collaborator_username)
     
     # Check if the collaborator is already in the collaborators collection
     existing_collab = collaborators_collection.find_one({
@@ -543,6 +1032,7 @@ def remove_collaborator(project_id, collaborator_username):
         {"id": project_id},
         {"$pull": {"collaborators": collaborator_username}}
     )
+    invalidate_project_access(project_id, collaborator_username)
     
     # Remove from collaborators collection
     collaborators_collection.delete_one({
@@ -582,6 +1072,7 @@ def create_project():
         "user": username,
         "name": data.get("name"),
         "context": data.get("context", ""),
+        "language": context_language(data.get("context", "")),
         "collaborators": [],
         "created_at": datetime.now(timezone.utc).isoformat()
     }
@@ -635,6 +1126,8 @@ def update_project(project_id):
         update_data["name"] = data["name"]
     if "context" in data:
         update_data["context"] = data["context"]
+    if "context" in update_data:
+        update_data["language"] = context_language(update_data["context"])
     
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
@@ -659,6 +1152,7 @@ def delete_project(project_id):
         return jsonify({"error": "Project not found or you don't have permission"}), 404
     
     projects_collection.delete_one({"id": project_id})
+    invalidate_project_access(project_id)
     requirements_collection.delete_many({"project_id": project_id})
     collaborators_collection.delete_many({"project_id": project_id})
     
@@ -670,15 +1164,7 @@ def delete_project(project_id):
 def get_requirements(project_id):
     username = session["user"]
     
-    project = projects_collection.find_one({
-        "id": project_id,
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not get_project_access(username, project_id):
         return jsonify({"error": "Project not found or access denied"}), 404
     
     requirements = list(requirements_collection.find({
@@ -696,15 +1182,7 @@ def create_requirement(project_id):
     data = request.json
     username = session["user"]
     
-    project = projects_collection.find_one({
-        "id": project_id,
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not get_project_access(username, project_id):
         return jsonify({"error": "Project not found or access denied"}), 404
     
     # Generate priority automatically based on description content
@@ -720,6 +1198,7 @@ def create_requirement(project_id):
         "project_id": project_id,
         "title": data.get("title"),
         "description": description,
+        "language": detect_language(data.get("title"), description),
         "category": data.get("category", "functionality"),
         "priority": priority,
         "status": data.get("status", "draft"),
@@ -737,24 +1216,114 @@ def create_requirement(project_id):
         "auto_priority_detected": auto_priority
     })
 
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 50000))
+IMPORT_MAX_REPORTED_ERRORS = 200
+
+@app.route("/projects/<project_id>/requirements/import", methods=["POST"])
+@login_required
+@limiter.limit("5 per minute")
+def import_requirements(project_id):
+    """Create requirements from the rows of an uploaded CSV or XLSX file.
+    
+    The first row names the columns (title/titre, description, category,
+    priority/priorité, status). Rows are read one at a time and inserted in
+    batches of IMPORT_BATCH_SIZE, so memory use doesn't depend on the file
+    size. Invalid rows are skipped and reported with their row number.
+    Language detection is left to the first generation (requirement_language)
+    to keep large imports fast.
+    """
+    username = session["user"]
+    
+    if not get_project_access(username, project_id):
+        return jsonify({"error": "Project not found or access denied"}), 404
+    
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"error": "No file provided"}), 400
+    file = request.files['file']
+    kind = spreadsheet_kind(file.filename)
+    if kind is None:
+        return jsonify({"error": "Unsupported file format. Please upload a CSV or XLSX file."}), 400
+    
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+    
+    def flush():
+        nonlocal imported
+        if batch:
+            requirements_collection.insert_many(batch, ordered=False)
+            imported += len(batch)
+            batch.clear()
+    
+    upload, _ = spool_upload(file)
+    try:
+        for row_number, values in iter_rows(kind, upload):
+            if imported + len(batch) + failed >= IMPORT_MAX_ROWS:
+                errors.append({"row": row_number, "error": f"Import stopped: the limit is {IMPORT_MAX_ROWS} rows"})
+                break
+            try:
+                fields = parse_requirement_row(values)
+            except ValueError as e:
+                failed += 1
+                if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                    errors.append({"row": row_number, "error": str(e)})
+                continue
+            
+            auto_priority = detect_priority(fields["description"])
+            now = datetime.now(timezone.utc).isoformat()
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "user": username,
+                "project_id": project_id,
+                "title": fields["title"],
+                "description": fields["description"],
+                "category": fields["category"],
+                "priority": fields["priority"] or auto_priority,
+                "status": fields["status"],
+                "source": file.filename,
+                "source_row": row_number,
+                "created_at": now,
+                "updated_at": now,
+                "priority_auto_generated": fields["priority"] is None
+            })
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        flush()
+    except ValueError as e:
+        # Unusable header or empty file; rows already inserted stay
+        flush()
+        return jsonify({"error": str(e), "imported": imported}), 400
+    except Exception as e:
+        print(f"Error importing requirements from {file.filename}: {str(e)}")
+        # Keep the rows read before the error, as for an unusable header
+        try:
+            flush()
+        except Exception as flush_error:
+            print(f"Error saving the last rows from {file.filename}: {str(flush_error)}")
+        return jsonify({"error": f"Failed to read the file: {str(e)}", "imported": imported}), 400
+    finally:
+        upload.close()
+    
+    print(f"Imported {imported} requirements into project {project_id} from {file.filename} ({failed} rows rejected)")
+    return jsonify({
+        "message": f"{imported} requirements imported",
+        "imported": imported,
+        "failed": failed,
+        "errors": errors
+    })
+
 @app.route("/requirements/<requirement_id>", methods=["GET"])
 @login_required
 def get_requirement(requirement_id):
     username = session["user"]
     
-    requirement = requirements_collection.find_one({"id": requirement_id})
+    requirement, role = find_requirement_for_user(requirement_id, username)
     if not requirement:
         return jsonify({"error": "Requirement not found"}), 404
     
-    project = projects_collection.find_one({
-        "id": requirement["project_id"],
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not role:
         return jsonify({"error": "Access denied"}), 403
     
     requirement["_id"] = str(requirement["_id"])
@@ -765,19 +1334,11 @@ def update_requirement(requirement_id):
     username = session["user"]
     data = request.json
     
-    requirement = requirements_collection.find_one({"id": requirement_id})
+    requirement, role = find_requirement_for_user(requirement_id, username)
     if not requirement:
         return jsonify({"error": "Requirement not found"}), 404
     
-    project = projects_collection.find_one({
-        "id": requirement["project_id"],
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not role:
         return jsonify({"error": "Access denied"}), 403
     
     update_data = {}
@@ -806,6 +1367,12 @@ def update_requirement(requirement_id):
     if "status" in data:
         update_data["status"] = data["status"]
     
+    if "title" in update_data or "description" in update_data:
+        update_data["language"] = detect_language(
+            update_data.get("title", requirement.get("title", "")),
+            update_data.get("description", requirement.get("description", ""))
+        )
+    
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
         requirements_collection.update_one(
@@ -823,29 +1390,189 @@ def update_requirement(requirement_id):
         "requirement": updated_requirement
     })
 
+@app.route("/projects/<project_id>/reprioritize", methods=["POST"])
+@login_required
+def reprioritize_requirements(project_id):
+    """Re-run priority detection on every requirement of a project.
+    
+    Priorities set by hand are kept unless ``force`` is true. Changes are
+    written back with a single bulk_write.
+    """
+    data = request.json or {}
+    force = bool(data.get("force", False))
+    username = session["user"]
+    
+    if not get_project_access(username, project_id):
+        return jsonify({"error": "Project not found or access denied"}), 404
+    
+    requirements = requirements_collection.find(
+        {"project_id": project_id},
+        {"_id": 0, "id": 1, "description": 1, "priority": 1, "priority_auto_generated": 1}
+    )
+    
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    checked = 0
+    manual = 0
+    for requirement in requirements:
+        checked += 1
+        if not force and requirement.get("priority_auto_generated") is False:
+            manual += 1
+            continue
+        priority = detect_priority(requirement.get("description", ""))
+        if priority != requirement.get("priority") or requirement.get("priority_auto_generated") is not True:
+            operations.append(UpdateOne(
+                {"id": requirement["id"]},
+                {"$set": {"priority": priority, "priority_auto_generated": True, "updated_at": now}}
+            ))
+    
+    if operations:
+        requirements_collection.bulk_write(operations, ordered=False)
+    
+    return jsonify({
+        "message": f"{len(operations)} requirement priorities updated",
+        "checked": checked,
+        "updated": len(operations),
+        "skipped_manual": manual
+    })
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 100))
+
+def iter_latest_test_cases(project_id):
+    """Yield ``(requirement, history_item)`` for each requirement with test cases.
+
+    Requirements are read from a cursor in creation order, and the latest
+    history item of each batch of EXPORT_BATCH_SIZE requirements is fetched
+    with one query, so only a batch is held in memory at a time.
+    """
+    requirements = requirements_collection.find(
+        {"project_id": project_id},
+        {"_id": 0, "id": 1, "title": 1, "priority": 1},
+        sort=[("created_at", 1), ("_id", 1)],
+        batch_size=EXPORT_BATCH_SIZE
+    )
+
+    def latest(batch):
+        items = history_collection.aggregate([
+            {"$match": {
+                "project_id": project_id,
+                "requirement_id": {"$in": [requirement["id"] for requirement in batch]},
+                "$or": [{"test_cases": {"$exists": True}}, {"scenarios": {"$exists": True}}]
+            }},
+            {"$sort": {"requirement_id": 1, "timestamp": -1, "_id": -1}},
+            {"$group": {"_id": "$requirement_id", "item": {"$first": "$$ROOT"}}}
+        ])
+        found = {item["_id"]: item["item"] for item in items}
+        for requirement in batch:
+            if requirement["id"] in found:
+                yield requirement, found[requirement["id"]]
+
+    batch = []
+    for requirement in requirements:
+        batch.append(requirement)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield from latest(batch)
+            batch = []
+    if batch:
+        yield from latest(batch)
+
+@app.route("/projects/<project_id>/export", methods=["GET"])
+@login_required
+@limiter.limit("10 per minute")
+def export_project(project_id):
+    """Download the latest test cases of every requirement as XLSX, DOCX or PDF.
+
+    Requirements are read in batches and the file goes out with chunked
+    transfer encoding (see exports.py). Only DOCX is sent while it is
+    written; XLSX rows go to a temporary file and PDF pages are kept
+    compressed, and both are sent once the whole file is built, so a large
+    XLSX or PDF export sends nothing until then.
+    """
+    export_format = request.args.get("format", "xlsx").lower()
+    if export_format not in EXPORT_CONTENT_TYPES:
+        return jsonify({"error": "Unsupported format. Use xlsx, docx or pdf."}), 400
+
+    username = session["user"]
+    if not get_project_access(username, project_id):
+        return jsonify({"error": "Project not found or access denied"}), 404
+
+    project = projects_collection.find_one({"id": project_id}, {"_id": 0, "name": 1}) or {}
+    name = secure_filename(project.get("name") or "") or "project"
+    print(f"Exporting test cases of project {project_id} as {export_format}")
+    return Response(
+        iter_export(export_format, project, iter_latest_test_cases(project_id)),
+        content_type=EXPORT_CONTENT_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}-test-cases.{export_format}"',
+            "Cache-Control": "no-cache"
+        }
+    )
+
 @app.route("/requirements/<requirement_id>", methods=["DELETE"])
 @login_required
 def delete_requirement(requirement_id):
     username = session["user"]
     
-    requirement = requirements_collection.find_one({"id": requirement_id})
+    requirement, role = find_requirement_for_user(requirement_id, username)
     if not requirement:
         return jsonify({"error": "Requirement not found"}), 404
     
-    project = projects_collection.find_one({
-        "id": requirement["project_id"],
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not role:
         return jsonify({"error": "Access denied"}), 403
     
     requirements_collection.delete_one({"id": requirement_id})
     return jsonify({"message": "Requirement deleted successfully"})
 
+def test_cases_update(existing_item, test_cases, fields):
+    """Update document that writes ``test_cases`` over a history item.
+
+    Only the scenarios that changed are sent when the layout is the same.
+    """
+    changes, removed = test_case_changes(existing_item, test_cases)
+    update = {"$set": {**changes, **fields}}
+    if removed:
+        update["$unset"] = removed
+    return update
+
+def record_test_cases_version(item, test_cases, username, update_type):
+    """Record ``test_cases`` as the next version of history ``item``.
+
+    Returns the version number, or None if it couldn't be recorded; the
+    history item itself is still updated in that case.
+    """
+    try:
+        return versions.record_version(
+            item["_id"],
+            test_cases,
+            previous_text=render_test_cases(item),
+            previous_metadata={
+                "user": item.get("user"),
+                "update_type": item.get("update_type", "generated"),
+                "timestamp": item.get("timestamp")
+            },
+            user=username,
+            update_type=update_type
+        )
+    except Exception as e:
+        print(f"Error recording test case version: {str(e)}")
+        return None
+
+def load_scenarios(item):
+    """Scenarios of a history item, structuring older plain-text items once."""
+    if item.get("scenarios"):
+        return item["scenarios"]
+    fields = test_case_fields(item.get("test_cases", ""))
+    if "scenarios" not in fields:
+        return []
+    # Only convert if the text hasn't been rewritten in the meantime
+    history_collection.update_one(
+        {"_id": item["_id"], "test_cases": item.get("test_cases", "")},
+        {"$set": fields, "$unset": {"test_cases": ""}}
+    )
+    item.update(fields)
+    item.pop("test_cases", None)
+    return item["scenarios"]
+
 @app.route("/save_test_cases", methods=["POST"])
 @login_required
 def save_test_cases():
@@ -861,30 +1588,76 @@ def save_test_cases():
     # Create a timestamp for the current update
     current_time = datetime.now(timezone.utc)
     
-    # Prepare the history data
-    history_data = {
-        "user": username,
-        "test_cases": test_cases,
-        "timestamp": current_time,
-        "requirements": requirements,
-        "context": "",
-        "project_id": project_id,
-        "update_type": "manual_edit"  # Add a field to track update type
-    }
-    
+    # Saves for a requirement become a new version of its latest history item
+    existing_item = None
     if requirement_id:
-        history_data["requirement_id"] = requirement_id
-    if requirement_title:
-        history_data["requirement_title"] = requirement_title
+        existing_item = history_collection.find_one(
+            {
+                "user": username,
+                "project_id": project_id,
+                "requirement_id": requirement_id,
+                "$or": [{"test_cases": {"$exists": True}}, {"scenarios": {"$exists": True}}]
+            },
+            sort=[("timestamp", -1)]
+        )
     
-    # Insert the new history entry
-    history_collection.insert_one(history_data)
+    if existing_item:
+        update_data = {
+            "timestamp": current_time,
+            "requirements": requirements,
+            "update_type": "manual_edit"
+        }
+        if requirement_title:
+            update_data["requirement_title"] = requirement_title
+        version = record_test_cases_version(existing_item, test_cases, username, "manual_edit")
+        if version:
+            update_data["version_number"] = version
+        history_collection.update_one(
+            {"_id": existing_item["_id"]},
+            test_cases_update(existing_item, test_cases, update_data)
+        )
+        history_id = existing_item["_id"]
+    else:
+        # Prepare the history data
+        history_data = {
+            "user": username,
+            **test_case_fields(test_cases),
+            "timestamp": current_time,
+            "requirements": requirements,
+            "context": "",
+            "project_id": project_id,
+            "update_type": "manual_edit"  # Add a field to track update type
+        }
+        
+        if requirement_id:
+            history_data["requirement_id"] = requirement_id
+        if requirement_title:
+            history_data["requirement_title"] = requirement_title
+        
+        # Insert the new history entry
+        history_id = history_collection.insert_one(history_data).inserted_id
     
     return jsonify({
         "message": "Test cases saved successfully",
+        "_id": str(history_id),
         "timestamp": current_time.isoformat()
     })
 
+@app.route("/generation_cache/stats", methods=["GET"])
+@admin_required
+def get_generation_cache_stats():
+    return jsonify(generation_cache.stats())
+
+@app.route("/generation_usage/stats", methods=["GET"])
+@admin_required
+def get_generation_usage_stats():
+    return jsonify(generation_usage.stats())
+
+@app.route("/extraction_cache/stats", methods=["GET"])
+@admin_required
+def get_extraction_cache_stats():
+    return jsonify(extraction_cache.stats())
+
 @app.route("/test", methods=["GET"])
 def test_endpoint():
     return jsonify({"message": "API is working!"})
@@ -907,6 +1680,7 @@ def generate_test_cases_endpoint():
         project_id = data.get("project_id", "")
         requirement_id = data.get("requirement_id", "")
         requirement_title = data.get("requirement_title", "")
+        bypass_cache = bool(data.get("bypass_cache", False))
         
         if not requirements:
             return jsonify({"error": "No requirements provided"}), 400
@@ -917,45 +1691,65 @@ def generate_test_cases_endpoint():
         print(f"Project ID: {project_id}")
         print(f"Requirements: {requirements[:50]}...")  # Print first 50 chars
         
-        try:
-            # Check if API key is valid before proceeding
-            api_key = get_user_api_key(username, project_id)
-            print(f"API Key available: {bool(api_key)}")
-            if not api_key:
-                return jsonify({"error": "No API key configured. Please add an API key in settings."}), 400
-            
-            # Try creating a client with this key
-            anthropic_client = anthropic.Anthropic(api_key=api_key)
+        def save_history(full_response):
+            history_data = {
+                "user": username,
+                **test_case_fields(full_response),
+                "timestamp": datetime.now(timezone.utc),
+                "requirements": requirements,
+                "context": context,
+                "project_id": project_id
+            }
             
-            # Generate the test case prompt
-            test_case_instruction = generate_test_case_prompt(requirements, format_type, context, example_case)
+            if requirement_id:
+                history_data["requirement_id"] = requirement_id
+            if requirement_title:
+                history_data["requirement_title"] = requirement_title
+                
+            history_collection.insert_one(history_data)
+        
+        # Generate the test case prompt
+        test_case_prompt = generate_test_case_prompt(requirements, format_type, context, example_case,
+                                                     lang=project_language(username, project_id))
+        cache_key = generation_cache_key(*test_case_prompt)
+        
+        # Cached generations are shared between users, so check the key first:
+        # they are only served to users who could have paid for them
+        api_key = get_user_api_key(username, project_id)
+        print(f"API Key available: {bool(api_key)}")
+        if not api_key:
+            return jsonify({"error": "No API key configured. Please add an API key in settings."}), 400
+        
+        cached_response = None if bypass_cache else generation_cache.get(cache_key)
+        if cached_response is not None:
+            save_history(cached_response)
+            return jsonify({
+                "test_cases": cached_response,
+                "cached": True,
+                "message": "Test cases generated successfully"
+            })
+        
+        try:
+            # Reuse the pooled client for this key
+            anthropic_client = get_client_for_api_key(api_key)
             
             # Make the API call
             try:
+                started = time.perf_counter()
                 response = anthropic_client.messages.create(
-                    model="claude-3-haiku-20240307",
+                    model=CLAUDE_MODEL,
                     max_tokens=4000,
-                    messages=[{"role": "user", "content": test_case_instruction}]
+                    **test_case_request(test_case_prompt)
                 )
+                generation_usage.record("test_cases", response.usage, seconds=time.perf_counter() - started)
                 
                 full_response = response.content[0].text
                 
-                # Save to history
-                history_data = {
-                    "user": username,
-                    "test_cases": full_response,
-                    "timestamp": datetime.now(timezone.utc),
-                    "requirements": requirements,
-                    "context": context,
-                    "project_id": project_id
-                }
+                if response.stop_reason == "end_turn":
+                    generation_cache.set(cache_key, full_response)
                 
-                if requirement_id:
-                    history_data["requirement_id"] = requirement_id
-                if requirement_title:
-                    history_data["requirement_title"] = requirement_title
-                    
-                history_collection.insert_one(history_data)
+                # Save to history
+                save_history(full_response)
                 
                 return jsonify({
                     "test_cases": full_response,
@@ -993,42 +1787,40 @@ def generate_test_cases_stream():
     context = data.get("context", "")
     example_case = data.get("example_case", "")
     project_id = data.get("project_id", "")
+    bypass_cache = bool(data.get("bypass_cache", False))
     
     if not requirements:
         return jsonify({"error": "No requirements provided"}), 400
     
-    test_case_instruction = generate_test_case_prompt(requirements, format_type, context, example_case)
     username = session["user"]
+    test_case_prompt = generate_test_case_prompt(requirements, format_type, context, example_case,
+                                                 lang=project_language(username, project_id))
     
-    def generate():
-        try:
-            full_response = ""
-            anthropic_client = get_anthropic_client(username, project_id)
-            
-            with anthropic_client.messages.stream(
-                model="claude-3-haiku-20240307",
-                max_tokens=4000,
-                messages=[{"role": "user", "content": test_case_instruction}]
-            ) as stream:
-                for event in stream:
-                    if event.type == "content_block_delta":
-                        if event.delta.text:
-                            full_response += event.delta.text
-                            yield f"data: {json.dumps({'chunk': event.delta.text})}\n\n"
-                    elif event.type == "message_stop":
-                        history_collection.insert_one({
-                            "user": username,
-                            "test_cases": full_response,
-                            "timestamp": datetime.now(timezone.utc),
-                            "requirements": requirements,
-                            "context": context,
-                            "project_id": project_id
-                        })
-                        yield "data: [DONE]\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-    
-    return Response(generate(), content_type="text/event-stream")
+    def save_history(full_response, interrupted=False):
+        history_data = {
+            "user": username,
+            **test_case_fields(full_response),
+            "timestamp": datetime.now(timezone.utc),
+            "requirements": requirements,
+            "context": context,
+            "project_id": project_id
+        }
+        if interrupted:
+            history_data["interrupted"] = True
+        history_collection.insert_one(history_data)
+    
+    request_args = test_case_request(test_case_prompt)
+    job = GenerationJob(
+        get_user_api_key(username, project_id),
+        request_args["messages"],
+        system=request_args["system"],
+        usage_kind="test_cases",
+        on_complete=save_history,
+        on_checkpoint=lambda partial: save_history(partial, interrupted=True),
+        cache_key=generation_cache_key(*test_case_prompt),
+        bypass_cache=bypass_cache
+    )
+    return generation_response(job)
 
 @app.route("/generate_test_cases_for_requirement", methods=["POST"])
 @login_required
@@ -1038,60 +1830,363 @@ def generate_test_cases_for_requirement():
     requirement_id = data.get("requirement_id")
     format_type = data.get("format_type", "default")
     example_case = data.get("example_case", "")
+    bypass_cache = bool(data.get("bypass_cache", False))
     
     username = session["user"]
     
-    requirement = requirements_collection.find_one({"id": requirement_id})
+    requirement, role = find_requirement_for_user(requirement_id, username)
     if not requirement:
         return jsonify({"error": "Requirement not found"}), 404
     
-    project = projects_collection.find_one({
-        "id": requirement["project_id"],
-        "$or": [
-            {"user": username},
-            {"collaborators": username}
-        ]
-    })
-    
-    if not project:
+    if not role:
         return jsonify({"error": "Access denied"}), 403
     
-    test_case_instruction = generate_test_case_prompt(
+    test_case_prompt = generate_test_case_prompt(
         requirement["description"], 
         format_type, 
         requirement["title"], 
-        example_case
+        example_case,
+        lang=requirement_language(requirement)
     )
     
+    def save_history(full_response, interrupted=False):
+        history_data = {
+            "user": username,
+            **test_case_fields(full_response),
+            "timestamp": datetime.now(timezone.utc),
+            "requirement_id": requirement_id,
+            "requirement_title": requirement["title"],
+            "project_id": requirement["project_id"]
+        }
+        if interrupted:
+            history_data["interrupted"] = True
+        history_collection.insert_one(history_data)
+    
+    request_args = test_case_request(test_case_prompt)
+    job = GenerationJob(
+        get_user_api_key(username, requirement["project_id"]),
+        request_args["messages"],
+        system=request_args["system"],
+        usage_kind="test_cases",
+        on_complete=save_history,
+        on_checkpoint=lambda partial: save_history(partial, interrupted=True),
+        cache_key=generation_cache_key(*test_case_prompt),
+        bypass_cache=bypass_cache
+    )
+    return generation_response(job)
+
+BATCH_GENERATION_MAX_CONCURRENCY = int(os.getenv("BATCH_GENERATION_MAX_CONCURRENCY", 8))
+BATCH_HISTORY_WRITE_SIZE = 50
+
+def stream_batch_generation(username, anthropic_client, requirements, format_type="default",
+                            example_case="", max_concurrency=4, bypass_cache=False, merge=False):
+    """Generate test cases for many requirements concurrently as one SSE feed.
+
+    Every chunk is tagged with its requirement ID, a progress event follows
+    each finished requirement, and history entries are written in bulk. With
+    ``merge``, a final ``merged`` event carries every output under its
+    requirement title, in the order of ``requirements``.
+    """
+    events = queue.Queue()
+    cancelled = threading.Event()
+    
+    def run(requirement):
+        requirement_id = requirement["id"]
+        try:
+            test_case_prompt = generate_test_case_prompt(
+                requirement.get("description", ""),
+                format_type,
+                requirement.get("title", ""),
+                example_case,
+                lang=requirement_language(requirement)
+            )
+            cache_key = generation_cache_key(*test_case_prompt)
+            full_response = None if bypass_cache else generation_cache.get(cache_key)
+            
+            if full_response is not None:
+                events.put(("frame", requirement_id, sse_event({'requirement_id': requirement_id, 'chunk': full_response})))
+            else:
+                writer = DeltaCoalescer(tags={'requirement_id': requirement_id})
+                started = time.perf_counter()
+                first_token_seconds = None
+                with anthropic_client.messages.stream(
+                    model=CLAUDE_MODEL,
+                    max_tokens=4000,
+                    **test_case_request(test_case_prompt)
+                ) as stream:
+                    for event in stream:
+                        if cancelled.is_set():
+                            return
+                        if event.type == "content_block_delta":
+                            text = getattr(event.delta, "text", None)
+                            if text:
+                                if first_token_seconds is None:
+                                    first_token_seconds = time.perf_counter() - started
+                                frame = writer.add(text)
+                                if frame:
+                                    events.put(("frame", requirement_id, frame))
+                    message = stream.get_final_message()
+                generation_usage.record("batch_test_cases", message.usage, first_token_seconds,
+                                        time.perf_counter() - started)
+                frame = writer.flush()
+                if frame:
+                    events.put(("frame", requirement_id, frame))
+                full_response = writer.text()
+                if message.stop_reason == "end_turn":
+                    generation_cache.set(cache_key, full_response)
+            
+            events.put(("done", requirement_id, {
+                "user": username,
+                **test_case_fields(full_response),
+                "timestamp": datetime.now(timezone.utc),
+                "requirement_id": requirement_id,
+                "requirement_title": requirement.get("title", ""),
+                "project_id": requirement["project_id"]
+            }))
+        except Exception as e:
+            events.put(("error", requirement_id, str(e)))
+    
     def generate():
+        total = len(requirements)
+        completed = 0
+        failed = 0
+        pending_history = []
+        outputs = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, total or 1)))
         try:
-            full_response = ""
-            anthropic_client = get_anthropic_client(username, requirement["project_id"])
+            for requirement in requirements:
+                executor.submit(run, requirement)
             
-            with anthropic_client.messages.stream(
-                model="claude-3-haiku-20240307",
-                max_tokens=4000,
-                messages=[{"role": "user", "content": test_case_instruction}]
-            ) as stream:
-                for event in stream:
-                    if event.type == "content_block_delta":
-                        if event.delta.text:
-                            full_response += event.delta.text
-                            yield f"data: {json.dumps({'chunk': event.delta.text})}\n\n"
-                    elif event.type == "message_stop":
-                        history_collection.insert_one({
-                            "user": username,
-                            "test_cases": full_response,
-                            "timestamp": datetime.now(timezone.utc),
-                            "requirement_id": requirement_id,
-                            "requirement_title": requirement["title"],
-                            "project_id": requirement["project_id"]
-                        })
-                        yield "data: [DONE]\n\n"
+            yield f"data: {json.dumps({'progress': {'completed': 0, 'failed': 0, 'total': total}})}\n\n"
+            
+            while completed < total:
+                kind, requirement_id, payload = events.get()
+                if kind == "frame":
+                    yield payload
+                    continue
+                
+                completed += 1
+                if kind == "done":
+                    pending_history.append(payload)
+                    if merge:
+                        outputs[requirement_id] = render_test_cases(payload)
+                    yield f"data: {json.dumps({'requirement_id': requirement_id, 'done': True})}\n\n"
+                else:
+                    failed += 1
+                    yield f"data: {json.dumps({'requirement_id': requirement_id, 'error': payload})}\n\n"
+                
+                if len(pending_history) >= BATCH_HISTORY_WRITE_SIZE:
+                    history_collection.insert_many(pending_history, ordered=False)
+                    pending_history = []
+                
+                yield f"data: {json.dumps({'progress': {'completed': completed, 'failed': failed, 'total': total}})}\n\n"
+            
+            if pending_history:
+                history_collection.insert_many(pending_history, ordered=False)
+                pending_history = []
+            if merge:
+                merged = "\n\n".join(
+                    f"## {requirement.get('title', '')}\n\n{outputs[requirement['id']].strip()}"
+                    for requirement in requirements
+                    if requirement["id"] in outputs
+                )
+                yield sse_event({'merged': merged})
+            yield "data: [DONE]\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Stop the workers if the client went away before the batch finished
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            if pending_history:
+                try:
+                    history_collection.insert_many(pending_history, ordered=False)
+                except Exception as history_error:
+                    print(f"Error saving batch history: {history_error}")
+    
+    return generate()
+
+@app.route("/projects/<project_id>/generate_all", methods=["POST"])
+@login_required
+@limiter.limit("2 per minute")
+def generate_all_test_cases(project_id):
+    data = request.json or {}
+    format_type = data.get("format_type", "default")
+    example_case = data.get("example_case", "")
+    requirement_ids = data.get("requirement_ids")
+    bypass_cache = bool(data.get("bypass_cache", False))
+    
+    try:
+        max_concurrency = int(data.get("max_concurrency", 4))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_concurrency must be an integer"}), 400
+    max_concurrency = max(1, min(max_concurrency, BATCH_GENERATION_MAX_CONCURRENCY))
+    
+    if requirement_ids is not None and (
+        not isinstance(requirement_ids, list) or not all(isinstance(i, str) for i in requirement_ids)
+    ):
+        return jsonify({"error": "requirement_ids must be a list of requirement IDs"}), 400
+    
+    username = session["user"]
+    
+    if not get_project_access(username, project_id):
+        return jsonify({"error": "Project not found or access denied"}), 404
+    
+    query = {"project_id": project_id}
+    if requirement_ids:
+        query["id"] = {"$in": requirement_ids}
+    
+    requirements = list(requirements_collection.find(
+        query,
+        {"_id": 0, "id": 1, "title": 1, "description": 1, "project_id": 1, "language": 1}
+    ))
+    
+    if not requirements:
+        return jsonify({"error": "No requirements found for this project"}), 404
+    
+    api_key = get_user_api_key(username, project_id)
+    if not api_key:
+        return jsonify({"error": "No API key configured. Please add an API key in settings."}), 400
+    
+    return Response(
+        stream_batch_generation(
+            username,
+            get_client_for_api_key(api_key),
+            requirements,
+            format_type,
+            example_case,
+            max_concurrency,
+            bypass_cache
+        ),
+        content_type="text/event-stream",
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive'
+        }
+    )
+
+PIPELINE_MAX_SEGMENTS = int(os.getenv("PIPELINE_MAX_SEGMENTS", 200))
+REQUIREMENT_INSERT_BATCH_SIZE = 500
+
+def insert_requirements(requirements):
+    """Bulk-insert requirement documents, in order, in batches."""
+    for i in range(0, len(requirements), REQUIREMENT_INSERT_BATCH_SIZE):
+        requirements_collection.insert_many(requirements[i:i + REQUIREMENT_INSERT_BATCH_SIZE])
+
+@app.route("/projects/<project_id>/pipeline", methods=["POST"])
+@login_required
+@limiter.limit("2 per minute")
+def run_requirements_pipeline(project_id):
+    """Split a specification into requirements and generate test cases for each.
+    
+    Takes either an uploaded ``file`` (PDF, DOCX or TXT, with optional
+    ``pages``) or a ``text`` field. The segments are saved as draft
+    requirements of the project. With ``generate`` (the default) the
+    response is the batch generation SSE feed, preceded by a
+    ``requirements`` event and ended by a ``merged`` event; otherwise the
+    created requirements are returned as JSON.
+    """
+    data = request.form if request.files else (request.json or {})
+    username = session["user"]
     
-    return Response(generate(), content_type="text/event-stream")
+    if not get_project_access(username, project_id):
+        return jsonify({"error": "Project not found or access denied"}), 404
+    
+    format_type = data.get("format_type", "default")
+    example_case = data.get("example_case", "")
+    generate = str(data.get("generate", "true")).lower() not in ("0", "false", "no")
+    bypass_cache = str(data.get("bypass_cache", "false")).lower() in ("1", "true", "yes")
+    try:
+        max_concurrency = int(data.get("max_concurrency", 4))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_concurrency must be an integer"}), 400
+    max_concurrency = max(1, min(max_concurrency, BATCH_GENERATION_MAX_CONCURRENCY))
+    
+    source = ""
+    if "file" in request.files:
+        file = request.files["file"]
+        kind = document_kind(file.filename)
+        if kind is None:
+            return jsonify({"error": "Unsupported file format. Please upload PDF, DOCX, or TXT files."}), 400
+        source = file.filename
+        try:
+            ranges = parse_page_range(data.get("pages"))
+            upload, sha256 = spool_upload(file)
+            try:
+                cache_key = extraction_cache_key(kind, sha256, ranges)
+                pieces = cached_pieces(cache_key)
+                text = join_pieces(kind, pieces) if pieces is not None else extract_document(kind, upload, ranges, cache_key)
+            finally:
+                upload.close()
+        except ExtractionError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        text = data.get("text", "")
+    
+    segments = segment_requirements(text)
+    if not segments:
+        return jsonify({"error": "No requirements found in the document"}), 400
+    if len(segments) > PIPELINE_MAX_SEGMENTS:
+        return jsonify({
+            "error": f"The document splits into {len(segments)} requirements; the limit is {PIPELINE_MAX_SEGMENTS}. "
+                     "Select fewer pages."
+        }), 400
+    
+    api_key = None
+    if generate:
+        api_key = get_user_api_key(username, project_id)
+        if not api_key:
+            return jsonify({"error": "No API key configured. Please add an API key in settings."}), 400
+    
+    now = datetime.now(timezone.utc).isoformat()
+    requirements = []
+    for index, segment in enumerate(segments):
+        requirements.append({
+            "id": str(uuid.uuid4()),
+            "user": username,
+            "project_id": project_id,
+            "title": segment["title"],
+            "description": segment["description"],
+            "section": segment["section"],
+            "language": detect_language(segment["title"], segment["description"]),
+            "category": "functionality",
+            "priority": detect_priority(segment["description"]),
+            "status": "draft",
+            "source": source,
+            "source_index": index,
+            "created_at": now,
+            "updated_at": now,
+            "priority_auto_generated": True
+        })
+    insert_requirements(requirements)
+    for requirement in requirements:
+        requirement["_id"] = str(requirement["_id"])
+    print(f"Pipeline: {len(requirements)} requirements created in project {project_id} from {source or 'text'}")
+    
+    if not generate:
+        return jsonify({"message": f"{len(requirements)} requirements created", "requirements": requirements})
+    
+    def stream():
+        yield sse_event({"requirements": [{"id": r["id"], "title": r["title"]} for r in requirements]})
+        yield from stream_batch_generation(
+            username,
+            get_client_for_api_key(api_key),
+            requirements,
+            format_type,
+            example_case,
+            max_concurrency,
+            bypass_cache,
+            merge=True
+        )
+    
+    return Response(
+        stream(),
+        content_type="text/event-stream",
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive'
+        }
+    )
 
 # Modified chat_with_assistant route from app.py for more reliable test case updating
 @app.route("/chat_with_assistant", methods=["POST"])
@@ -1148,7 +2243,7 @@ def chat_with_assistant():
     
     # Create a more direct instruction for the AI to modify test cases
     if direct_mode:
-        context_parts = [
+        instructions = [
             "You are a test case assistant. Your primary job is to directly modify test cases based on user requests.",
             "IMPORTANT: When the user asks for changes, you MUST output the COMPLETE updated test cases in a code block.",
             "Always add ```<language> before and ``` after the code block.",
@@ -1157,11 +2252,15 @@ def chat_with_assistant():
             "DO NOT explain what changes you're making beforehand - show the complete updated test cases immediately."
         ]
     else:
-        context_parts = [
+        instructions = [
             "You are a test case assistant helping to improve test cases.",
             "When suggesting changes, explain your reasoning clearly."
         ]
     
+    # The prompt goes from the most to the least stable part, with a cache
+    # breakpoint after the instructions, the project and requirement, and the
+    # current test cases, so follow-up messages reuse the cached prefix
+    subject_parts = []
     if project_id:
         project = projects_collection.find_one({
             "id": project_id,
@@ -1172,15 +2271,22 @@ def chat_with_assistant():
         })
         
         if project:
-            context_parts.append(f"Project Context: {project.get('name', '')} - {project.get('context', '')}")
+            subject_parts.append(f"Project Context: {project.get('name', '')} - {project.get('context', '')}")
     
     if requirement_id:
         requirement = requirements_collection.find_one({"id": requirement_id})
         if requirement:
-            context_parts.append(f"Requirement: {requirement.get('title', '')}\n{requirement.get('description', '')}")
+            subject_parts.append(f"Requirement: {requirement.get('title', '')}\n{requirement.get('description', '')}")
+    
+    # Earlier turns come from the server-side conversation; the client's
+    # chat_history only seeds it the first time
+    conversation = conversations.load(
+        username,
+        conversations.conversation_key(active_history_id, project_id, requirement_id),
+        seed=chat_history
+    )
     
-    context_parts.append(f"Current test cases:\n```\n{test_cases}\n```")
-    context_parts.append(f"User request: {user_message}")
+    request_parts = [f"User request: {user_message}"]
     
     # Detect if the user is asking for modifications
     modification_keywords = ["update", "change", "modify", "edit", "replace", "fix", "correct", "add", "remove", "delete", "ajouter", "modifier", "changer", "supprimer", "corriger"]
@@ -1188,157 +2294,167 @@ def chat_with_assistant():
     
     # Add more direct instructions for modification requests
     if is_modification_request and direct_mode:
-        context_parts.append("This is a modification request. You MUST return the COMPLETE updated test cases in a code block.")
+        request_parts.append("This is a modification request. You MUST return the COMPLETE updated test cases in a code block.")
         # Enhanced instruction for more direct responses
-        context_parts.append("IMPORTANT: Respond ONLY with:\n1. The COMPLETE updated test cases in a code block\n2. Exactly: 'Modifications appliquées.'")
-    
-    context = "\n\n".join(context_parts)
-    
-    def generate():
-        try:
-            # First, try to initialize the Anthropic client
-            try:
-                anthropic_client = get_anthropic_client(username, project_id)
-            except Exception as client_error:
-                error_msg = f"Error initializing AI client: {str(client_error)}"
-                print(f"ERROR: {error_msg}")
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-                yield "data: [DONE]\n\n"
-                return
-                
-            full_response = ""
-            print("Starting AI stream processing...")
+        request_parts.append("IMPORTANT: Respond ONLY with:\n1. The COMPLETE updated test cases in a code block\n2. Exactly: 'Modifications appliquées.'")
+    
+    system = prompt_cache_blocks("\n\n".join(instructions), "\n\n".join(subject_parts))
+    messages = conversations.prompt_messages(conversation)
+    if messages:
+        # The next request repeats these turns, so they end a breakpoint too
+        messages[-1]["content"] = prompt_cache_blocks(messages[-1]["content"])
+    content = prompt_cache_blocks(f"Current test cases:\n```\n{test_cases}\n```")
+    content.append({"type": "text", "text": "\n\n".join(request_parts)})
+    messages.append({"role": "user", "content": content})
+    
+    def save_updated_test_cases(updated_test_cases):
+        """Save the code block from the response as soon as it has streamed in."""
+        nonlocal conversation
+        payloads = []
+        
+        # If we found updated test cases and they're different from the original
+        if updated_test_cases and updated_test_cases != test_cases:
+            print("Found updated test cases in AI response")
+            
+            # Prepare common update data
+            update_data = {
+                "timestamp": datetime.now(timezone.utc),
+                "update_type": "ai_assistant",
+                "source_message": user_message
+            }
             
             try:
-                # Stream processing
-                messages = [{"role": "user", "content": context}]
+                # If active_history_id is provided, try to update that entry
+                if active_history_id:
+                    try:
+                        # Update existing history entry, rewriting only the scenarios that changed
+                        existing_item = history_collection.find_one({"_id": ObjectId(active_history_id)})
+                        if not existing_item:
+                            raise ValueError("History item not found")
+                        version = record_test_cases_version(existing_item, updated_test_cases, username, "ai_assistant")
+                        if version:
+                            update_data["version_number"] = version
+                        history_collection.update_one(
+                            {"_id": existing_item["_id"]},
+                            test_cases_update(existing_item, updated_test_cases, update_data)
+                        )
+                        print(f"Updated existing history item: {active_history_id}")
+                        history_id = active_history_id
+                    except Exception as e:
+                        print(f"Update failed, creating new entry instead: {str(e)}")
+                        # Fallback to creating a new entry
+                        update_data.update({
+                            **test_case_fields(updated_test_cases),
+                            "user": username,
+                            "requirements": requirements,
+                            "context": "",
+                            "project_id": project_id,
+                            "requirement_id": requirement_id,
+                            "requirement_title": requirement_title
+                        })
+                        history_id = history_collection.insert_one(update_data).inserted_id
+                        conversation = conversations.attach(conversation, str(history_id))
+                else:
+                    # Create new history entry if no active_history_id
+                    update_data.update({
+                        **test_case_fields(updated_test_cases),
+                        "user": username,
+                        "requirements": requirements,
+                        "context": "",
+                        "project_id": project_id,
+                        "requirement_id": requirement_id,
+                        "requirement_title": requirement_title
+                    })
+                    history_id = history_collection.insert_one(update_data).inserted_id
+                    conversation = conversations.attach(conversation, str(history_id))
                 
-                with anthropic_client.messages.stream(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=4000,
-                    messages=messages
-                ) as stream:
-                    for event in stream:
-                        if event.type == "content_block_delta":
-                            if event.delta.text:
-                                full_response += event.delta.text
-                                yield f"data: {json.dumps({'chunk': event.delta.text})}\n\n"
+                # Send updated test cases and confirmation to the client, with
+                # the history item to send as active_history_id from now on,
+                # which the conversation is kept under
+                payloads.append({
+                    'updated_test_cases': updated_test_cases,
+                    'confirmation': 'Modifications appliquées.',
+                    'history_id': str(history_id)
+                })
                 
-                print("AI stream completed successfully")
-            except Exception as stream_error:
-                error_msg = f"Error during AI streaming: {str(stream_error)}"
+                print("Saved updated test cases to history")
+            except Exception as db_error:
+                error_msg = f"Error saving test cases to database: {str(db_error)}"
                 print(f"ERROR: {error_msg}")
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-                yield "data: [DONE]\n\n"
-                return
-            
-            # Extract test cases from response if present
-            updated_test_cases = None
-            code_block_match = re.search(r'```(?:.*?)\n([\s\S]*?)```', full_response)
-            if code_block_match:
-                updated_test_cases = code_block_match.group(1).strip()
-                
-                # If we found updated test cases and they're different from the original
-                if updated_test_cases and updated_test_cases != test_cases:
-                    print("Found updated test cases in AI response")
-                    
-                    # Prepare common update data
-                    update_data = {
-                        "test_cases": updated_test_cases,
-                        "timestamp": datetime.now(timezone.utc),
-                        "update_type": "ai_assistant",
-                        "source_message": user_message
-                    }
-                    
-                    try:
-                        # If active_history_id is provided, try to update that entry
-                        if active_history_id:
-                            try:
-                                # Update existing history entry
-                                history_collection.update_one(
-                                    {"_id": ObjectId(active_history_id)},
-                                    {"$set": update_data}
-                                )
-                                print(f"Updated existing history item: {active_history_id}")
-                            except Exception as e:
-                                print(f"Update failed, creating new entry instead: {str(e)}")
-                                # Fallback to creating a new entry
-                                update_data.update({
-                                    "user": username,
-                                    "requirements": requirements,
-                                    "context": "",
-                                    "project_id": project_id,
-                                    "requirement_id": requirement_id,
-                                    "requirement_title": requirement_title
-                                })
-                                history_collection.insert_one(update_data)
-                        else:
-                            # Create new history entry if no active_history_id
-                            update_data.update({
-                                "user": username,
-                                "requirements": requirements,
-                                "context": "",
-                                "project_id": project_id,
-                                "requirement_id": requirement_id,
-                                "requirement_title": requirement_title
-                            })
-                            history_collection.insert_one(update_data)
-                        
-                        # Send updated test cases and confirmation to the client
-                        yield f"data: {json.dumps({
-                            'updated_test_cases': updated_test_cases,
-                            'confirmation': 'Modifications appliquées.'
-                        })}\n\n"
-                        
-                        print("Saved updated test cases to history")
-                    except Exception as db_error:
-                        error_msg = f"Error saving test cases to database: {str(db_error)}"
-                        print(f"ERROR: {error_msg}")
-                        # Still send the updated test cases to the client even if DB save fails
-                        yield f"data: {json.dumps({
-                            'updated_test_cases': updated_test_cases,
-                            'confirmation': 'Modifications appliquées, mais erreur de sauvegarde.'
-                        })}\n\n"
-            
-            try:
-                # Save the chat interaction to history
-                history_collection.insert_one({
-                    "user": username,
-                    "type": "ai_chat",
-                    "message": user_message,
-                    "response": full_response,
-                    "timestamp": datetime.now(timezone.utc),
-                    "project_id": project_id,
-                    "requirement_id": requirement_id
+                # Still send the updated test cases to the client even if DB save fails
+                payloads.append({
+                    'updated_test_cases': updated_test_cases,
+                    'confirmation': 'Modifications appliquées, mais erreur de sauvegarde.'
                 })
-            except Exception as history_error:
-                print(f"Error saving chat history: {str(history_error)}")
-                # This is not critical, so we continue without sending an error to the client
-            
-            yield "data: [DONE]\n\n"
-            
-        except Exception as e:
-            print(f"Unexpected error in chat assistant: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-            yield "data: [DONE]\n\n"
+        
+        return payloads
+    
+    def save_chat(full_response):
+        if job.stopped_early:
+            # The stream was closed once the code block was in, before the
+            # closing line the model was asked to write
+            full_response = f"{full_response.rstrip()}\n\nModifications appliquées."
+        
+        try:
+            # Save the chat interaction to history
+            history_collection.insert_one({
+                "user": username,
+                "type": "ai_chat",
+                "message": user_message,
+                "response": full_response,
+                "timestamp": datetime.now(timezone.utc),
+                "project_id": project_id,
+                "requirement_id": requirement_id
+            })
+        except Exception as history_error:
+            print(f"Error saving chat history: {str(history_error)}")
+            # This is not critical, so we continue without sending an error to the client
+        
+        try:
+            conversations.append_exchange(conversation, user_message, full_response)
+        except Exception as conversation_error:
+            print(f"Error saving conversation: {str(conversation_error)}")
+    
+    job = GenerationJob(
+        api_key,
+        messages,
+        system=system,
+        usage_kind="chat",
+        on_complete=save_chat,
+        on_code_block=save_updated_test_cases,
+        # Direct modifications end with a fixed confirmation line, so stop reading there
+        stop_after_code_block=direct_mode and is_modification_request,
+        error_prefix="Error during AI streaming: ",
+        done_on_error=True
+    )
     
     # Ensure appropriate CORS headers for streaming responses
-    response = Response(generate(), content_type="text/event-stream", headers={
+    return generation_response(job, headers={
         'Cache-Control': 'no-cache',
         'Connection': 'keep-alive'
     })
-    
-    return response
+HISTORY_PAGE_MAX = 100
+HISTORY_PREVIEW_CHARS = 200
+
+def encode_history_cursor(item):
+    """Opaque cursor pointing just after ``item`` in (timestamp, _id) order."""
+    position = json.dumps([item["timestamp"].isoformat(), str(item["_id"])])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_history_cursor(cursor):
+    timestamp, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(timestamp), ObjectId(object_id)
+
 @app.route("/history", methods=["GET"])
 @login_required
 @limiter.exempt
 def get_history():
     try:
         username = session["user"]
-        limit = int(request.args.get("limit", 20))
+        limit = max(1, min(int(request.args.get("limit", 20)), HISTORY_PAGE_MAX))
         skip = int(request.args.get("skip", 0))
+        cursor = request.args.get("cursor")
+        view = request.args.get("view", "full")
         project_id = request.args.get("project_id")
         requirement_id = request.args.get("requirement_id")
         
@@ -1357,20 +2473,63 @@ def get_history():
             query["requirement_id"] = requirement_id
         
         # Only fetch test case records, not chat records
-        query["test_cases"] = {"$exists": True}
+        conditions = [{"$or": [{"test_cases": {"$exists": True}}, {"scenarios": {"$exists": True}}]}]
+        
+        # Keyset pagination: continue strictly after the last item of the previous page
+        if cursor:
+            try:
+                cursor_timestamp, cursor_id = decode_history_cursor(cursor)
+            except Exception:
+                return jsonify({"history": [], "error": "Invalid cursor"}), 400
+            conditions.append({"$or": [
+                {"timestamp": {"$lt": cursor_timestamp}},
+                {"timestamp": cursor_timestamp, "_id": {"$lt": cursor_id}}
+            ]})
+        query["$and"] = conditions
         
         print(f"Query: {query}")
         
+        # Fetch one extra record to know whether there is a next page
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"timestamp": -1, "_id": -1}}
+        ]
+        if skip and not cursor:
+            pipeline.append({"$skip": skip})
+        pipeline.append({"$limit": limit + 1})
+        
+        if view == "summary":
+            # Metadata and a short preview instead of the full text
+            first_text = {"$ifNull": ["$test_cases", {"$ifNull": [{"$arrayElemAt": ["$scenarios.text", 0]}, ""]}]}
+            pipeline.append({"$project": {
+                "timestamp": 1,
+                "project_id": 1,
+                "requirement_id": 1,
+                "requirement_title": 1,
+                "update_type": 1,
+                "version_number": 1,
+                "interrupted": 1,
+                "scenario_count": {"$size": {"$ifNull": ["$scenarios", []]}},
+                "preview": {"$substrCP": [first_text, 0, HISTORY_PREVIEW_CHARS]}
+            }})
+        
         # Get history records
-        history = list(history_collection.find(query)
-            .sort("timestamp", -1)
-            .skip(skip)
-            .limit(limit))
+        history = list(history_collection.aggregate(pipeline))
+        
+        next_cursor = None
+        if len(history) > limit:
+            history = history[:limit]
+            next_cursor = encode_history_cursor(history[-1])
         
         print(f"Found {len(history)} history records")
         
         for item in history:
             item["_id"] = str(item["_id"])
+            if view != "summary":
+                # The list only needs the text; per-scenario records are served by /history/<id>/scenarios
+                item["test_cases"] = render_test_cases(item)
+                item.pop("scenarios", None)
+                item.pop("test_cases_preamble", None)
             # If the timestamp is a datetime object, convert it to ISO string
             if isinstance(item.get("timestamp"), datetime):
                 item["timestamp"] = item["timestamp"].isoformat()
@@ -1383,7 +2542,7 @@ def get_history():
                     "Generated" 
                 )
         
-        return jsonify({"history": history})
+        return jsonify({"history": history, "next_cursor": next_cursor})
     except Exception as e:
         print(f"Error in get_history: {e}")
         # Return empty history on error, don't fail
@@ -1407,8 +2566,175 @@ def get_history_item(history_id):
         return jsonify({"error": "History item not found"}), 404
     
     item["_id"] = str(item["_id"])
+    item["test_cases"] = render_test_cases(item)
     return jsonify({"item": item})
 
+@app.route("/history/<history_id>/scenarios", methods=["GET"])
+@login_required
+def get_history_scenarios(history_id):
+    username = session["user"]
+    
+    try:
+        object_id = ObjectId(history_id)
+    except:
+        return jsonify({"error": "Invalid history ID"}), 400
+    
+    item = history_collection.find_one({"_id": object_id, "user": username})
+    if not item:
+        return jsonify({"error": "History item not found"}), 404
+    
+    return jsonify({"scenarios": load_scenarios(item)})
+
+@app.route("/history/<history_id>/scenarios/<scenario_id>", methods=["GET"])
+@login_required
+def get_history_scenario(history_id, scenario_id):
+    username = session["user"]
+    
+    try:
+        object_id = ObjectId(history_id)
+    except:
+        return jsonify({"error": "Invalid history ID"}), 400
+    
+    item = history_collection.find_one({"_id": object_id, "user": username})
+    if not item:
+        return jsonify({"error": "History item not found"}), 404
+    
+    scenario = next((s for s in load_scenarios(item) if s.get("id") == scenario_id), None)
+    if not scenario:
+        return jsonify({"error": "Scenario not found"}), 404
+    
+    return jsonify({"scenario": scenario})
+
+@app.route("/history/<history_id>/scenarios/<scenario_id>", methods=["PATCH"])
+@login_required
+def update_history_scenario(history_id, scenario_id):
+    data = request.json or {}
+    changes = {k: data[k] for k in ("text", "title", "precondition", "steps", "expected_result") if k in data}
+    update_type = data.get("update_type", "manual_edit")
+    
+    username = session["user"]
+    current_time = datetime.now(timezone.utc)
+    
+    if not changes:
+        return jsonify({"error": "No scenario fields provided"}), 400
+    if "steps" in changes and not isinstance(changes["steps"], list):
+        return jsonify({"error": "steps must be a list"}), 400
+    
+    try:
+        object_id = ObjectId(history_id)
+    except:
+        return jsonify({"error": "Invalid history ID"}), 400
+    
+    item = history_collection.find_one({"_id": object_id, "user": username})
+    if not item:
+        return jsonify({"error": "History item not found or access denied"}), 404
+    
+    scenario = next((s for s in load_scenarios(item) if s.get("id") == scenario_id), None)
+    if not scenario:
+        return jsonify({"error": "Scenario not found"}), 404
+    
+    updated = update_scenario(scenario, changes)
+    update_data = {
+        "scenarios.$": updated,
+        "timestamp": current_time,
+        "update_type": update_type
+    }
+    
+    new_test_cases = render_test_cases({
+        **item,
+        "scenarios": [updated if s.get("id") == scenario_id else s for s in item["scenarios"]]
+    })
+    version = record_test_cases_version(item, new_test_cases, username, update_type)
+    if version:
+        update_data["version_number"] = version
+    
+    # Positional update: only this scenario is written
+    result = history_collection.update_one(
+        {"_id": object_id, "user": username, "scenarios.id": scenario_id},
+        {"$set": update_data}
+    )
+    
+    if result.matched_count == 0:
+        return jsonify({"error": "Scenario not found"}), 404
+    
+    return jsonify({
+        "message": "Scenario updated successfully",
+        "scenario": updated,
+        "version": version,
+        "timestamp": current_time.isoformat()
+    })
+
+@app.route("/history/<history_id>/versions", methods=["GET"])
+@login_required
+def get_history_versions(history_id):
+    username = session["user"]
+    
+    try:
+        object_id = ObjectId(history_id)
+    except:
+        return jsonify({"error": "Invalid history ID"}), 400
+    
+    item = history_collection.find_one({"_id": object_id, "user": username}, {"_id": 1})
+    if not item:
+        return jsonify({"error": "History item not found"}), 404
+    
+    return jsonify({"versions": versions.list_versions(history_id)})
+
+@app.route("/history/<history_id>/versions/<int:version>", methods=["GET"])
+@login_required
+def get_history_version(history_id, version):
+    username = session["user"]
+    
+    try:
+        object_id = ObjectId(history_id)
+    except:
+        return jsonify({"error": "Invalid history ID"}), 400
+    
+    item = history_collection.find_one({"_id": object_id, "user": username})
+    if not item:
+        return jsonify({"error": "History item not found"}), 404
+    
+    document = versions.get_version(history_id, version)
+    if not document:
+        # Items that were never edited only have their original text
+        if version != 1 or versions.latest_version(history_id):
+            return jsonify({"error": "Version not found"}), 404
+        document = {"history_id": history_id, "version": 1, "timestamp": item.get("timestamp"),
+                    "text": render_test_cases(item)}
+    
+    return jsonify({"version": document})
+
+@app.route("/history/<history_id>/diff", methods=["GET"])
+@login_required
+def get_history_diff(history_id):
+    username = session["user"]
+    
+    try:
+        object_id = ObjectId(history_id)
+    except:
+        return jsonify({"error": "Invalid history ID"}), 400
+    
+    item = history_collection.find_one({"_id": object_id, "user": username}, {"_id": 1})
+    if not item:
+        return jsonify({"error": "History item not found"}), 404
+    
+    latest = versions.latest_version(history_id)
+    if not latest:
+        return jsonify({"error": "This item has no recorded versions"}), 404
+    
+    try:
+        to_version = int(request.args.get("to", latest["version"]))
+        # Version 1 has no predecessor: compared with itself, its diff is empty
+        from_version = int(request.args.get("from", max(to_version - 1, 1)))
+    except ValueError:
+        return jsonify({"error": "Versions must be integers"}), 400
+    
+    diff = versions.diff_versions(history_id, from_version, to_version)
+    if diff is None:
+        return jsonify({"error": "Version not found"}), 404
+    
+    return jsonify({"from": from_version, "to": to_version, "diff": diff})
+
 # Add this new endpoint to app.py
 
 @app.route("/update_test_cases/<history_id>", methods=["PUT"])
@@ -1441,7 +2767,6 @@ def update_test_cases(history_id):
     
     # Update the existing history item
     update_data = {
-        "test_cases": test_cases,
         "timestamp": current_time,
         "update_type": update_type
     }
@@ -1455,13 +2780,18 @@ def update_test_cases(history_id):
     if requirement_title:
         update_data["requirement_title"] = requirement_title
     
+    version = record_test_cases_version(existing_item, test_cases, username, update_type)
+    if version:
+        update_data["version_number"] = version
+    
     history_collection.update_one(
         {"_id": object_id},
-        {"$set": update_data}
+        test_cases_update(existing_item, test_cases, update_data)
     )
     
     return jsonify({
         "message": "Test cases updated successfully",
+        "version": version,
         "timestamp": current_time.isoformat()
     })
 @app.route("/history/<history_id>", methods=["DELETE"])
@@ -1482,10 +2812,18 @@ def delete_history_item(history_id):
     if result.deleted_count == 0:
         return jsonify({"error": "History item not found"}), 404
     
+    versions.delete_versions(history_id)
+    conversations.delete_for_history(history_id)
+    
     return jsonify({"message": "History item deleted successfully"})
 @app.route("/extract_text", methods=["POST"])
 @login_required
 def extract_text():
+    """Extract the text of an uploaded PDF, DOCX or TXT file.
+    
+    Optional form fields: ``pages`` selects PDF pages ("1-5,8,12-"), and
+    ``stream=true`` returns the text as SSE frames while it is extracted.
+    """
     if 'file' not in request.files:
         return jsonify({"error": "No file provided"}), 400
 
@@ -1493,25 +2831,45 @@ def extract_text():
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
 
+    kind = document_kind(file.filename)
+    if kind is None:
+        return jsonify({"error": "Unsupported file format. Please upload PDF, DOCX, or TXT files."}), 400
+    try:
+        ranges = parse_page_range(request.values.get("pages"))
+    except ExtractionError as e:
+        return jsonify({"error": str(e)}), 400
+
+    upload, sha256 = spool_upload(file)
+    cache_key = extraction_cache_key(kind, sha256, ranges)
+    if request.values.get("stream", "").lower() in ("1", "true", "yes"):
+        return Response(
+            iter_extraction_sse(kind, upload, ranges, file.filename, cache_key),
+            content_type="text/event-stream",
+            headers={
+                'Cache-Control': 'no-cache',
+                'Connection': 'keep-alive'
+            }
+        )
+
     try:
-        filename = file.filename.lower()
-        if filename.endswith('.pdf'):
-            text = extract_text_from_pdf(file)
-        elif filename.endswith('.docx'):
-            text = extract_text_from_docx(file)
-        elif filename.endswith('.txt'):
-            text = file.read().decode('utf-8')
+        pieces = cached_pieces(cache_key)
+        if pieces is not None:
+            text = join_pieces(kind, pieces)
         else:
-            return jsonify({"error": "Unsupported file format. Please upload PDF, DOCX, or TXT files."}), 400
-        
+            text = extract_document(kind, upload, ranges, cache_key)
         return jsonify({
             "text": text,
+            "cached": pieces is not None,
             "message": f"Text extracted successfully from {file.filename}"
         })
-        
+    except ExtractionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error extracting text: {str(e)}")
         return jsonify({"error": f"Failed to extract text: {str(e)}"}), 500
+    finally:
+        upload.close()
+
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Credentials', 'true')
@@ -1520,4 +2878,6 @@ def after_request(response):
     return response
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    # Development server only; production runs gunicorn with gunicorn.conf.py
+    apply_indexes(db)
+    app.run(debug=os.getenv("FLASK_DEBUG", "0") == "1", port=5000, host='0.0.0.0')
\ No newline at end of file
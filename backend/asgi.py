@@ -0,0 +1,209 @@
+"""Asyncio serving mode for the SSE generation routes.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The streaming routes below are dispatched through the regular Flask view on a
+short-lived thread, so session auth, rate limits, validation and the
+request/response contract stay exactly the same. When the view hands back a
+GenerationJob, the model stream itself runs on the event loop with the async
+Anthropic client, and a single worker process can hold hundreds of open
+streams. Every other route is served by the Flask app through a WSGI bridge.
+"""
+import asyncio
+import io
+import os
+import sys
+
+from a2wsgi import WSGIMiddleware
+
+from app import (
+    app,
+    ASYNC_STREAM_ENVIRON_KEY,
+    install_drain_handler,
+    register_generation,
+    replay_cached_generation,
+    unregister_generation,
+)
+
+ASYNC_STREAM_ROUTES = {
+    "/generate_test_cases_stream",
+    "/generate_test_cases_for_requirement",
+    "/chat_with_assistant",
+}
+
+# Hop-by-hop headers are owned by the ASGI server, not the application
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length"}
+
+wsgi_application = WSGIMiddleware(app, workers=int(os.getenv("ASGI_WSGI_THREADS", 10)))
+
+
+def build_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP request with a fully read body."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        ASYNC_STREAM_ENVIRON_KEY: True,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").lower()
+        value = value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name == "content-length":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def dispatch(environ):
+    """Run the Flask view for a request, including before/after request hooks."""
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            response = app.handle_exception(e)
+        # Buffer ordinary bodies while the request context is still active
+        if not hasattr(response, "generation_job"):
+            response.get_data()
+        return response
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+            return
+
+
+async def aiter_generation_sse(job, disconnected):
+    """Async counterpart of app.iter_generation_sse() for one GenerationJob."""
+    register_generation(job)
+    try:
+        if job.cached_text is not None:
+            for frame in replay_cached_generation(job.cached_text):
+                yield frame
+            for frame in await asyncio.to_thread(job.finish, job.cached_text, "end_turn"):
+                yield frame
+            return
+
+        stop_reason = None
+        async with job.async_client().messages.stream(**job.request) as stream:
+            async for event in stream:
+                if disconnected.is_set():
+                    # Leaving the context manager closes the upstream request
+                    return
+                if job.interrupted:
+                    for frame in job.interrupted_frames():
+                        yield frame
+                    return
+                job.track(event)
+                if event.type == "content_block_delta":
+                    text = getattr(event.delta, "text", None)
+                    if text:
+                        for frame in job.feed(text):
+                            yield frame
+                        if job.code_block_ready():
+                            for frame in await asyncio.to_thread(job.deliver_code_block):
+                                yield frame
+                            if job.stopped_early:
+                                break
+            else:
+                stop_reason = (await stream.get_final_message()).stop_reason
+
+        frame = job.writer.flush()
+        if frame:
+            yield frame
+        for frame in await asyncio.to_thread(job.finish, job.writer.text(), stop_reason):
+            yield frame
+    except Exception as e:
+        for frame in job.fail(e):
+            yield frame
+    finally:
+        unregister_generation(job)
+
+
+async def serve_stream(scope, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    response = await asyncio.to_thread(dispatch, build_environ(scope, body))
+    job = getattr(response, "generation_job", None)
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in response.headers.items()
+        if job is None or name.lower() not in HOP_BY_HOP_HEADERS
+    ]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+
+    if job is None:
+        await send({"type": "http.response.body", "body": response.get_data()})
+        response.close()
+        return
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+    try:
+        async for frame in aiter_generation_sse(job, disconnected):
+            if disconnected.is_set():
+                break
+            await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+        if not disconnected.is_set():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        watcher.cancel()
+
+
+async def serve_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # The server's own signal handlers are installed by now; chain onto them
+            install_drain_handler(float(os.getenv("STREAM_DRAIN_TIMEOUT", 80)))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await serve_lifespan(receive, send)
+    elif (
+        scope["type"] == "http"
+        and scope["method"] == "POST"
+        and scope["path"] in ASYNC_STREAM_ROUTES
+    ):
+        await serve_stream(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,96 @@
+"""Login latency under concurrent streaming load.
+
+    python benchmarks/bench_login.py --url http://127.0.0.1:5000 \
+        --username user@example.com --password secret --streams 32 --logins 200
+
+Opens --streams generation streams, then fires --logins POST /login requests
+--login-concurrency at a time while they run. It reports login latency
+(p50/p99, plus 503s from a saturated hash pool) and stream time to first
+chunk, once with no logins as a baseline and once with them. A first
+round with no logins warms up the server, its connection pools and the
+stub and isn't reported. If password hashing were starving the streaming
+threads, the second ttfb p99 would move. Run the backend against benchmarks/stub_anthropic.py as described in
+README.md.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from bench_streaming import percentile, run_stream
+
+
+async def run_login(client, url, username, password):
+    started = time.perf_counter()
+    response = await client.post(f"{url}/login", json={"username": username, "password": password})
+    return response.status_code, time.perf_counter() - started
+
+
+async def run_logins(url, username, password, logins, concurrency):
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def one():
+            async with semaphore:
+                results.append(await run_login(client, url, username, password))
+        await asyncio.gather(*(one() for _ in range(logins)))
+    return results
+
+
+async def run_streams(url, username, password, streams):
+    limits = httpx.Limits(max_connections=streams + 10)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        login = await client.post(f"{url}/login", json={"username": username, "password": password})
+        login.raise_for_status()
+        results = await asyncio.gather(
+            *(run_stream(client, url, i) for i in range(streams)), return_exceptions=True
+        )
+    return [r for r in results if isinstance(r, tuple)]
+
+
+async def run_scenario(args, logins, report=True):
+    url = args.url.rstrip("/")
+    streams = asyncio.create_task(run_streams(url, args.username, args.password, args.streams))
+    login_results = []
+    if logins:
+        # Let the streams start before the burst
+        await asyncio.sleep(args.warmup)
+        login_results = await run_logins(url, args.username, args.password, logins, args.login_concurrency)
+    stream_results = await streams
+
+    if not report:
+        return
+    ttfb = [r[0] for r in stream_results]
+    line = (
+        f"logins={logins:5d} streams ok={len(stream_results):4d}/{args.streams:<4d} "
+        f"ttfb p50={percentile(ttfb, 50):6.3f}s p99={percentile(ttfb, 99):6.3f}s"
+    )
+    if login_results:
+        latencies = [elapsed for status, elapsed in login_results if status == 200]
+        busy = sum(1 for status, _ in login_results if status == 503)
+        line += (
+            f" | login ok={len(latencies):4d} busy={busy:4d} "
+            f"p50={percentile(latencies, 50):6.3f}s p99={percentile(latencies, 99):6.3f}s"
+        )
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--streams", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=float, default=0.5, help="seconds between opening the streams and the burst")
+    args = parser.parse_args()
+
+    asyncio.run(run_scenario(args, 0, report=False))
+    asyncio.run(run_scenario(args, 0))
+    asyncio.run(run_scenario(args, args.logins))
+
+
+if __name__ == "__main__":
+    main()
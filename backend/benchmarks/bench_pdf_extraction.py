@@ -0,0 +1,73 @@
+"""In-process vs process-pool PDF extraction on generated specifications.
+
+    python benchmarks/bench_pdf_extraction.py --pages 100 300 600
+
+Builds a text-heavy PDF of each size with reportlab, then times reading all
+of its pages through documents.iter_pdf_pages() with the process pool
+forced off and on. The text is only joined, not cleaned or cached, so the
+numbers are page extraction alone. The pool is started once before timing,
+so they also leave out its startup cost (paid once per server process).
+Tune with PDF_EXTRACT_PROCESSES and PDF_PAGES_PER_TASK; PDF_PARALLEL_MIN_PAGES
+should sit around the page count where the two columns cross.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import documents  # noqa: E402
+
+LINE = "REQ-{page:04d}-{line:02d} The system shall validate the user's input and record the outcome in the audit log."
+
+
+def build_pdf(pages, lines_per_page=45):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(1, pages + 1):
+        text = pdf.beginText(40, 800)
+        text.setFont("Helvetica", 8)
+        for line in range(lines_per_page):
+            text.textLine(LINE.format(page=page, line=line))
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def time_extraction(data, parallel, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = "".join(piece for _, _, piece in documents.iter_pdf_pages(io.BytesIO(data), parallel=parallel))
+        best = min(best, time.perf_counter() - started)
+    return best, len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 600])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per path; the best is reported")
+    args = parser.parse_args()
+
+    # Start the pool outside the timings
+    documents.pdf_pool().submit(len, "").result()
+    print(f"processes={documents.PDF_EXTRACT_PROCESSES} pages/task={documents.PDF_PAGES_PER_TASK}")
+    for pages in args.pages:
+        data = build_pdf(pages)
+        serial, serial_chars = time_extraction(data, False, args.repeat)
+        pooled, pooled_chars = time_extraction(data, True, args.repeat)
+        assert serial_chars == pooled_chars, "both paths must extract the same text"
+        print(
+            f"pages={pages:5d} size={len(data) / 1e6:6.2f}MB "
+            f"in-process={serial:7.2f}s pool={pooled:7.2f}s speedup={serial / pooled:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
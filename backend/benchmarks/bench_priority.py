@@ -0,0 +1,100 @@
+"""Microbenchmark: compiled priority classifier vs. the substring scans it replaced.
+
+    python benchmarks/bench_priority.py --requirements 2000 --repeat 5
+
+Times priority.detect_priority() and the previous implementation (kept below
+verbatim) over generated French and English requirement descriptions, and
+counts how often the two disagree; most disagreements are the old
+substring matches inside words ("must" in "mustard", "simple" in
+"simplement").
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from priority import detect_priority  # noqa: E402
+
+SENTENCES = [
+    "Le système doit permettre à l'utilisateur de se connecter avec son adresse e-mail.",
+    "La sécurité des données personnelles est obligatoire.",
+    "Un export PDF pourrait être ajouté dans une version future.",
+    "L'affichage doit rester simplement lisible sur mobile.",
+    "Cette option est facultative et sera traitée plus tard.",
+    "The user must be able to reset their password from the login page.",
+    "Audit logs are required for every administrative action.",
+    "A dark theme would be nice to have.",
+    "The mustard-coloured banner is shown on the home page.",
+    "Reports could eventually be scheduled by email.",
+    "Les transactions critiques sont enregistrées immédiatement.",
+    "Les notifications sont envoyées quotidiennement aux responsables.",
+]
+
+
+def legacy_detect_priority(text):
+    """detect_priority() as it was before priority.py: one substring scan per keyword."""
+    text_lower = text.lower()
+    
+    high_priority_keywords = [
+        'critique', 'crucial', 'urgent', 'obligatoire', 'immédiat', 'vital',
+        'impératif', 'essentiel', 'doit', 'prioritaire', 'sécurité', 'fatal',
+        'risque', 'danger', 'critical', 'must', 'required', 'mandatory',
+        'immediately', 'security', 'safety', 'urgent', 'high priority'
+    ]
+    
+    low_priority_keywords = [
+        'optionnel', 'facultatif', 'souhaitable', 'suggéré', 'bonus', 
+        'accessoire', 'mineur', 'pourrait', 'éventuel', 'agréable', 'simple',
+        'optional', 'nice to have', 'could', 'minor', 'suggested', 'eventually',
+        'future', 'low priority', 'when possible', 'later'
+    ]
+    
+    high_count = sum(1 for word in high_priority_keywords if word in text_lower)
+    low_count = sum(1 for word in low_priority_keywords if word in text_lower)
+    
+    if high_count > low_count:
+        return 'high'
+    elif low_count > high_count:
+        return 'low'
+    else:
+        return 'medium'
+
+
+
+def build_descriptions(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(SENTENCES, k=rng.randint(2, 12))) for _ in range(count)]
+
+
+def best_time(fn, descriptions, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for description in descriptions:
+            fn(description)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requirements", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per implementation; the best is reported")
+    args = parser.parse_args()
+
+    descriptions = build_descriptions(args.requirements)
+    legacy = best_time(legacy_detect_priority, descriptions, args.repeat)
+    compiled = best_time(detect_priority, descriptions, args.repeat)
+    disagreements = sum(legacy_detect_priority(d) != detect_priority(d) for d in descriptions)
+    per_call = 1e6 / args.requirements
+    print(f"requirements={args.requirements} avg length={sum(map(len, descriptions)) // len(descriptions)} chars")
+    print(f"substring scans: {legacy * per_call:8.1f} us/call")
+    print(f"word matcher:    {compiled * per_call:8.1f} us/call  ({legacy / compiled:.2f}x)")
+    print(f"different classification: {disagreements} of {args.requirements}")
+
+
+if __name__ == "__main__":
+    main()
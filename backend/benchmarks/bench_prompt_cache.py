@@ -0,0 +1,87 @@
+"""Prompt caching benchmark for the assistant chat.
+
+    python benchmarks/bench_prompt_cache.py --url http://127.0.0.1:5000 \
+        --username admin@example.com --password secret --messages 10
+
+Creates a project with a long context, then sends --messages follow-up
+questions about the same test cases to POST /chat_with_assistant, one after
+the other, and reports the time to first chunk of each. The token counts
+the server recorded are read back from GET /generation_usage/stats, so the
+user must be an admin. Run the backend against benchmarks/stub_anthropic.py
+with --prefill-delay to see the latency side, or against the real API for
+real numbers.
+"""
+import argparse
+import json
+import time
+
+import httpx
+
+from bench_streaming import percentile
+
+TEST_CASES = """Scenario (1): Successful login with valid credentials.
+Precondition: User is registered with a valid email and password.
+Steps:
+    1. Access the login page.
+    2. Enter valid email and password.
+    3. Click on "Login".
+Expected Result: User is redirected to the home page.
+"""
+
+
+def project_context(chars):
+    sentence = ("The portal lets agents manage customer accounts, invoices and support tickets; "
+                "every action is logged and must respect the customer's data retention settings. ")
+    return (sentence * (chars // len(sentence) + 1))[:chars]
+
+
+def chat(client, url, project_id, index):
+    started = time.perf_counter()
+    first_chunk = None
+    with client.stream("POST", f"{url}/chat_with_assistant", json={
+        "message": f"Question {index}: which scenarios are missing for this requirement?",
+        "test_cases": TEST_CASES,
+        "project_id": project_id,
+    }) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if first_chunk is None and line.startswith("data: ") and '"chunk"' in line:
+                first_chunk = time.perf_counter() - started
+            if line == "data: [DONE]":
+                break
+    return first_chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--context-chars", type=int, default=20000,
+                        help="length of the project context (about 4 characters per token)")
+    args = parser.parse_args()
+
+    with httpx.Client(timeout=600) as client:
+        client.post(f"{args.url}/login", json={"username": args.username, "password": args.password}).raise_for_status()
+        project = client.post(f"{args.url}/projects", json={
+            "name": f"Prompt cache benchmark {int(time.time())}",
+            "context": project_context(args.context_chars),
+        })
+        project.raise_for_status()
+        project_id = project.json()["project"]["id"]
+
+        timings = [chat(client, args.url, project_id, i) for i in range(args.messages)]
+        for index, seconds in enumerate(timings):
+            print(f"message {index:3d}: first chunk {seconds:6.3f}s")
+        rest = [seconds for seconds in timings[1:] if seconds is not None]
+        print(f"first message {timings[0]:6.3f}s, following p50={percentile(rest, 50):6.3f}s")
+
+        stats = client.get(f"{args.url}/generation_usage/stats")
+        stats.raise_for_status()
+        print(json.dumps(stats.json().get("chat", {}), indent=2))
+        client.delete(f"{args.url}/projects/{project_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Concurrency benchmark for the SSE generation routes.
+
+    python benchmarks/bench_streaming.py --url http://127.0.0.1:5000 \
+        --username user@example.com --password secret --streams 50 100 200
+
+Opens N simultaneous POST /generate_test_cases_stream requests (bypassing the
+generation cache) and reports, per concurrency level, time to first chunk,
+total stream duration and how many streams completed. Run the backend
+against benchmarks/stub_anthropic.py so the numbers measure the server and
+not the model. See README.md in this directory for the sizing procedure.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_stream(client, url, index):
+    started = time.perf_counter()
+    first_chunk = None
+    frames = 0
+    async with client.stream(
+        "POST",
+        f"{url}/generate_test_cases_stream",
+        json={"requirements": f"Benchmark requirement {index}: the user must be able to log in.",
+              "bypass_cache": True},
+    ) as response:
+        if response.status_code != 200:
+            return None
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            frames += 1
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            if line == "data: [DONE]":
+                return first_chunk, time.perf_counter() - started, frames
+    return None
+
+
+async def run_level(url, username, password, streams):
+    limits = httpx.Limits(max_connections=streams + 10)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        login = await client.post(f"{url}/login", json={"username": username, "password": password})
+        login.raise_for_status()
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(run_stream(client, url, i) for i in range(streams)), return_exceptions=True
+        )
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if isinstance(r, tuple)]
+    ttfb = [r[0] for r in ok]
+    durations = [r[1] for r in ok]
+    frames = [r[2] for r in ok]
+    print(
+        f"streams={streams:5d} ok={len(ok):5d} wall={wall:7.2f}s "
+        f"ttfb p50={percentile(ttfb, 50):6.3f}s p99={percentile(ttfb, 99):6.3f}s "
+        f"duration p50={percentile(durations, 50):6.2f}s p99={percentile(durations, 99):6.2f}s "
+        f"frames/stream={statistics.mean(frames) if frames else 0:6.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--streams", type=int, nargs="+", default=[10, 50, 100, 200])
+    args = parser.parse_args()
+
+    for streams in args.streams:
+        asyncio.run(run_level(args.url.rstrip("/"), args.username, args.password, streams))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Local stand-in for the Anthropic Messages API, for benchmarks.
+
+    python benchmarks/stub_anthropic.py --port 8765 --delay 0.03
+
+Point the backend at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8765 (and
+any CLAUDE_API_KEY). POST /v1/messages returns a canned test case answer,
+either as JSON or as a server-sent event stream that emits a few characters
+per content_block_delta with --delay seconds between events, which is close
+to what a real model stream looks like on the wire.
+
+Prompt caching is simulated too: the prompt prefix up to each block marked
+with cache_control is remembered, and a later request starting with the
+same prefix reports it as cache_read_input_tokens instead of input_tokens.
+Prefixes shorter than --cache-min-tokens are not cached, like the real API.
+With --prefill-delay, the first event waits that many seconds per thousand
+uncached input tokens, so cache hits also show in time to first token.
+Tokens are counted as four characters each.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE_TEXT = """**Functional Test Cases**
+Scenario (1): Successful login with valid credentials.
+Precondition: User is registered with a valid email and password.
+Steps:
+    1. Access the login page.
+    2. Enter valid email and password.
+    3. Click on "Login".
+Expected Result: User is redirected to the home page.
+
+Scenario (2): Failed login with invalid credentials.
+Precondition: User has a valid email but an incorrect password.
+Steps:
+    1. Access the login page.
+    2. Enter valid email and invalid password.
+    3. Click on "Login".
+Expected Result: An error message is displayed, and the user remains on the login page.
+"""
+
+
+def prompt_blocks(body):
+    """``(text, cache_control)`` for each system and message block, in prompt order."""
+    def blocks(content):
+        if isinstance(content, str):
+            return [(content, False)]
+        return [(block.get("text", ""), "cache_control" in block) for block in content]
+
+    result = blocks(body.get("system") or [])
+    for message in body.get("messages", []):
+        result.extend(blocks(message.get("content", "")))
+    return result
+
+
+class PromptCache:
+    """Digests of the cached prompt prefixes, with their length in tokens."""
+
+    def __init__(self):
+        self.prefixes = set()
+        self.lock = threading.Lock()
+
+    def usage(self, body, min_tokens):
+        digest = hashlib.sha256(body.get("model", "").encode())
+        tokens = 0
+        read = written = 0
+        with self.lock:
+            for text, breakpoint in prompt_blocks(body):
+                digest.update(b"\0" + text.encode())
+                tokens += len(text) // 4
+                key = digest.hexdigest()
+                # Like the API, look for a cached prefix at every block
+                # boundary, not only at this request's breakpoints
+                if key in self.prefixes:
+                    read = tokens
+                elif breakpoint and tokens >= min_tokens:
+                    self.prefixes.add(key)
+                if breakpoint and tokens >= min_tokens:
+                    written = tokens
+        written = max(0, written - read)
+        return {
+            "input_tokens": tokens - read - written,
+            "cache_creation_input_tokens": written,
+            "cache_read_input_tokens": read,
+        }
+
+
+class MessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.03
+    chunk_size = 4
+    cache = PromptCache()
+    cache_min_tokens = 1024
+    prefill_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.startswith("/v1/messages"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        usage = dict(self.cache.usage(body, self.cache_min_tokens), output_tokens=len(RESPONSE_TEXT) // 4)
+        time.sleep(self.prefill_delay * (usage["input_tokens"] + usage["cache_creation_input_tokens"]) / 1000)
+
+        if not body.get("stream"):
+            payload = json.dumps({
+                "id": "msg_stub",
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model"),
+                "content": [{"type": "text", "text": RESPONSE_TEXT}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": usage,
+            }).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        self.send_event("message_start", {"type": "message_start", "message": {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": dict(usage, output_tokens=1),
+        }})
+        self.send_event("content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+        })
+        for i in range(0, len(RESPONSE_TEXT), self.chunk_size):
+            self.send_event("content_block_delta", {
+                "type": "content_block_delta", "index": 0,
+                "delta": {"type": "text_delta", "text": RESPONSE_TEXT[i:i + self.chunk_size]},
+            })
+            time.sleep(self.delay)
+        self.send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self.send_event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": usage["output_tokens"]},
+        })
+        self.send_event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, event_type, data):
+        frame = f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.03, help="seconds between deltas")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="shortest prompt prefix that is cached")
+    parser.add_argument("--prefill-delay", type=float, default=0.0,
+                        help="seconds before the first event per 1000 uncached input tokens")
+    args = parser.parse_args()
+
+    MessagesHandler.delay = args.delay
+    MessagesHandler.cache_min_tokens = args.cache_min_tokens
+    MessagesHandler.prefill_delay = args.prefill_delay
+    server = ThreadingHTTPServer((args.host, args.port), MessagesHandler)
+    server.daemon_threads = True
+    print(f"Stub Messages API listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
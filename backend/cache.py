@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after ``ttl`` seconds.
+
+    With ``sliding=True`` the expiry is pushed back on every read, so entries
+    are evicted after ``ttl`` seconds of inactivity rather than of age. When
+    ``max_bytes`` is set, ``sizeof(value)`` is summed over all entries and the
+    least recently used ones are evicted to stay under that budget.
+    """
+
+    def __init__(self, maxsize=128, ttl=300, sliding=False, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, expires_at, now):
+        return self.ttl is not None and expires_at <= now
+
+    def _prune(self, now):
+        # Entries are kept in access order, but with sliding=False an old
+        # entry may have been read recently, so scan rather than stop early
+        expired = [k for k, entry in self._data.items() if self._expired(entry[1], now)]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self.bytes -= entry[2]
+        return entry
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            value = entry[0]
+            if self.sliding:
+                self._data[key] = (value, now + self.ttl, entry[2])
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (value, expires_at, size)
+            self.bytes += size
+            if len(self._data) > self.maxsize or self._over_budget():
+                self._prune(now)
+            while len(self._data) > self.maxsize or self._over_budget():
+                self._remove(next(iter(self._data)))
+
+    def _over_budget(self):
+        return self.max_bytes is not None and self.bytes > self.max_bytes
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key) if key in self._data else None
+        return default if entry is None else entry[0]
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches ``predicate``; returns the count."""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+
+_MISSING = object()
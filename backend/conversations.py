@@ -0,0 +1,180 @@
+"""Server-side memory of assistant chats, kept within a token budget.
+
+Each user has one conversation per history item ("history:<id>"), or per
+project and requirement while the test cases aren't saved yet
+("draft:<project>:<requirement>"). A conversation stores its exchanges
+(a user message and the assistant's answer) and summary lines for older ones.
+
+Tokens are estimated locally at about four characters each. When the
+exchanges go over CHAT_HISTORY_TOKEN_BUDGET, the oldest are folded into the
+summary as one clipped line each until half the budget is left, and the
+summary drops its oldest lines past CHAT_SUMMARY_TOKEN_BUDGET, so the prompt
+stops growing however long an editing session lasts. Trimming by half
+rather than one exchange at a time keeps the start of the conversation the
+same for several messages, which the prompt cache needs. Test case code
+blocks are left out of the stored answers: the current test cases are sent
+with every request anyway.
+"""
+import os
+import re
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+# Injected by app.py
+conversations_collection = None
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 4000))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", 500))
+SUMMARY_LINE_CHARS = 200
+SAVE_ATTEMPTS = 3
+
+CODE_BLOCK = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+CODE_BLOCK_PLACEHOLDER = "[updated test cases]"
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+def conversation_key(history_id=None, project_id=None, requirement_id=None):
+    if history_id:
+        return f"history:{history_id}"
+    return f"draft:{project_id or ''}:{requirement_id or ''}"
+
+
+def _clip(text, chars):
+    text = " ".join(text.split())
+    return text if len(text) <= chars else text[:chars - 3].rstrip() + "..."
+
+
+def _exchange(user_text, assistant_text):
+    user_text = user_text.strip()
+    assistant_text = CODE_BLOCK.sub(CODE_BLOCK_PLACEHOLDER, assistant_text).strip()
+    # A single exchange never takes more than the whole budget
+    if estimate_tokens(user_text) + estimate_tokens(assistant_text) > CHAT_HISTORY_TOKEN_BUDGET:
+        half_chars = CHAT_HISTORY_TOKEN_BUDGET * 2
+        user_text = user_text[:half_chars]
+        assistant_text = assistant_text[:half_chars]
+    return {
+        "user": user_text,
+        "assistant": assistant_text,
+        "tokens": estimate_tokens(user_text) + estimate_tokens(assistant_text),
+    }
+
+
+def _summary_line(exchange):
+    return (f"- User: {_clip(exchange['user'], SUMMARY_LINE_CHARS)}\n"
+            f"  Assistant: {_clip(exchange['assistant'], SUMMARY_LINE_CHARS)}")
+
+
+def trim(conversation):
+    """Past the budget, fold the oldest exchanges into the summary until half of it is left."""
+    exchanges = conversation["exchanges"]
+    lines = conversation["summary"]
+    total = sum(exchange["tokens"] for exchange in exchanges)
+    if total <= CHAT_HISTORY_TOKEN_BUDGET:
+        return conversation
+    while len(exchanges) > 1 and total > CHAT_HISTORY_TOKEN_BUDGET // 2:
+        oldest = exchanges.pop(0)
+        total -= oldest["tokens"]
+        lines.append(_summary_line(oldest))
+    while lines and estimate_tokens("\n".join(lines)) > CHAT_SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return conversation
+
+
+def seed_exchanges(messages):
+    """Exchanges from a client-side chat history of ``{"role", "content"}`` messages.
+
+    Consecutive messages from the same side are joined, and questions left
+    without an answer are dropped.
+    """
+    exchanges = []
+    user_parts, assistant_parts = [], []
+    for message in messages or []:
+        if not isinstance(message, dict) or not isinstance(message.get("content"), str):
+            continue
+        if message.get("role") == "user":
+            if assistant_parts:
+                if user_parts:
+                    exchanges.append(_exchange("\n\n".join(user_parts), "\n\n".join(assistant_parts)))
+                user_parts, assistant_parts = [], []
+            user_parts.append(message["content"])
+        elif message.get("role") == "assistant" and user_parts:
+            assistant_parts.append(message["content"])
+    if user_parts and assistant_parts:
+        exchanges.append(_exchange("\n\n".join(user_parts), "\n\n".join(assistant_parts)))
+    return exchanges
+
+
+def load(user, key, seed=None):
+    """The stored conversation, or a new one seeded from the client's ``seed`` messages."""
+    conversation = conversations_collection.find_one({"user": user, "key": key}, {"_id": 0})
+    if conversation is None:
+        conversation = trim({
+            "user": user,
+            "key": key,
+            "exchanges": seed_exchanges(seed),
+            "summary": [],
+            "revision": 0,
+        })
+    return conversation
+
+
+def prompt_messages(conversation):
+    """The conversation as alternating user and assistant messages, summary first."""
+    messages = []
+    for exchange in conversation["exchanges"]:
+        if not exchange["user"] or not exchange["assistant"]:
+            # The API rejects empty messages
+            continue
+        messages.append({"role": "user", "content": exchange["user"]})
+        messages.append({"role": "assistant", "content": exchange["assistant"]})
+    if messages and conversation["summary"]:
+        summary = "\n".join(conversation["summary"])
+        messages[0]["content"] = f"Summary of the earlier conversation:\n{summary}\n\n{messages[0]['content']}"
+    return messages
+
+
+def append_exchange(conversation, user_text, assistant_text):
+    """Add an exchange, trim, and save, retrying when another request saved first."""
+    for _ in range(SAVE_ATTEMPTS):
+        revision = conversation["revision"]
+        conversation["exchanges"].append(_exchange(user_text, assistant_text))
+        trim(conversation)
+        conversation["revision"] = revision + 1
+        conversation["updated_at"] = datetime.now(timezone.utc)
+        try:
+            result = conversations_collection.update_one(
+                {"user": conversation["user"], "key": conversation["key"], "revision": revision},
+                {"$set": conversation},
+                upsert=revision == 0
+            )
+            if result.matched_count or result.upserted_id is not None:
+                return conversation
+        except DuplicateKeyError:
+            pass
+        conversation = load(conversation["user"], conversation["key"])
+    print(f"Could not save conversation {conversation['key']} after {SAVE_ATTEMPTS} attempts")
+    return conversation
+
+
+def attach(conversation, history_id):
+    """Move a draft conversation to the history item its test cases were saved as."""
+    key = conversation_key(history_id)
+    if conversation["revision"]:
+        try:
+            conversations_collection.update_one(
+                {"user": conversation["user"], "key": conversation["key"]},
+                {"$set": {"key": key}}
+            )
+        except DuplicateKeyError:
+            # The history item already has a conversation; keep the draft
+            return conversation
+    conversation["key"] = key
+    return conversation
+
+
+def delete_for_history(history_id):
+    conversations_collection.delete_many({"key": conversation_key(history_id)})
@@ -0,0 +1,277 @@
+"""Text extraction for uploaded specifications, one page or paragraph at a time.
+
+Uploads are first copied into a spool file that stays in memory up to
+EXTRACT_SPOOL_THRESHOLD bytes and moves to disk past that, so a large PDF
+never sits in RAM as a whole. The extractors are generators: PDFs yield one
+page at a time, DOCX files one paragraph at a time, and text files one block
+of lines at a time. Callers either stream the pieces or join them once.
+
+PyPDF2 is pure Python, so a long PDF would keep one core busy while holding
+the GIL. From PDF_PARALLEL_MIN_PAGES selected pages on, pages are extracted
+in batches of PDF_PAGES_PER_TASK on a pool of PDF_EXTRACT_PROCESSES spawned
+processes, and yielded back in page order as the batches finish.
+
+Extracted pieces are cached, zlib-compressed, under the SHA-256 of the
+uploaded bytes, so the same file uploaded again is not parsed again.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+import docx
+
+from cache import TTLCache
+
+# Bump when extraction output changes, so cached results from the old code
+# are no longer used
+EXTRACTOR_VERSION = 1
+
+EXTRACT_SPOOL_THRESHOLD = int(os.getenv("EXTRACT_SPOOL_THRESHOLD", 2 * 1024 * 1024))
+TEXT_BLOCK_CHARS = 64 * 1024
+# Streaming sends small pieces (paragraphs) together up to this many characters
+EXTRACT_FRAME_CHARS = int(os.getenv("EXTRACT_FRAME_CHARS", 4096))
+COPY_BUFFER_SIZE = 64 * 1024
+
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", min(4, os.cpu_count() or 1)))
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+# Compressed extraction results keyed by extraction_cache_key()
+extraction_cache = TTLCache(
+    maxsize=int(os.getenv("EXTRACTION_CACHE_SIZE", 256)),
+    ttl=int(os.getenv("EXTRACTION_CACHE_TTL", 86400)),
+    max_bytes=int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    sizeof=len
+)
+
+
+class ExtractionError(Exception):
+    """The document can't be read, or the page selection doesn't fit it."""
+
+
+def document_kind(filename):
+    """Kind of upload from its file name: pdf, docx, txt, or None if unsupported."""
+    extension = os.path.splitext((filename or "").lower())[1]
+    return extension[1:] if extension in (".pdf", ".docx", ".txt") else None
+
+
+def spool_upload(file_storage, threshold=EXTRACT_SPOOL_THRESHOLD):
+    """Copy an upload into a spool file the caller owns and must close.
+
+    Returns ``(spool, sha256)``, the digest being computed during the copy.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=threshold, prefix="upload-")
+    digest = hashlib.sha256()
+    while True:
+        chunk = file_storage.stream.read(COPY_BUFFER_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+
+def parse_page_range(spec):
+    """Parse "1-3,7,10-" into a list of (first, last) 1-based ranges.
+
+    ``last`` is None for an open range. Returns None when ``spec`` is empty,
+    meaning every page.
+    """
+    if not spec or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        first, dash, last = part.partition("-")
+        try:
+            first = int(first) if first.strip() else 1
+            last = (int(last) if last.strip() else None) if dash else first
+        except ValueError:
+            raise ExtractionError(f"Invalid page range: {part!r}")
+        if first < 1 or (last is not None and last < first):
+            raise ExtractionError(f"Invalid page range: {part!r}")
+        ranges.append((first, last))
+    return ranges
+
+
+def select_pages(ranges, total):
+    """1-based page numbers of a ``total``-page document in ``ranges``."""
+    if ranges is None:
+        return list(range(1, total + 1))
+    selected = set()
+    for first, last in ranges:
+        selected.update(range(first, min(last or total, total) + 1))
+    if not selected:
+        raise ExtractionError(f"Page range is outside the document ({total} pages)")
+    return sorted(selected)
+
+
+def pdf_pool():
+    """Process pool for PDF extraction, started on first use.
+
+    Spawned rather than forked, since the server processes that use it run
+    threads and hold open database connections.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
+
+
+def extract_pdf_pages(path, numbers):
+    """Text of the given 1-based pages of the PDF at ``path``; runs in the pool."""
+    reader = PyPDF2.PdfReader(path)
+    return [(reader.pages[number - 1].extract_text() or "") + "\n" for number in numbers]
+
+
+def _iter_pdf_pages_parallel(fileobj, numbers, total):
+    path = getattr(fileobj, "name", None)
+    copy = None
+    if not isinstance(path, str) or not os.path.isfile(path):
+        # The pool processes need a file they can open themselves
+        copy = tempfile.NamedTemporaryFile(prefix="upload-", suffix=".pdf", delete=False)
+        with copy:
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, copy, COPY_BUFFER_SIZE)
+        path = copy.name
+
+    batches = [numbers[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(numbers), PDF_PAGES_PER_TASK)]
+    futures = [pdf_pool().submit(extract_pdf_pages, path, batch) for batch in batches]
+    try:
+        for batch, future in zip(batches, futures):
+            try:
+                texts = future.result()
+            except Exception as e:
+                raise ExtractionError(f"Error extracting text from PDF: {e}")
+            for number, text in zip(batch, texts):
+                yield number, total, text
+    finally:
+        # Stop queued batches if the caller gave up (e.g. the client disconnected)
+        for future in futures:
+            future.cancel()
+        if copy is not None:
+            os.unlink(path)
+
+
+def iter_pdf_pages(fileobj, ranges=None, parallel=None):
+    """Yield ``(page_number, page_count, text)`` for the selected pages.
+
+    ``parallel`` forces the process pool on or off; by default it is used
+    from PDF_PARALLEL_MIN_PAGES selected pages on.
+    """
+    try:
+        reader = PyPDF2.PdfReader(fileobj)
+        total = len(reader.pages)
+    except Exception as e:
+        raise ExtractionError(f"Error extracting text from PDF: {e}")
+    numbers = select_pages(ranges, total)
+    if parallel is None:
+        parallel = PDF_EXTRACT_PROCESSES > 1 and len(numbers) >= PDF_PARALLEL_MIN_PAGES
+    if parallel:
+        yield from _iter_pdf_pages_parallel(fileobj, numbers, total)
+        return
+    for number in numbers:
+        yield number, total, (reader.pages[number - 1].extract_text() or "") + "\n"
+
+
+def iter_docx_paragraphs(fileobj, ranges=None):
+    """Yield ``(paragraph_number, paragraph_count, text)``; DOCX has no pages."""
+    if ranges is not None:
+        raise ExtractionError("Page ranges are only supported for PDF files")
+    try:
+        paragraphs = docx.Document(fileobj).paragraphs
+    except Exception as e:
+        raise ExtractionError(f"Error extracting text from DOCX: {e}")
+    total = len(paragraphs)
+    for number, paragraph in enumerate(paragraphs, 1):
+        yield number, total, paragraph.text + "\n"
+
+
+def iter_text_blocks(fileobj, ranges=None):
+    """Yield ``(block_number, None, text)`` blocks of whole lines from a UTF-8 file."""
+    if ranges is not None:
+        raise ExtractionError("Page ranges are only supported for PDF files")
+    reader = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    try:
+        number = 0
+        while True:
+            block = reader.read(TEXT_BLOCK_CHARS)
+            if not block:
+                return
+            block += reader.readline()
+            number += 1
+            yield number, None, block
+    except UnicodeDecodeError as e:
+        raise ExtractionError(f"Text file is not valid UTF-8: {e}")
+    finally:
+        # Leave the spool file for the caller to close
+        reader.detach()
+
+
+EXTRACTORS = {
+    "pdf": ("page", iter_pdf_pages),
+    "docx": ("paragraph", iter_docx_paragraphs),
+    "txt": ("block", iter_text_blocks),
+}
+
+
+def document_unit(kind):
+    return EXTRACTORS[kind][0]
+
+
+def extraction_cache_key(kind, sha256, ranges=None):
+    return f"{EXTRACTOR_VERSION}:{kind}:{sha256}:{json.dumps(ranges)}"
+
+
+def cached_pieces(cache_key):
+    """Pieces cached under ``cache_key`` as ``(number, total, text)``, or None."""
+    compressed = extraction_cache.get(cache_key)
+    if compressed is None:
+        return None
+    return [tuple(piece) for piece in json.loads(zlib.decompress(compressed))]
+
+
+def _iter_and_cache(pieces, cache_key):
+    seen = []
+    for piece in pieces:
+        seen.append(piece)
+        yield piece
+    # Only reached when every piece was read: no partial results are cached
+    extraction_cache.set(cache_key, zlib.compress(json.dumps(seen).encode("utf-8")))
+
+
+def iter_document(kind, fileobj, ranges=None, cache_key=None):
+    """Yield ``(number, total, text)`` pieces of a document; ``total`` may be None.
+
+    With ``cache_key``, the pieces are cached once the last one has been read.
+    """
+    _, extractor = EXTRACTORS[kind]
+    pieces = extractor(fileobj, ranges)
+    return pieces if cache_key is None else _iter_and_cache(pieces, cache_key)
+
+
+def join_pieces(kind, pieces):
+    text = "".join(piece for _, _, piece in pieces)
+    # Text files come back exactly as uploaded
+    return text if kind == "txt" else text.strip()
+
+
+def extract_document(kind, fileobj, ranges=None, cache_key=None):
+    """Whole text of a document, joined once."""
+    return join_pieces(kind, iter_document(kind, fileobj, ranges, cache_key))
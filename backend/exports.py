@@ -0,0 +1,232 @@
+"""Project test case exports to XLSX, DOCX and PDF, produced incrementally.
+
+iter_export() takes an iterator of ``(requirement, history_item)`` pairs and
+yields the file's bytes while it is being written, so the caller can send
+them as a chunked response:
+
+- DOCX: the package parts come from python-docx's default template, and
+  word/document.xml is written into the zip as the requirements arrive, so
+  bytes go out during the export.
+- XLSX: openpyxl's write-only mode keeps rows in a temporary file rather
+  than in memory; the zip is written out when the workbook is closed.
+- PDF: reportlab draws page by page and keeps only compressed pages; the
+  file is written out when the document is closed.
+"""
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import docx
+import openpyxl
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+from scenarios import parse_scenarios
+
+EXPORT_CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+XLSX_COLUMNS = [
+    "Requirement ID", "Requirement", "Priority", "Scenario", "Title",
+    "Precondition", "Steps", "Expected result", "Generated",
+]
+
+# Control characters XML 1.0 doesn't allow (and openpyxl rejects), which
+# can turn up in text extracted from uploads
+XML_INVALID_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only, unseekable buffer that the export generator drains."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def clean(value):
+    return XML_INVALID_CHARS.sub("", value) if isinstance(value, str) else value
+
+
+def item_scenarios(item):
+    """Scenarios of a history item, parsing plain-text items without saving them."""
+    if item.get("scenarios"):
+        return item["scenarios"]
+    parsed = parse_scenarios(item.get("test_cases", ""))
+    return parsed[1] if parsed else []
+
+
+def _generated_at(item):
+    timestamp = item.get("timestamp")
+    return timestamp.strftime("%Y-%m-%d %H:%M") if hasattr(timestamp, "strftime") else str(timestamp or "")
+
+
+class XlsxExport:
+    def __init__(self, sink, project):
+        self.sink = sink
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title="Test cases")
+        self.sheet.append(XLSX_COLUMNS)
+
+    def add(self, requirement, item):
+        head = [requirement.get("id", ""), requirement.get("title", ""), requirement.get("priority", "")]
+        generated = _generated_at(item)
+        scenarios = item_scenarios(item)
+        rows = [] if scenarios else [head + ["", "", "", item.get("test_cases", ""), "", generated]]
+        for scenario in scenarios:
+            rows.append(head + [
+                scenario.get("number") or "",
+                scenario.get("title", ""),
+                scenario.get("precondition", ""),
+                "\n".join(f"{i}. {step}" for i, step in enumerate(scenario.get("steps") or [], 1)),
+                scenario.get("expected_result", ""),
+                generated,
+            ])
+        for row in rows:
+            self.sheet.append([clean(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.sink)
+
+
+class DocxExport:
+    _template = None
+
+    @classmethod
+    def template(cls):
+        """Package parts of python-docx's default document, and document.xml around its body."""
+        if cls._template is None:
+            buffer = io.BytesIO()
+            docx.Document().save(buffer)
+            with zipfile.ZipFile(buffer) as package:
+                parts = {name: package.read(name) for name in package.namelist()}
+            document = parts.pop("word/document.xml").decode("utf-8")
+            body = document.index("<w:body>") + len("<w:body>")
+            section = document.index("<w:sectPr")
+            cls._template = (parts, document[:body], document[section:])
+        return cls._template
+
+    def __init__(self, sink, project):
+        parts, head, self.document_tail = self.template()
+        self.package = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+        for name, data in parts.items():
+            self.package.writestr(name, data)
+        self.document = self.package.open("word/document.xml", "w")
+        self.document.write(head.encode("utf-8"))
+        self.paragraph(project.get("name") or "Test cases", "Title")
+
+    def paragraph(self, text, style=None):
+        text = clean(str(text))
+        properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+        runs = '<w:r><w:br/></w:r>'.join(
+            f'<w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r>' for line in text.split("\n")
+        )
+        self.document.write(f"<w:p>{properties}{runs}</w:p>".encode("utf-8"))
+
+    def add(self, requirement, item):
+        self.paragraph(requirement.get("title") or requirement.get("id", ""), "Heading1")
+        scenarios = item_scenarios(item)
+        if not scenarios:
+            for block in item.get("test_cases", "").split("\n\n"):
+                if block.strip():
+                    self.paragraph(block.strip())
+        for scenario in scenarios:
+            number = scenario.get("number")
+            self.paragraph(f"Scenario ({number}): {scenario.get('title', '')}" if number else
+                           f"Scenario: {scenario.get('title', '')}", "Heading2")
+            if scenario.get("precondition"):
+                self.paragraph(f"Precondition: {scenario['precondition']}")
+            for i, step in enumerate(scenario.get("steps") or [], 1):
+                self.paragraph(f"{i}. {step}", "ListParagraph")
+            if scenario.get("expected_result"):
+                self.paragraph(f"Expected result: {scenario['expected_result']}")
+
+    def close(self):
+        self.document.write(self.document_tail.encode("utf-8"))
+        self.document.close()
+        self.package.close()
+
+
+class PdfExport:
+    MARGIN = 50
+    STYLES = {
+        "title": ("Helvetica-Bold", 16, 24),
+        "heading1": ("Helvetica-Bold", 13, 20),
+        "heading2": ("Helvetica-Bold", 11, 16),
+        "body": ("Helvetica", 10, 13),
+    }
+
+    def __init__(self, sink, project):
+        self.sink = sink
+        self.width, self.height = A4
+        self.canvas = canvas.Canvas(sink, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(project.get("name") or "Test cases")
+        self.y = self.height - self.MARGIN
+        self.text(project.get("name") or "Test cases", "title")
+
+    def text(self, text, style="body", indent=0):
+        font, size, leading = self.STYLES[style]
+        if style != "body":
+            self.y -= leading / 2
+        width = self.width - 2 * self.MARGIN - indent
+        for paragraph in clean(str(text)).split("\n"):
+            for line in simpleSplit(paragraph, font, size, width) or [""]:
+                if self.y < self.MARGIN + leading:
+                    self.canvas.showPage()
+                    self.y = self.height - self.MARGIN
+                self.canvas.setFont(font, size)
+                self.canvas.drawString(self.MARGIN + indent, self.y - size, line)
+                self.y -= leading
+
+    def add(self, requirement, item):
+        self.text(requirement.get("title") or requirement.get("id", ""), "heading1")
+        scenarios = item_scenarios(item)
+        if not scenarios:
+            self.text(item.get("test_cases", ""))
+        for scenario in scenarios:
+            number = scenario.get("number")
+            self.text(f"Scenario ({number}): {scenario.get('title', '')}" if number else
+                      f"Scenario: {scenario.get('title', '')}", "heading2")
+            if scenario.get("precondition"):
+                self.text(f"Precondition: {scenario['precondition']}")
+            for i, step in enumerate(scenario.get("steps") or [], 1):
+                self.text(f"{i}. {step}", indent=15)
+            if scenario.get("expected_result"):
+                self.text(f"Expected result: {scenario['expected_result']}")
+
+    def close(self):
+        self.canvas.save()
+
+
+EXPORTERS = {"xlsx": XlsxExport, "docx": DocxExport, "pdf": PdfExport}
+
+
+def iter_export(export_format, project, records):
+    """Yield the bytes of an export of ``records`` as they are produced."""
+    sink = ChunkSink()
+    exporter = EXPORTERS[export_format](sink, project)
+    for requirement, item in records:
+        exporter.add(requirement, item)
+        data = sink.drain()
+        if data:
+            yield data
+    exporter.close()
+    data = sink.drain()
+    if data:
+        yield data
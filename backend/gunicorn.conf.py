@@ -0,0 +1,88 @@
+"""Gunicorn settings for production.
+
+    gunicorn -c gunicorn.conf.py
+
+Everything is tunable through environment variables:
+
+SERVER_MODE                 "wsgi" (default) serves app:app, "asgi" serves
+                            asgi:application on uvicorn workers so the SSE
+                            generation routes run on asyncio
+WEB_CONCURRENCY             worker processes (default 2)
+GUNICORN_WORKER_CLASS       wsgi mode only: "gthread" (default) or "gevent"
+                            (needs the gevent package) for greenlets
+GUNICORN_THREADS            threads per gthread worker (default 32)
+GUNICORN_WORKER_CONNECTIONS greenlets per gevent worker (default 1000)
+GUNICORN_KEEPALIVE          keep-alive seconds (default 5)
+GUNICORN_TIMEOUT            worker heartbeat timeout (default 120)
+GUNICORN_GRACEFUL_TIMEOUT   seconds a stopping worker has to finish its
+                            requests (default 90)
+STREAM_DRAIN_TIMEOUT        seconds in-flight generations get before they are
+                            checkpointed and closed (default: graceful
+                            timeout minus 10)
+APPLY_INDEXES_ON_START      "true" (default) applies the index manifest in
+                            indexes.py once in the master before workers
+                            start; set "false" when deploys run
+                            `python indexes.py migrate` themselves
+BCRYPT_ROUNDS               bcrypt cost for stored passwords (default 12);
+                            older hashes are upgraded on the next login
+PASSWORD_HASH_WORKERS       threads per worker that hash and check
+                            passwords (default 2)
+PASSWORD_HASH_QUEUE_LIMIT   hashes allowed to wait for those threads before
+                            login answers 503 (default 64)
+PDF_EXTRACT_PROCESSES       processes per worker that extract long PDFs
+                            (default: CPU count, at most 4; 1 disables)
+PDF_PARALLEL_MIN_PAGES      selected pages from which a PDF goes to those
+                            processes (default 64)
+CHAT_HISTORY_TOKEN_BUDGET   estimated tokens of earlier assistant chat turns
+                            sent with each message (default 4000); older
+                            turns are folded into a summary
+CHAT_SUMMARY_TOKEN_BUDGET   estimated tokens that summary keeps (default 500)
+
+Sizing: in gthread mode every open generation stream holds one thread for
+20-60 seconds, so concurrent streams per container are about
+WEB_CONCURRENCY * GUNICORN_THREADS. In asgi mode a stream is a coroutine and
+the limit is memory and upstream rate limits, not threads. Measure with
+benchmarks/bench_streaming.py (see benchmarks/README.md).
+"""
+import os
+
+server_mode = os.getenv("SERVER_MODE", "wsgi")
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+
+if server_mode == "asgi":
+    wsgi_app = "asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+    threads = int(os.getenv("GUNICORN_THREADS", 32))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 90))
+
+# Checkpoint leftover streams a little before gunicorn kills the worker
+os.environ.setdefault("STREAM_DRAIN_TIMEOUT", str(max(graceful_timeout - 10, 1)))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    if os.getenv("APPLY_INDEXES_ON_START", "true").lower() != "false":
+        from pymongo import MongoClient
+        from indexes import DATABASE_NAME, apply_indexes
+        # A short-lived client, closed before any worker is forked
+        with MongoClient(os.getenv("MONGO_URI", "mongodb://mongo:27017/")) as client:
+            apply_indexes(client[DATABASE_NAME], log=server.log.info)
+
+
+def post_worker_init(worker):
+    # uvicorn installs its signal handlers later; asgi.py chains onto those
+    # from its lifespan startup instead
+    if server_mode != "asgi":
+        from app import install_drain_handler
+        install_drain_handler(float(os.environ["STREAM_DRAIN_TIMEOUT"]))
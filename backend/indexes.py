@@ -0,0 +1,164 @@
+"""MongoDB index manifest and migration for every collection the app uses.
+
+    python indexes.py migrate [--prune]   create missing indexes (and drop
+                                          ones not in the manifest)
+    python indexes.py explain             explain each route's query shape
+                                          and flag collection scans
+
+gunicorn applies the manifest once in the master process at startup (see
+gunicorn.conf.py), and so does the development server; workers never
+create indexes themselves.
+"""
+import argparse
+import os
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient
+from pymongo.errors import OperationFailure
+
+DATABASE_NAME = "chat_app"
+
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("role", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    "projects": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user", ASCENDING)]),
+        IndexModel([("collaborators", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    "requirements": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("project_id", ASCENDING)]),
+    ],
+    "chat_history": [
+        # /history filter and (timestamp, _id) sort
+        IndexModel([("user", ASCENDING), ("project_id", ASCENDING), ("requirement_id", ASCENDING),
+                    ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("user", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        # Latest item per requirement across users, for project exports
+        IndexModel([("project_id", ASCENDING), ("requirement_id", ASCENDING),
+                    ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "versions": [
+        IndexModel([("history_id", ASCENDING), ("version", ASCENDING)], unique=True),
+    ],
+    "collaborators": [
+        IndexModel([("project_id", ASCENDING), ("username", ASCENDING)]),
+    ],
+    "conversations": [
+        IndexModel([("user", ASCENDING), ("key", ASCENDING)], unique=True),
+        IndexModel([("key", ASCENDING)]),
+        # Conversations nobody has continued for 30 days are dropped
+        IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=30 * 86400),
+    ],
+    "api_keys": [
+        IndexModel([("user", ASCENDING), ("project_id", ASCENDING)]),
+    ],
+}
+
+TEST_CASE_RECORDS = {"$or": [{"test_cases": {"$exists": True}}, {"scenarios": {"$exists": True}}]}
+HISTORY_ORDER = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# Query shapes issued by the routes, with placeholder values, for explain()
+QUERY_SHAPES = [
+    ("POST /login", "users", {"username": "u"}, None),
+    ("GET /check_session", "users", {"username": "u"}, None),
+    ("admin: list users by role", "users", {"role": "admin"}, None),
+    ("admin: recent users", "users", {}, [("created_at", DESCENDING)]),
+    ("API key lookup (project)", "api_keys", {"user": "u", "project_id": "p"}, None),
+    ("API key lookup (default)", "api_keys", {"user": "u", "project_id": {"$exists": False}}, None),
+    ("GET /projects", "projects", {"$or": [{"user": "u"}, {"collaborators": "u"}]}, None),
+    ("project access check", "projects", {"id": "p", "$or": [{"user": "u"}, {"collaborators": "u"}]}, None),
+    ("admin: project by id", "projects", {"id": "p"}, None),
+    ("admin: recent projects", "projects", {}, [("created_at", DESCENDING)]),
+    ("requirement by id", "requirements", {"id": "r"}, None),
+    ("GET /projects/<id>/requirements", "requirements", {"project_id": "p"}, None),
+    ("collaborator lookup", "collaborators", {"project_id": "p", "username": "u"}, None),
+    ("GET /projects/<id>/collaborators", "collaborators", {"project_id": "p"}, None),
+    ("GET /history (requirement)", "chat_history",
+     {"user": "u", "project_id": "p", "requirement_id": "r", **TEST_CASE_RECORDS}, HISTORY_ORDER),
+    ("GET /history (project)", "chat_history", {"user": "u", "project_id": "p", **TEST_CASE_RECORDS}, HISTORY_ORDER),
+    ("GET /history (all)", "chat_history", {"user": "u", **TEST_CASE_RECORDS}, HISTORY_ORDER),
+    ("GET /projects/<id>/export", "chat_history",
+     {"project_id": "p", "requirement_id": {"$in": ["r"]}, **TEST_CASE_RECORDS},
+     [("requirement_id", ASCENDING), *HISTORY_ORDER]),
+    ("history item", "chat_history", {"_id": 0, "user": "u"}, None),
+    ("assistant conversation", "conversations", {"user": "u", "key": "history:h"}, None),
+    ("version rebuild", "versions", {"history_id": "h", "version": {"$lte": 1}}, [("version", DESCENDING)]),
+]
+
+
+def index_name(model):
+    return model.document["name"]
+
+
+def apply_indexes(db, prune=False, log=print):
+    """Create every index in the manifest; with ``prune``, drop the others."""
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        for model in models:
+            try:
+                collection.create_indexes([model])
+            except OperationFailure as e:
+                # e.g. existing duplicates blocking a unique index; keep going
+                log(f"{collection_name}: could not create {index_name(model)}: {e}")
+        if prune:
+            wanted = {index_name(model) for model in models} | {"_id_"}
+            for name in collection.index_information():
+                if name not in wanted:
+                    collection.drop_index(name)
+                    log(f"{collection_name}: dropped {name}")
+    log("Indexes are up to date")
+
+
+def winning_stages(plan):
+    """Yield every stage name in an explain() winning plan."""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from winning_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from winning_stages(child)
+
+
+def explain_queries(db, log=print):
+    """Explain each query shape; returns the routes that scan a collection."""
+    scans = []
+    for route, collection_name, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = [stage for stage in winning_stages(plan) if stage]
+        flag = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        if flag == "COLLSCAN":
+            scans.append(route)
+        log(f"{flag:9} {collection_name:14} {route:36} {' <- '.join(stages)}")
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="create the indexes in the manifest")
+    migrate.add_argument("--prune", action="store_true", help="drop indexes that are not in the manifest")
+    subparsers.add_parser("explain", help="flag query shapes that scan a whole collection")
+    args = parser.parse_args()
+
+    with MongoClient(os.getenv("MONGO_URI", "mongodb://mongo:27017/")) as client:
+        db = client[DATABASE_NAME]
+        if args.command == "migrate":
+            apply_indexes(db, prune=args.prune)
+        else:
+            scans = explain_queries(db)
+            if scans:
+                print(f"{len(scans)} query shape(s) scan a whole collection")
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Prompt language detection.
+
+generate_test_case_prompt() has French and English templates. langdetect is
+slow on long texts and, unless seeded, can answer differently for the same
+text, so the language is detected once per project and requirement and
+stored on the document as ``language``. Ad-hoc text goes through an LRU
+cache keyed on a normalized sample.
+
+Short texts such as a project name alone are often misread (most come out
+French), so a project only gets a language once its context is at least
+PROJECT_CONTEXT_MIN_CHARS long; until then the submitted requirements are
+detected instead.
+"""
+import os
+from functools import lru_cache
+
+import langdetect
+from langdetect import DetectorFactory
+
+# Make langdetect deterministic: the same text always gets the same answer
+DetectorFactory.seed = 0
+
+DEFAULT_LANGUAGE = "fr"
+LANGUAGE_SAMPLE_CHARS = 2000
+LANGUAGE_CACHE_SIZE = int(os.getenv("LANGUAGE_CACHE_SIZE", 4096))
+PROJECT_CONTEXT_MIN_CHARS = int(os.getenv("PROJECT_CONTEXT_MIN_CHARS", 200))
+
+
+@lru_cache(maxsize=LANGUAGE_CACHE_SIZE)
+def _detect_sample(sample):
+    try:
+        return "en" if langdetect.detect(sample) == "en" else "fr"
+    except langdetect.LangDetectException:
+        return DEFAULT_LANGUAGE
+
+
+def detect_language(*texts):
+    """Template language, "en" or "fr", for the given texts taken together.
+
+    Only the first LANGUAGE_SAMPLE_CHARS characters (whitespace collapsed)
+    are looked at, which is plenty to tell French from English.
+    """
+    sample = " ".join(" ".join(text or "" for text in texts).split())[:LANGUAGE_SAMPLE_CHARS]
+    if not sample:
+        return DEFAULT_LANGUAGE
+    return _detect_sample(sample)
+
+
+def enough_context(context):
+    """Whether a project context is long enough to detect its language from."""
+    return len(" ".join((context or "").split())) >= PROJECT_CONTEXT_MIN_CHARS
+
+
+def context_language(context):
+    """Language of a project context, or None when it is too short to tell."""
+    return detect_language(context) if enough_context(context) else None
@@ -0,0 +1,130 @@
+"""bcrypt password hashing on a small dedicated thread pool.
+
+bcrypt is deliberately slow and releases the GIL while it works, so a burst
+of logins could otherwise take every core away from the threads serving
+generation streams. All hashing and verification runs on
+PASSWORD_HASH_WORKERS threads. When more than PASSWORD_HASH_QUEUE_LIMIT
+requests are already waiting, callers get PasswordHasherBusy right away
+instead of queueing behind them.
+"""
+import hmac
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 64))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+# Prefix, two-digit cost, then 22 characters of salt and 31 of hash
+BCRYPT_HASH = re.compile(r"\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}")
+
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE_LIMIT)
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hash operations are already queued, or they took too long."""
+
+
+def _run(fn, *args):
+    if not _pending.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = hash_executor.submit(fn, *args)
+    except Exception:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+def _result(future):
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except TimeoutError:
+        # The queue is slow rather than full; callers answer the same way
+        future.cancel()
+        raise PasswordHasherBusy()
+
+
+def is_hashed(stored):
+    """Whether ``stored`` is a bcrypt hash; a legacy plaintext password can look like its prefix."""
+    return isinstance(stored, str) and BCRYPT_HASH.fullmatch(stored) is not None
+
+
+def hash_rounds(stored):
+    try:
+        return int(stored.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("ascii")
+
+
+def _check(password, stored):
+    return bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii"))
+
+
+# Compared against when the user doesn't exist, so unknown usernames take as
+# long as wrong passwords
+_DUMMY_HASH = None
+
+
+def _check_dummy(password):
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = _hash("not-a-password")
+    _check(password, _DUMMY_HASH)
+    return False
+
+
+def hash_password(password):
+    """bcrypt hash of ``password`` at the configured cost."""
+    return _result(_run(_hash, password))
+
+
+def verify_password(password, stored):
+    """Check ``password`` against a stored value.
+
+    Returns ``(ok, needs_rehash)``. Plaintext values from before hashing was
+    introduced still verify, and are reported as needing a rehash, as are
+    hashes made with a different cost than BCRYPT_ROUNDS.
+    """
+    if not isinstance(password, str) or not password:
+        return False, False
+    if stored is None:
+        _result(_run(_check_dummy, password))
+        return False, False
+    if not is_hashed(stored):
+        ok = hmac.compare_digest(password.encode("utf-8"), str(stored).encode("utf-8"))
+        return ok, ok
+    ok = _result(_run(_check, password, stored))
+    return ok, ok and hash_rounds(stored) != BCRYPT_ROUNDS
+
+
+def rehash_in_background(password, on_hashed):
+    """Hash ``password`` on the pool and pass the result to ``on_hashed``.
+
+    Used to upgrade a stored value after a successful login without making
+    the user wait for a second hash. Skipped when the pool is saturated;
+    the next login will try again.
+    """
+    try:
+        future = _run(_hash, password)
+    except PasswordHasherBusy:
+        return
+
+    def done(future):
+        try:
+            on_hashed(future.result())
+        except Exception as e:
+            print(f"Error upgrading password hash: {e}")
+
+    future.add_done_callback(done)
@@ -0,0 +1,72 @@
+"""Keyword-based priority classification for requirements.
+
+Descriptions are split into words once by a compiled regular expression and
+the keywords are found with a single set intersection, so matching is on
+whole words ("must" doesn't fire on "mustard" nor "simple" on "simplement")
+and costs one pass whatever the number of keywords. The few multi-word
+keywords are looked for in the re-joined words, only when their first word
+is present.
+
+Each keyword found adds its weight to its level, once however often it
+appears; the heavier level wins and a tie is "medium".
+"""
+import re
+
+# Keyword forms (inflections and accent-less spellings included) with weights
+HIGH_PRIORITY_KEYWORDS = {
+    2: ["critique", "critiques", "critical", "urgent", "urgente", "urgents", "urgentes",
+        "obligatoire", "obligatoires", "mandatory", "fatal", "fatale", "fatals", "fatales",
+        "vital", "vitale", "vitaux", "vitales", "immédiat", "immédiate", "immédiats", "immédiates",
+        "immediat", "immediate", "immediately", "sécurité", "securite", "security", "safety",
+        "high priority", "haute priorité", "haute priorite"],
+    1: ["crucial", "cruciale", "cruciaux", "cruciales", "impératif", "impérative", "imperatif",
+        "imperative", "essentiel", "essentielle", "essentiels", "essentielles", "essential",
+        "doit", "doivent", "prioritaire", "prioritaires", "risque", "risques", "danger", "dangers",
+        "must", "required"],
+}
+LOW_PRIORITY_KEYWORDS = {
+    2: ["optionnel", "optionnelle", "optionnels", "optionnelles", "optional", "facultatif",
+        "facultative", "facultatifs", "facultatives", "nice to have", "low priority",
+        "basse priorité", "basse priorite"],
+    1: ["souhaitable", "souhaitables", "suggéré", "suggérée", "suggérés", "suggérées", "suggested",
+        "bonus", "accessoire", "accessoires", "mineur", "mineure", "mineurs", "mineures", "minor",
+        "pourrait", "pourraient", "could", "éventuel", "éventuelle", "éventuels", "éventuelles",
+        "eventually", "agréable", "agréables", "simple", "simples", "future", "when possible", "later"],
+}
+
+KEYWORD_WEIGHTS = {
+    form: (level, weight)
+    for level, keywords in (("high", HIGH_PRIORITY_KEYWORDS), ("low", LOW_PRIORITY_KEYWORDS))
+    for weight, forms in keywords.items()
+    for form in forms
+}
+
+WORD_SEPARATOR = re.compile(r"\W+")
+SINGLE_WORDS = frozenset(form for form in KEYWORD_WEIGHTS if " " not in form)
+PHRASES = [form for form in KEYWORD_WEIGHTS if " " in form]
+PHRASE_FIRST_WORDS = frozenset(phrase.split()[0] for phrase in PHRASES)
+
+
+def detect_priority(text):
+    """
+    Analyze text to automatically detect the priority level.
+    Returns 'high', 'medium', or 'low'.
+    """
+    words = WORD_SEPARATOR.split((text or "").lower())
+    word_set = set(words)
+    found = word_set & SINGLE_WORDS
+    if not PHRASE_FIRST_WORDS.isdisjoint(word_set):
+        joined = f" {' '.join(words)} "
+        found.update(phrase for phrase in PHRASES if f" {phrase} " in joined)
+
+    scores = {"high": 0, "low": 0}
+    for keyword in found:
+        level, weight = KEYWORD_WEIGHTS[keyword]
+        scores[level] += weight
+
+    if scores["high"] > scores["low"]:
+        return 'high'
+    elif scores["low"] > scores["high"]:
+        return 'low'
+    else:
+        return 'medium'
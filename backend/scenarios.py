@@ -0,0 +1,237 @@
+"""Per-scenario storage for generated test cases.
+
+Generated output is split into a preamble and one record per scenario, in
+the formats generate_test_case_prompt() asks for: the French and English
+"Scenario (n)" layouts and Gherkin. Each record keeps its raw ``text`` so
+the document renders back exactly as it was written, plus the parsed
+fields so a single scenario can be read or edited on its own.
+"""
+import re
+import uuid
+
+SCENARIO_HEADING = re.compile(
+    r"^[ \t>#*_\-]*(?:Scenario Outline|Scenario|Scénario|Plan du scénario)\b.*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+SECTION_HEADING = re.compile(
+    r"^\s*(?:\*\*[^*\n]+\*\*|#{1,6}\s.*|(?:Feature|Fonctionnalité)\s*:.*)\s*$",
+    re.IGNORECASE,
+)
+HEADING_PREFIX = re.compile(
+    r"^[ \t>#*_\-]*(?:Scenario Outline|Scenario|Scénario|Plan du scénario)[*_\s]*"
+    r"(?:\(?\s*(\d+)\s*\)?)?[*_\s]*[:\-–.]?[*_\s]*",
+    re.IGNORECASE,
+)
+LABELS = {
+    "precondition": re.compile(r"^\s*[*_]*(?:Pr[ée]conditions?|Pr[ée]-?requis)[*_]*\s*:\s*(.*)$", re.IGNORECASE),
+    "steps": re.compile(r"^\s*[*_]*(?:[ÉE]tapes|Steps)[*_]*\s*:\s*(.*)$", re.IGNORECASE),
+    "expected_result": re.compile(r"^\s*[*_]*(?:R[ée]sultats? attendus?|Expected Results?)[*_]*\s*:\s*(.*)$", re.IGNORECASE),
+}
+FRENCH_LABEL = re.compile(r"^\s*[*_]*(?:Précondition|[ÉE]tapes|R[ée]sultats? attendus?|Pr[ée]-?requis)", re.IGNORECASE | re.MULTILINE)
+NUMBERED_STEP = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+(.*)$")
+GHERKIN_STEP = re.compile(
+    r"^\s*(Given|When|Then|And|But|Étant donné(?: que| qu')?|Soit|Quand|Lorsque|Alors|Et|Mais)\b",
+    re.IGNORECASE | re.MULTILINE,
+)
+GHERKIN_OPENING_STEP = re.compile(r"^\s*(?:Given|When|Étant donné|Soit|Quand|Lorsque)\b", re.IGNORECASE | re.MULTILINE)
+GHERKIN_THEN = re.compile(r"^\s*(?:Then|Alors)\b", re.IGNORECASE)
+
+FIELDS = ("title", "precondition", "steps", "expected_result")
+
+
+def new_scenario_id():
+    return str(uuid.uuid4())
+
+
+def _split_trailer(block):
+    """Move section headings at the end of a block to the next scenario."""
+    lines = block.splitlines(keepends=True)
+    end = len(lines)
+    while end > 1 and (not lines[end - 1].strip() or SECTION_HEADING.match(lines[end - 1])):
+        end -= 1
+    # Keep the blank lines that separate this scenario from the next one
+    while end < len(lines) and not lines[end].strip():
+        end += 1
+    return "".join(lines[:end]), "".join(lines[end:])
+
+
+def detect_format(text):
+    if GHERKIN_OPENING_STEP.search(text) and not any(LABELS["steps"].match(line) for line in text.splitlines()):
+        return "gherkin"
+    return "fr" if FRENCH_LABEL.search(text) else "en"
+
+
+def parse_scenario(text):
+    """Parse one scenario block into its fields; ``text`` is kept verbatim."""
+    lines = text.splitlines()
+    heading = lines[0] if lines else ""
+    match = HEADING_PREFIX.match(heading)
+    title = heading[match.end():] if match else heading
+    scenario = {
+        "number": int(match.group(1)) if match and match.group(1) else None,
+        "title": title.strip().strip("*_").strip(),
+        "precondition": "",
+        "steps": [],
+        "expected_result": "",
+        "format": detect_format(text),
+        "text": text,
+    }
+
+    if scenario["format"] == "gherkin":
+        then_seen = False
+        for line in lines[1:]:
+            if not GHERKIN_STEP.match(line):
+                continue
+            then_seen = then_seen or bool(GHERKIN_THEN.match(line))
+            if then_seen:
+                scenario["expected_result"] = "\n".join(filter(None, [scenario["expected_result"], line.strip()]))
+            else:
+                scenario["steps"].append(line.strip())
+        return scenario
+
+    field = None
+    for line in lines[1:]:
+        for name, pattern in LABELS.items():
+            label = pattern.match(line)
+            if label:
+                field = name
+                line = label.group(1)
+                break
+        if not line.strip() or field is None:
+            continue
+        if field == "steps":
+            step = NUMBERED_STEP.match(line)
+            if step or not scenario["steps"]:
+                scenario["steps"].append((step.group(1) if step else line).strip())
+            else:
+                scenario["steps"][-1] += " " + line.strip()
+        else:
+            scenario[field] = " ".join(filter(None, [scenario[field], line.strip()]))
+    return scenario
+
+
+def parse_scenarios(test_cases):
+    """Split generated output into ``(preamble, scenarios)``.
+
+    Returns ``None`` when the text has no recognisable scenario heading, in
+    which case it should be stored as a plain ``test_cases`` string.
+    """
+    if not test_cases:
+        return None
+    starts = [m.start() for m in SCENARIO_HEADING.finditer(test_cases)]
+    if not starts:
+        return None
+
+    preamble = test_cases[:starts[0]]
+    scenarios = []
+    prefix = ""
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(test_cases)
+        body, trailer = _split_trailer(test_cases[start:end])
+        if index + 1 == len(starts):
+            body, trailer = body + trailer, ""
+        scenario = parse_scenario(body)
+        scenario["id"] = new_scenario_id()
+        scenario["prefix"] = prefix
+        scenarios.append(scenario)
+        prefix = trailer
+    return preamble, scenarios
+
+
+def render_scenario(scenario):
+    """Write a scenario's fields back out in its own format."""
+    number = scenario.get("number")
+    steps = scenario.get("steps") or []
+    if scenario.get("format") == "gherkin":
+        indent = re.match(r"[ \t]*", scenario.get("text", "")).group()
+        lines = [f"{indent}Scenario: {scenario.get('title', '')}"]
+        lines += [f"{indent}  {step}" for step in steps]
+        lines += [f"{indent}  {line}" for line in (scenario.get("expected_result") or "").splitlines()]
+        return "\n".join(lines) + "\n"
+
+    french = scenario.get("format") == "fr"
+    sep = " : " if french else ": "
+    heading = f"Scenario ({number}){sep}" if number is not None else f"Scenario{sep}"
+    lines = [heading + scenario.get("title", "")]
+    if scenario.get("precondition"):
+        lines.append(("Précondition" if french else "Precondition") + sep + scenario["precondition"])
+    lines.append(("Etapes" if french else "Steps") + sep.rstrip())
+    lines += [f"    {i}. {step}" for i, step in enumerate(steps, 1)]
+    if scenario.get("expected_result"):
+        lines.append(("Résultat attendu" if french else "Expected Result") + sep + scenario["expected_result"])
+    return "\n".join(lines) + "\n"
+
+
+def update_scenario(scenario, changes):
+    """Return a copy of ``scenario`` with ``changes`` applied.
+
+    ``changes`` may carry a raw ``text`` block, which is re-parsed, or any of
+    the parsed fields, in which case the block is re-rendered and keeps the
+    blank lines that separated it from the next scenario.
+    """
+    updated = dict(scenario)
+    if "text" in changes:
+        text = changes["text"]
+        if text and not text.endswith("\n"):
+            text += "\n"
+        updated.update(parse_scenario(text))
+        return updated
+
+    for field in FIELDS:
+        if field in changes:
+            updated[field] = changes[field]
+    old_text = scenario.get("text", "")
+    separator = old_text[len(old_text.rstrip("\n")):] or "\n"
+    updated["text"] = render_scenario(updated).rstrip("\n") + separator
+    return updated
+
+
+def render_test_cases(doc):
+    """Full test case text of a history document, structured or not."""
+    scenarios = doc.get("scenarios")
+    if not scenarios:
+        return doc.get("test_cases", "")
+    parts = [doc.get("test_cases_preamble", "")]
+    for scenario in scenarios:
+        parts.append(scenario.get("prefix", ""))
+        parts.append(scenario.get("text", ""))
+    return "".join(parts)
+
+
+def test_case_fields(test_cases):
+    """History fields for ``test_cases``: structured when it parses."""
+    parsed = parse_scenarios(test_cases)
+    if parsed is None:
+        return {"test_cases": test_cases}
+    preamble, scenarios = parsed
+    return {"test_cases_preamble": preamble, "scenarios": scenarios}
+
+
+def test_case_changes(doc, test_cases):
+    """Build the ``$set``/``$unset`` needed to turn ``doc`` into ``test_cases``.
+
+    When the new text has the same scenario layout as the stored one, only
+    the scenarios whose text changed are written, by array index, and keep
+    their IDs. Anything else replaces the whole scenario list.
+    """
+    parsed = parse_scenarios(test_cases)
+    current = doc.get("scenarios") or []
+    if parsed is None:
+        return {"test_cases": test_cases}, {"scenarios": "", "test_cases_preamble": ""}
+
+    preamble, scenarios = parsed
+    same_layout = (
+        current
+        and len(current) == len(scenarios)
+        and doc.get("test_cases_preamble", "") == preamble
+        and all(old.get("prefix", "") == new["prefix"] for old, new in zip(current, scenarios))
+    )
+    if not same_layout:
+        return {"test_cases_preamble": preamble, "scenarios": scenarios}, {"test_cases": ""}
+
+    changes = {}
+    for index, (old, new) in enumerate(zip(current, scenarios)):
+        if old.get("text") != new["text"]:
+            new["id"] = old.get("id") or new["id"]
+            changes[f"scenarios.{index}"] = new
+    return changes, {}
@@ -0,0 +1,155 @@
+"""Split an extracted specification into requirement-sized segments.
+
+Segments start at headings: Markdown and bold headings, multi-level
+numbering ("3.1", "3.1.2 Title"), requirement identifiers ("REQ-012",
+"Exigence 4") and short all-caps lines. A single-level number ("4. Title",
+"4 Title") only counts when it reads like a title and isn't part of a
+numbered list; without a dot the title must also start with a capital.
+Segments longer than SEGMENT_MAX_CHARS are cut at paragraph, then line
+boundaries. Text with no headings at all is packed by paragraph.
+"""
+import os
+import re
+
+SEGMENT_MAX_CHARS = int(os.getenv("SEGMENT_MAX_CHARS", 6000))
+TITLE_MAX_CHARS = 200
+
+MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$")
+BOLD_HEADING = re.compile(r"^\*\*([^*]+)\*\*:?$")
+MULTI_LEVEL_NUMBER = re.compile(r"^(\d+(?:\.\d+)+)\.?\s+(\S.*)$")
+SINGLE_LEVEL_NUMBER = re.compile(r"^(\d+)[.)]\s+(\S.*)$")
+BARE_NUMBER = re.compile(r"^(\d+)\s+([A-ZÀ-ÖØ-Ý].*)$")
+REQUIREMENT_ID = re.compile(
+    r"^(?:(?:REQ|EXG?|RG|RF|RNF|FR|NFR|US|UC)[-_ ]?\d+(?:\.\d+)*"
+    r"|(?:Exigence|Requirement|Besoin|User Story|Use Case|Cas d'utilisation|Article)\s+\d+(?:\.\d+)*)"
+    r"\b\s*[:.\-–]?\s*(.*)$",
+    re.IGNORECASE,
+)
+UPPERCASE_HEADING = re.compile(r"^[A-ZÀ-ÖØ-Ý0-9][A-ZÀ-ÖØ-Ý0-9 '’&/\-]{3,80}$")
+LIST_ITEM = re.compile(r"^(?:\d+[.)]|[-*•])\s+")
+HEADING_NUMBER = re.compile(r"^(\d+(?:\.\d+)*)")
+
+
+def _within(section, heading):
+    """Whether a numbered ``heading`` is a subsection of ``section`` ("3.2" of "3")."""
+    parent = HEADING_NUMBER.match(section)
+    child = HEADING_NUMBER.match(heading)
+    return bool(parent and child and child.group(1).startswith(parent.group(1).rstrip(".") + "."))
+
+
+def _title_like(text):
+    return len(text.split()) <= 10 and not text.rstrip().endswith((".", ";", ",", ":", "?", "!"))
+
+
+def heading_title(line, in_list=False):
+    """The title if ``line`` is a heading, else None."""
+    line = line.strip()
+    if not line or len(line) > TITLE_MAX_CHARS:
+        return None
+    for pattern in (MARKDOWN_HEADING, BOLD_HEADING):
+        match = pattern.match(line)
+        if match:
+            return match.group(1).strip()
+    if MULTI_LEVEL_NUMBER.match(line) or REQUIREMENT_ID.match(line):
+        return line
+    match = SINGLE_LEVEL_NUMBER.match(line) or BARE_NUMBER.match(line)
+    if match:
+        return line if not in_list and _title_like(match.group(2)) else None
+    if UPPERCASE_HEADING.match(line) and sum(c.isalpha() for c in line) >= 4:
+        return line
+    return None
+
+
+def _pack(parts, separator, max_chars):
+    """Join consecutive ``parts`` into pieces of at most ``max_chars``."""
+    pieces = []
+    current = None
+    for part in parts:
+        if current is not None and len(current) + len(separator) + len(part) <= max_chars:
+            current += separator + part
+            continue
+        if current is not None:
+            pieces.append(current)
+        current = part
+    if current is not None:
+        pieces.append(current)
+    return pieces
+
+
+def _split_long(text, max_chars):
+    """Cut ``text`` into pieces of at most ``max_chars``, at paragraphs, then lines."""
+    if len(text) <= max_chars:
+        return [text]
+    parts = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            parts.append(paragraph)
+            continue
+        # One paragraph over the limit: pack its lines, cutting overlong ones
+        lines = []
+        for line in paragraph.split("\n"):
+            lines.extend(line[i:i + max_chars] for i in range(0, max(len(line), 1), max_chars))
+        parts.extend(_pack(lines, "\n", max_chars))
+    return [piece for piece in _pack(parts, "\n\n", max_chars) if piece.strip()]
+
+
+def _first_line_title(text):
+    line = text.strip().split("\n", 1)[0].strip()
+    return line if len(line) <= 80 else line[:77].rstrip() + "..."
+
+
+def segment_requirements(text, max_chars=SEGMENT_MAX_CHARS):
+    """Split ``text`` into ``[{"title", "description", "section"}]`` segments.
+
+    ``section`` is the heading of an enclosing section that had no text of
+    its own ("3 Authentication" above "3.1 Login"), or "". A single line
+    before the first heading is taken as the document title and skipped.
+    """
+    sections = []
+    title = None
+    section = ""
+    body = []
+    in_list = False
+
+    def close(at_heading=True):
+        description = "\n".join(body).strip()
+        document_title = at_heading and title is None and not sections and "\n" not in description
+        if description and not document_title:
+            sections.append((title, section, description))
+        return description
+
+    lines = (text or "").splitlines()
+    # Next non-blank line after each line, to tell a list's first item from a heading
+    following = [""] * len(lines)
+    for index in range(len(lines) - 2, -1, -1):
+        following[index] = lines[index + 1].strip() or following[index + 1]
+
+    for index, line in enumerate(lines):
+        heading = heading_title(line, in_list or bool(LIST_ITEM.match(following[index])))
+        if heading is not None:
+            if not close() and title is not None:
+                # A heading with no text of its own introduces the next ones
+                section = title
+            elif not _within(section, heading):
+                section = ""
+            title = heading
+            body = []
+            in_list = False
+            continue
+        body.append(line.rstrip())
+        if line.strip():
+            # Numbered lines after a list item or an introducing colon are list items
+            in_list = bool(LIST_ITEM.match(line.strip())) or line.rstrip().endswith(":")
+    close(at_heading=False)
+
+    segments = []
+    for title, section, description in sections:
+        pieces = _split_long(description, max_chars)
+        base_title = (title or _first_line_title(description))[:TITLE_MAX_CHARS]
+        for index, piece in enumerate(pieces, 1):
+            segments.append({
+                "title": base_title if len(pieces) == 1 else f"{base_title} ({index}/{len(pieces)})",
+                "description": piece.strip(),
+                "section": section,
+            })
+    return segments
@@ -0,0 +1,148 @@
+"""Row-by-row reading of requirement spreadsheets (CSV and XLSX).
+
+Neither format is loaded as a whole: CSV goes through the csv module over
+the spooled upload, and XLSX through openpyxl's read-only mode, which
+streams rows out of the sheet XML. Columns are matched on their header,
+in French or English, whatever their order.
+
+CSV files are read as UTF-8 (with or without a BOM) when they decode as
+such, and otherwise as cp1252, which Excel uses for "CSV (séparateur:
+point-virgule)" in Western European locales.
+"""
+import codecs
+import csv
+import io
+import os
+import unicodedata
+
+import openpyxl
+
+PRIORITIES = {
+    "high": "high", "haute": "high", "elevee": "high", "critique": "high",
+    "medium": "medium", "moyenne": "medium", "normale": "medium",
+    "low": "low", "basse": "low", "faible": "low",
+}
+
+COLUMNS = {
+    "title": ("title", "titre", "name", "nom", "summary", "resume", "intitule"),
+    "description": ("description", "desc", "details", "detail", "requirement", "exigence", "besoin", "text", "texte"),
+    "category": ("category", "categorie", "type"),
+    "priority": ("priority", "priorite"),
+    "status": ("status", "statut", "etat"),
+}
+
+TITLE_MAX_CHARS = 200
+CSV_DELIMITERS = (",", ";", "\t")
+CSV_FALLBACK_ENCODING = "cp1252"
+ENCODING_CHECK_CHUNK = 64 * 1024
+
+
+def spreadsheet_kind(filename):
+    """Kind of spreadsheet from its file name: csv, xlsx, or None if unsupported."""
+    extension = os.path.splitext((filename or "").lower())[1]
+    return extension[1:] if extension in (".csv", ".xlsx") else None
+
+
+def _normalize(header):
+    text = unicodedata.normalize("NFKD", str(header or "")).encode("ascii", "ignore").decode()
+    return " ".join(text.lower().replace("_", " ").split())
+
+
+def map_columns(headers):
+    """Map field names to column indexes; raises ValueError without a title or description column."""
+    columns = {}
+    for index, header in enumerate(headers):
+        name = _normalize(header)
+        for field, aliases in COLUMNS.items():
+            if field not in columns and name in aliases:
+                columns[field] = index
+    if "title" not in columns and "description" not in columns:
+        raise ValueError("The first row must name a 'title' or 'description' column")
+    return columns
+
+
+def csv_encoding(fileobj):
+    """"utf-8-sig" if the whole file decodes as UTF-8, else cp1252; rewinds ``fileobj``."""
+    start = fileobj.tell()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for chunk in iter(lambda: fileobj.read(ENCODING_CHECK_CHUNK), b""):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return CSV_FALLBACK_ENCODING
+    finally:
+        fileobj.seek(start)
+
+
+def _iter_csv(fileobj):
+    reader = io.TextIOWrapper(fileobj, encoding=csv_encoding(fileobj), newline="")
+    try:
+        # Excel writes ";" in French locales: use whichever separator the header uses most
+        header = reader.readline()
+        reader.seek(0)
+        delimiter = max(CSV_DELIMITERS, key=header.count)
+        yield from csv.reader(reader, delimiter=delimiter)
+    except UnicodeDecodeError:
+        # A few bytes are undefined in cp1252 too
+        raise ValueError("The file is neither UTF-8 nor Windows-1252 text")
+    finally:
+        # Leave the spool file for the caller to close
+        reader.detach()
+
+
+def _iter_xlsx(fileobj):
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_rows(kind, fileobj):
+    """Yield ``(row_number, field_values)`` for each non-empty data row.
+
+    ``row_number`` is the 1-based CSV record or sheet row, header included,
+    so errors can point at it. Raises ValueError if the header is unusable.
+    """
+    rows = _iter_csv(fileobj) if kind == "csv" else _iter_xlsx(fileobj)
+    columns = None
+    for number, row in enumerate(rows, 1):
+        if not any(cell not in (None, "") for cell in row):
+            continue
+        if columns is None:
+            columns = map_columns(row)
+            continue
+        yield number, {
+            field: ("" if index >= len(row) or row[index] is None else str(row[index]).strip())
+            for field, index in columns.items()
+        }
+    if columns is None:
+        raise ValueError("The file is empty")
+
+
+def parse_requirement_row(values):
+    """Validate one row's values; returns the requirement fields or raises ValueError."""
+    title = values.get("title", "")
+    description = values.get("description", "")
+    if not title and not description:
+        raise ValueError("Missing title and description")
+    if not title:
+        title = description.splitlines()[0]
+    if len(title) > TITLE_MAX_CHARS:
+        raise ValueError(f"Title is longer than {TITLE_MAX_CHARS} characters")
+
+    priority = values.get("priority", "")
+    if priority:
+        priority = PRIORITIES.get(_normalize(priority))
+        if priority is None:
+            raise ValueError(f"Unknown priority {values['priority']!r} (expected high, medium or low)")
+
+    return {
+        "title": title,
+        "description": description,
+        "category": values.get("category") or "functionality",
+        "priority": priority or None,
+        "status": values.get("status") or "draft",
+    }
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+
+SSE_DONE = "data: [DONE]\n\n"
+
+SSE_COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_WINDOW_MS", 30)) / 1000
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", 512))
+
+
+def sse_event(payload):
+    """Format a payload as a single server-sent event frame."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class DeltaCoalescer:
+    """Batch model text deltas into fewer, larger ``chunk`` frames.
+
+    The first delta is sent at once so time-to-first-token is unchanged.
+    After that, deltas are held until ``max_chars`` are pending or ``window``
+    seconds have passed since the oldest pending one. The check happens when
+    a delta arrives, and flush() sends whatever is left at the end of the
+    stream. The full text is kept as a list of parts and joined once.
+    """
+
+    def __init__(self, window=SSE_COALESCE_WINDOW, max_chars=SSE_COALESCE_MAX_CHARS, key="chunk", tags=None):
+        self.window = window
+        self.max_chars = max_chars
+        self.key = key
+        self.tags = tags or {}
+        self.parts = []
+        self.frames = 0
+        self._pending_from = 0
+        self._pending_chars = 0
+        self._pending_since = None
+
+    def add(self, text):
+        """Buffer a delta; returns a frame when the batch is due, else None."""
+        self.parts.append(text)
+        self._pending_chars += len(text)
+        now = time.monotonic()
+        if self._pending_since is None:
+            self._pending_since = now
+        if (
+            self.frames == 0
+            or self._pending_chars >= self.max_chars
+            or now - self._pending_since >= self.window
+        ):
+            return self.flush()
+        return None
+
+    def pending_text(self):
+        return "".join(self.parts[self._pending_from:])
+
+    def flush(self):
+        """Return a frame with every pending delta, or None if there are none."""
+        if self._pending_from == len(self.parts):
+            return None
+        payload = dict(self.tags)
+        payload[self.key] = self.pending_text()
+        self._pending_from = len(self.parts)
+        self._pending_chars = 0
+        self._pending_since = None
+        self.frames += 1
+        return sse_event(payload)
+
+    def text(self):
+        return "".join(self.parts)
+
+
+CODE_FENCE = "```"
+
+
+class CodeBlockParser:
+    """Find the first fenced code block in streamed text as deltas arrive.
+
+    Matches what ``re.search(r'```(?:.*?)\\n([\\s\\S]*?)```', text)`` finds in
+    the full text: the info string runs to the end of the opening fence's
+    line, and the block ends at the next fence. ``feed`` returns the stripped
+    block once, when its closing fence comes in. Up to two trailing
+    backticks are held back between deltas in case a fence is split.
+    """
+
+    TEXT, INFO, BODY, CLOSED = range(4)
+
+    def __init__(self):
+        self.state = self.TEXT
+        self.block = None
+        self._body = []
+        self._carry = ""
+
+    @property
+    def closed(self):
+        return self.state == self.CLOSED
+
+    def _hold_backticks(self, text):
+        held = len(text) - len(text.rstrip("`"))
+        held = min(held, len(CODE_FENCE) - 1)
+        return text[:len(text) - held], text[len(text) - held:]
+
+    def feed(self, text):
+        """Consume a delta; returns the block when it closes, else None."""
+        if self.state == self.CLOSED:
+            return None
+        buffer = self._carry + text
+        self._carry = ""
+        while buffer:
+            if self.state == self.TEXT:
+                index = buffer.find(CODE_FENCE)
+                if index < 0:
+                    self._carry = self._hold_backticks(buffer)[1]
+                    return None
+                buffer = buffer[index + len(CODE_FENCE):]
+                self.state = self.INFO
+            elif self.state == self.INFO:
+                index = buffer.find("\n")
+                if index < 0:
+                    return None
+                buffer = buffer[index + 1:]
+                self.state = self.BODY
+            else:
+                index = buffer.find(CODE_FENCE)
+                if index < 0:
+                    body, self._carry = self._hold_backticks(buffer)
+                    self._body.append(body)
+                    return None
+                self._body.append(buffer[:index])
+                self.state = self.CLOSED
+                self.block = "".join(self._body).strip()
+                self._body = []
+                return self.block
+        return None
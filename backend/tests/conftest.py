@@ -0,0 +1,71 @@
+"""Fixtures for the backend tests.
+
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+
+Tests run on mongomock, or on the MongoDB server at MONGO_TEST_URI when it
+is set (for the aggregation operators mongomock doesn't implement).
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLLECTIONS = {
+    "history_collection": "chat_history",
+    "users_collection": "users",
+    "projects_collection": "projects",
+    "requirements_collection": "requirements",
+    "versions_collection": "versions",
+    "collaborators_collection": "collaborators",
+    "api_keys_collection": "api_keys",
+    "conversations_collection": "conversations",
+}
+
+
+@pytest.fixture
+def database():
+    """A MongoDB database at MONGO_TEST_URI, dropped afterwards, or mongomock without it."""
+    uri = os.getenv("MONGO_TEST_URI")
+    if not uri:
+        import mongomock
+        yield mongomock.MongoClient()["test_db"]
+        return
+    import pymongo
+    client = pymongo.MongoClient(uri)
+    client.drop_database("chat_app_test")
+    yield client["chat_app_test"]
+    client.drop_database("chat_app_test")
+    client.close()
+
+
+@pytest.fixture
+def backend(database, monkeypatch):
+    """The app module with its collections on ``database`` and rate limits off."""
+    import admin
+    import app
+    import conversations
+    import versions
+
+    for attribute, name in COLLECTIONS.items():
+        for module in (app, admin, versions, conversations):
+            if hasattr(module, attribute):
+                monkeypatch.setattr(module, attribute, database[name])
+    monkeypatch.setattr(app.limiter, "enabled", False)
+    caches = (app.project_access_cache, admin.user_profiles)
+    for cache in caches:
+        cache.clear()
+    yield app
+    for cache in caches:
+        cache.clear()
+
+
+@pytest.fixture
+def client(backend):
+    """A test client logged in as user@example.com."""
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = "user@example.com"
+    return client
@@ -0,0 +1,109 @@
+import pytest
+
+import conversations
+
+
+@pytest.fixture(autouse=True)
+def collection(database, monkeypatch):
+    collection = database["conversations"]
+    collection.create_index([("user", 1), ("key", 1)], unique=True)
+    monkeypatch.setattr(conversations, "conversations_collection", collection)
+    monkeypatch.setattr(conversations, "CHAT_HISTORY_TOKEN_BUDGET", 100)
+    monkeypatch.setattr(conversations, "CHAT_SUMMARY_TOKEN_BUDGET", 1000)
+    return collection
+
+
+def exchange(index, chars=80):
+    """An exchange of ``chars`` characters, ``chars // 4`` tokens."""
+    return conversations._exchange(f"q{index}".ljust(chars // 2, "."), f"a{index}".ljust(chars // 2, "."))
+
+
+def conversation(exchanges, summary=None):
+    return {"user": "u", "key": "history:h", "exchanges": exchanges, "summary": summary or [], "revision": 0}
+
+
+def test_trim_leaves_conversation_within_budget_alone():
+    exchanges = [exchange(i) for i in range(5)]  # 5 x 20 tokens, exactly the budget
+    trimmed = conversations.trim(conversation(list(exchanges)))
+    assert trimmed["exchanges"] == exchanges
+    assert trimmed["summary"] == []
+
+
+def test_trim_folds_oldest_exchanges_until_half_the_budget():
+    trimmed = conversations.trim(conversation([exchange(i) for i in range(6)]))
+    assert [e["user"][:2] for e in trimmed["exchanges"]] == ["q4", "q5"]
+    assert sum(e["tokens"] for e in trimmed["exchanges"]) <= conversations.CHAT_HISTORY_TOKEN_BUDGET // 2
+    assert len(trimmed["summary"]) == 4
+    assert trimmed["summary"][0].startswith("- User: q0")
+
+
+def test_trim_keeps_the_latest_exchange():
+    trimmed = conversations.trim(conversation([exchange(0, chars=800)]))
+    assert len(trimmed["exchanges"]) == 1
+    assert trimmed["summary"] == []
+
+
+def test_trim_drops_oldest_summary_lines_past_the_summary_budget(monkeypatch):
+    monkeypatch.setattr(conversations, "CHAT_SUMMARY_TOKEN_BUDGET", 60)
+    summary = [f"- User: old {i}\n  Assistant: {'x' * 60}" for i in range(3)]
+    trimmed = conversations.trim(conversation([exchange(i) for i in range(6)], summary))
+    text = "\n".join(trimmed["summary"])
+    assert conversations.estimate_tokens(text) <= conversations.CHAT_SUMMARY_TOKEN_BUDGET
+    assert "old 0" not in text
+    assert trimmed["summary"][-1].startswith("- User: q3")
+
+
+def test_seed_pairs_questions_with_answers():
+    exchanges = conversations.seed_exchanges([
+        {"role": "assistant", "content": "Hello"},  # no question before it
+        {"role": "user", "content": "first"},
+        {"role": "user", "content": "second"},
+        {"role": "assistant", "content": "answer"},
+        {"role": "assistant", "content": "more"},
+        {"role": "user", "content": "third"},
+        {"role": "assistant", "content": "```\nScenario (1): x\n```"},
+        {"role": "user", "content": "unanswered"},
+    ])
+    assert [(e["user"], e["assistant"]) for e in exchanges] == [
+        ("first\n\nsecond", "answer\n\nmore"),
+        ("third", conversations.CODE_BLOCK_PLACEHOLDER),
+    ]
+
+
+def test_seed_skips_malformed_messages():
+    exchanges = conversations.seed_exchanges([
+        "text", {"role": "user"}, {"role": "user", "content": 1},
+        {"role": "user", "content": "q"}, {"role": "assistant", "content": "a"},
+    ])
+    assert [(e["user"], e["assistant"]) for e in exchanges] == [("q", "a")]
+
+
+def test_append_exchange_saves_and_reloads():
+    saved = conversations.append_exchange(conversations.load("u", "history:h"), "q", "a")
+    assert saved["revision"] == 1
+    loaded = conversations.load("u", "history:h")
+    assert [(e["user"], e["assistant"]) for e in loaded["exchanges"]] == [("q", "a")]
+
+
+def test_append_exchange_retries_on_top_of_a_concurrent_save():
+    conversations.append_exchange(conversations.load("u", "history:h"), "q0", "a0")
+    first = conversations.load("u", "history:h")
+    second = conversations.load("u", "history:h")
+    conversations.append_exchange(first, "q1", "a1")
+    saved = conversations.append_exchange(second, "q2", "a2")
+
+    assert saved["revision"] == 3
+    stored = conversations.load("u", "history:h")
+    assert [e["user"] for e in stored["exchanges"]] == ["q0", "q1", "q2"]
+
+
+def test_append_exchange_retries_when_another_request_created_it_first():
+    first = conversations.load("u", "history:h")
+    second = conversations.load("u", "history:h")
+    conversations.append_exchange(first, "q1", "a1")
+    conversations.append_exchange(second, "q2", "a2")
+
+    stored = conversations.load("u", "history:h")
+    assert stored["revision"] == 2
+    assert [e["user"] for e in stored["exchanges"]] == ["q1", "q2"]
+
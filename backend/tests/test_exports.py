@@ -0,0 +1,97 @@
+import io
+from datetime import datetime, timezone
+
+import docx
+import openpyxl
+import pytest
+
+from exports import XLSX_COLUMNS, iter_export
+from scenarios import test_case_fields as history_fields
+
+TEST_CASES = """Scenario (1): Successful login
+Precondition: User is registered.
+Steps:
+    1. Open the login page.
+    2. Enter valid credentials.
+Expected Result: The home page is shown.
+
+Scenario (2): Wrong password
+Steps:
+    1. Enter a wrong password.
+Expected Result: An error is shown.
+"""
+GENERATED = datetime(2026, 1, 2, 3, 4, tzinfo=timezone.utc)
+
+
+def records():
+    return [
+        ({"id": "r1", "title": "Login", "priority": "high"},
+         {**history_fields(TEST_CASES), "timestamp": GENERATED}),
+        # Text extracted from uploads can carry control characters
+        ({"id": "r2", "title": "Logout\x0b page", "priority": "low"},
+         {"test_cases": "Check that the user\x01 is logged out.\n\nCheck the session is closed.",
+          "timestamp": GENERATED}),
+    ]
+
+
+def export(export_format):
+    chunks = list(iter_export(export_format, {"name": "Banking\x07 app"}, records()))
+    assert all(chunks)
+    return chunks, b"".join(chunks)
+
+
+def test_xlsx_export():
+    _, data = export("xlsx")
+    rows = list(openpyxl.load_workbook(io.BytesIO(data)).active.iter_rows(values_only=True))
+    assert list(rows[0]) == XLSX_COLUMNS
+    assert [row[:5] for row in rows[1:3]] == [
+        ("r1", "Login", "high", 1, "Successful login"),
+        ("r1", "Login", "high", 2, "Wrong password"),
+    ]
+    assert rows[1][6] == "1. Open the login page.\n2. Enter valid credentials."
+    assert rows[1][8] == "2026-01-02 03:04"
+    assert rows[3][:2] == ("r2", "Logout page")
+    assert rows[3][6] == "Check that the user is logged out.\n\nCheck the session is closed."
+
+
+def test_docx_export_is_sent_while_written():
+    chunks, data = export("docx")
+    assert len(chunks) > 1
+    paragraphs = [paragraph.text for paragraph in docx.Document(io.BytesIO(data)).paragraphs]
+    assert paragraphs[0] == "Banking app"
+    assert "Scenario (1): Successful login" in paragraphs
+    assert "2. Enter valid credentials." in paragraphs
+    assert "Logout page" in paragraphs
+    assert "Check that the user is logged out." in paragraphs
+
+
+def test_pdf_export():
+    _, data = export("pdf")
+    assert data.startswith(b"%PDF-")
+    assert data.rstrip().endswith(b"%%EOF")
+
+
+def test_export_endpoint_uses_latest_item_per_requirement(backend, client):
+    backend.projects_collection.insert_one({"id": "p1", "user": "user@example.com", "name": "Banking", "collaborators": []})
+    backend.requirements_collection.insert_many([
+        {"id": "r1", "project_id": "p1", "title": "Login", "created_at": "2026-01-01"},
+        {"id": "r2", "project_id": "p1", "title": "Logout", "created_at": "2026-01-02"},
+        {"id": "r3", "project_id": "p1", "title": "No test cases", "created_at": "2026-01-03"},
+    ])
+    backend.history_collection.insert_many([
+        {"project_id": "p1", "requirement_id": "r1", "test_cases": "old", "timestamp": datetime(2026, 1, 1)},
+        {"project_id": "p1", "requirement_id": "r1", "test_cases": "new", "timestamp": datetime(2026, 1, 2)},
+        {"project_id": "p1", "requirement_id": "r2", "test_cases": "logout", "timestamp": datetime(2026, 1, 1)},
+    ])
+
+    response = client.get("/projects/p1/export?format=xlsx")
+    assert response.status_code == 200
+    assert response.headers["Content-Disposition"] == 'attachment; filename="Banking-test-cases.xlsx"'
+    rows = list(openpyxl.load_workbook(io.BytesIO(response.data)).active.iter_rows(values_only=True))
+    assert [(row[0], row[6]) for row in rows[1:]] == [("r1", "new"), ("r2", "logout")]
+
+
+@pytest.mark.parametrize("export_format", ["csv", "XLSX "])
+def test_export_endpoint_rejects_unknown_formats(backend, client, export_format):
+    backend.projects_collection.insert_one({"id": "p1", "user": "user@example.com", "collaborators": []})
+    assert client.get(f"/projects/p1/export?format={export_format}").status_code == 400
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+USER = "user@example.com"
+T0 = datetime(2026, 3, 1, 12, 0, 0)
+
+
+def add_items(backend):
+    """Six items, newest first in (timestamp, _id) order; three share a timestamp."""
+    timestamps = [T0 + timedelta(minutes=2), T0 + timedelta(minutes=1), T0, T0, T0, T0 - timedelta(minutes=1)]
+    ids = sorted((ObjectId() for _ in timestamps), reverse=True)
+    backend.history_collection.insert_many([
+        {"_id": object_id, "user": USER, "timestamp": timestamp, "test_cases": f"Scenario {index}",
+         "project_id": "p1"}
+        for index, (object_id, timestamp) in enumerate(zip(ids, timestamps))
+    ])
+    # Not a test case record, and another user's item
+    backend.history_collection.insert_many([
+        {"user": USER, "timestamp": T0, "message": "chat"},
+        {"user": "other@example.com", "timestamp": T0, "test_cases": "theirs"},
+    ])
+    return [str(object_id) for object_id in ids]
+
+
+def test_cursor_pages_through_equal_timestamps(backend, client):
+    ids = add_items(backend)
+    seen = []
+    cursor = None
+    for _ in range(len(ids)):
+        query = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/history", query_string=query).get_json()
+        assert "error" not in page
+        seen += [item["_id"] for item in page["history"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ids
+
+
+def test_cursor_encodes_the_last_item(backend, client):
+    ids = add_items(backend)
+    page = client.get("/history", query_string={"limit": 3}).get_json()
+    assert [item["_id"] for item in page["history"]] == ids[:3]
+    assert backend.decode_history_cursor(page["next_cursor"]) == (T0, ObjectId(ids[2]))
+    assert backend.encode_history_cursor({"timestamp": T0, "_id": ObjectId(ids[2])}) == page["next_cursor"]
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "WzFd", "WyIyMDI2LTAzLTAxIiwgIngiXQ=="])
+def test_invalid_cursor_is_rejected(backend, client, cursor):
+    response = client.get("/history", query_string={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid cursor"
+
+
+def test_summary_view(backend, client, database):
+    probe = database["probe"]
+    probe.insert_one({"text": "abc"})
+    try:
+        list(probe.aggregate([{"$project": {"preview": {"$substrCP": ["$text", 0, 2]}}}]))
+    except NotImplementedError:
+        pytest.skip("$substrCP needs a MongoDB server: set MONGO_TEST_URI")
+
+    backend.history_collection.insert_many([
+        {"user": USER, "timestamp": T0, "test_cases": "é" * 300, "requirement_title": "Plain"},
+        {"user": USER, "timestamp": T0 - timedelta(minutes=1), "requirement_title": "Structured",
+         "test_cases_preamble": "", "scenarios": [{"text": "Scenario (1): Login\n"}, {"text": "Scenario (2)"}]},
+    ])
+    history = client.get("/history", query_string={"view": "summary"}).get_json()["history"]
+    plain, structured = history
+    assert plain["preview"] == "é" * backend.HISTORY_PREVIEW_CHARS
+    assert plain["scenario_count"] == 0
+    assert "test_cases" not in plain
+    assert structured["preview"] == "Scenario (1): Login\n"
+    assert structured["scenario_count"] == 2
+    assert "scenarios" not in structured
@@ -0,0 +1,47 @@
+import language
+
+ENGLISH_REQUIREMENT = "The user must be able to reset their password from the login page using their email address."
+ENGLISH_CONTEXT = ("A mobile banking application that lets customers check their balances, transfer money "
+                   "between their own accounts, pay bills and manage their cards. Every action must be logged "
+                   "and confirmed by a one-time code sent by text message.")
+
+
+def add_project(backend, context="", language=None):
+    backend.projects_collection.insert_one({
+        "id": "p1", "user": "user@example.com", "name": "Mobile banking", "context": context,
+        "language": language, "collaborators": [],
+    })
+
+
+def test_short_context_is_not_detected():
+    assert language.context_language("") is None
+    assert language.context_language("Mobile banking") is None
+    assert language.context_language(ENGLISH_CONTEXT) == "en"
+
+
+def test_english_requirement_in_project_without_context(backend):
+    # Name-only detection used to store "fr" on projects like this one
+    add_project(backend, language="fr")
+    lang = backend.project_language("user@example.com", "p1")
+    assert lang is None
+
+    system, _ = backend.generate_test_case_prompt(ENGLISH_REQUIREMENT, "default", lang=lang)
+    assert "Scenario (1)" in system
+    assert backend.projects_collection.find_one({"id": "p1"})["language"] == "fr"
+
+
+def test_project_language_is_detected_from_context_and_stored(backend):
+    add_project(backend, context=ENGLISH_CONTEXT)
+    assert backend.project_language("user@example.com", "p1") == "en"
+    assert backend.projects_collection.find_one({"id": "p1"})["language"] == "en"
+
+
+def test_project_language_needs_access(backend):
+    add_project(backend, context=ENGLISH_CONTEXT, language="en")
+    assert backend.project_language("other@example.com", "p1") is None
+
+
+def test_new_project_without_context_stores_no_language(backend, client):
+    response = client.post("/projects", json={"name": "Login app", "context": ""})
+    assert response.status_code in (200, 201)
+    assert backend.projects_collection.find_one({"name": "Login app"})["language"] is None
@@ -0,0 +1,98 @@
+import scenarios
+
+ENGLISH = """Here are the test cases:
+
+**Login**
+
+Scenario (1): Successful login
+Precondition: User is registered.
+Steps:
+    1. Open the login page.
+    2. Enter valid credentials
+       and submit.
+Expected Result: The home page is shown.
+
+Scenario (2): Wrong password
+Steps:
+    1. Enter a wrong password.
+Expected Result: An error is shown.
+"""
+
+FRENCH = """Scénario (1) : Connexion réussie
+Précondition : L'utilisateur est inscrit.
+Etapes :
+    1. Ouvrir la page de connexion.
+Résultat attendu : La page d'accueil s'affiche.
+"""
+
+GHERKIN = """Feature: Login
+
+  Scenario: Successful login
+    Given a registered user
+    When they sign in
+    Then the home page is shown
+    And a welcome message appears
+"""
+
+
+def test_render_parse_round_trip():
+    for text in (ENGLISH, FRENCH, GHERKIN):
+        fields = scenarios.test_case_fields(text)
+        assert "scenarios" in fields
+        assert scenarios.render_test_cases(fields) == text
+
+
+def test_parse_splits_preamble_and_section_headings():
+    preamble, parsed = scenarios.parse_scenarios(ENGLISH)
+    assert preamble == "Here are the test cases:\n\n**Login**\n\n"
+    assert [s["number"] for s in parsed] == [1, 2]
+    assert parsed[1]["prefix"] == ""
+
+    preamble, parsed = scenarios.parse_scenarios(ENGLISH.replace("Scenario (2)", "**Errors**\n\nScenario (2)"))
+    assert parsed[0]["text"].endswith("The home page is shown.\n\n")
+    assert parsed[1]["prefix"] == "**Errors**\n\n"
+
+
+def test_parse_fields():
+    _, (first, second) = scenarios.parse_scenarios(ENGLISH)
+    assert first["title"] == "Successful login"
+    assert first["precondition"] == "User is registered."
+    assert first["steps"] == ["Open the login page.", "Enter valid credentials and submit."]
+    assert first["expected_result"] == "The home page is shown."
+    assert second["precondition"] == ""
+
+    _, (french,) = scenarios.parse_scenarios(FRENCH)
+    assert french["format"] == "fr"
+    assert french["expected_result"] == "La page d'accueil s'affiche."
+
+    _, (gherkin,) = scenarios.parse_scenarios(GHERKIN)
+    assert gherkin["format"] == "gherkin"
+    assert gherkin["steps"] == ["Given a registered user", "When they sign in"]
+    assert gherkin["expected_result"] == "Then the home page is shown\nAnd a welcome message appears"
+
+
+def test_text_without_scenarios_stays_plain():
+    assert scenarios.parse_scenarios("") is None
+    assert scenarios.test_case_fields("Just some notes.") == {"test_cases": "Just some notes."}
+    assert scenarios.render_test_cases({"test_cases": "Just some notes."}) == "Just some notes."
+
+
+def test_update_scenario_fields_rerenders_and_keeps_separator():
+    _, (first, _) = scenarios.parse_scenarios(ENGLISH)
+    updated = scenarios.update_scenario(first, {"title": "Login works"})
+    assert updated["text"].startswith("Scenario (1): Login works\n")
+    assert updated["text"].endswith("\n\n")
+    assert scenarios.parse_scenario(updated["text"])["steps"] == first["steps"]
+
+
+def test_changes_only_touch_edited_scenarios():
+    doc = scenarios.test_case_fields(ENGLISH)
+    edited = ENGLISH.replace("An error is shown.", "An error message is shown.")
+    changes, unset = scenarios.test_case_changes(doc, edited)
+    assert list(changes) == ["scenarios.1"]
+    assert changes["scenarios.1"]["id"] == doc["scenarios"][1]["id"]
+    assert unset == {}
+
+    changes, unset = scenarios.test_case_changes(doc, FRENCH)
+    assert set(changes) == {"test_cases_preamble", "scenarios"}
+    assert unset == {"test_cases": ""}
@@ -0,0 +1,73 @@
+from segmentation import heading_title, segment_requirements
+
+SPEC = """Mobile banking specification
+
+This document describes the requirements of the mobile banking app.
+It is maintained by the product team.
+
+3 Authentication
+
+3.1 Login
+The user logs in with an email and a password.
+
+3.2 Password reset
+The user can reset their password by email.
+
+4 Payments
+Payments are confirmed by a one-time code.
+"""
+
+
+def summary(segments):
+    return [(segment["title"], segment["section"]) for segment in segments]
+
+
+def test_numbered_headings_with_and_without_dots():
+    assert heading_title("3 Authentication") == "3 Authentication"
+    assert heading_title("3. Authentication") == "3. Authentication"
+    assert heading_title("3) Authentication") == "3) Authentication"
+    assert heading_title("2 Paiement") == "2 Paiement"
+    assert heading_title("3.1 Login") == "3.1 Login"
+    assert heading_title("3.1. Login") == "3.1. Login"
+
+
+def test_sentences_and_list_items_are_not_headings():
+    assert heading_title("10 users can connect at the same time") is None
+    assert heading_title("3 Authentication", in_list=True) is None
+    assert heading_title("1. Open the login page.") is None
+
+
+def test_segments_with_preamble_and_sub_headings():
+    segments = segment_requirements(SPEC)
+    assert summary(segments) == [
+        ("Mobile banking specification", ""),
+        ("3.1 Login", "3 Authentication"),
+        ("3.2 Password reset", "3 Authentication"),
+        ("4 Payments", ""),
+    ]
+    assert segments[0]["description"].startswith("Mobile banking specification")
+    assert segments[1]["description"] == "The user logs in with an email and a password."
+
+
+def test_bare_number_heading_starts_a_new_requirement():
+    segments = segment_requirements(
+        "1 Connexion\nL'utilisateur se connecte avec son e-mail.\n\n"
+        "2 Paiement\nLe paiement est confirmé par un code.\n"
+    )
+    assert summary(segments) == [("1 Connexion", ""), ("2 Paiement", "")]
+    assert segments[0]["description"] == "L'utilisateur se connecte avec son e-mail."
+
+
+def test_numbered_steps_stay_in_their_requirement():
+    segments = segment_requirements(
+        "1. Login\nThe user logs in:\n1. Open the page\n2. Enter the password\nThe home page opens.\n\n"
+        "2. Logout\nThe user logs out.\n"
+    )
+    assert summary(segments) == [("1. Login", ""), ("2. Logout", "")]
+    assert "2. Enter the password" in segments[0]["description"]
+
+
+def test_text_without_headings_is_one_segment():
+    segments = segment_requirements("the user logs in.\nthe user logs out.")
+    assert len(segments) == 1
+    assert segments[0]["title"] == "the user logs in."
@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+from spreadsheets import iter_rows, parse_requirement_row
+
+CSV = "Titre;Description;Priorité\nConnexion;L'utilisateur se connecte à son espace;Élevée\nDéconnexion;Fin de session;basse\n"
+EXPECTED = [
+    (2, {"title": "Connexion", "description": "L'utilisateur se connecte à son espace", "priority": "Élevée"}),
+    (3, {"title": "Déconnexion", "description": "Fin de session", "priority": "basse"}),
+]
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "cp1252"])
+def test_csv_encodings(encoding):
+    assert list(iter_rows("csv", io.BytesIO(CSV.encode(encoding)))) == EXPECTED
+
+
+def test_csv_delimiter_follows_the_header():
+    rows = list(iter_rows("csv", io.BytesIO(b'title,description\nLogin,"Email, then password"\n')))
+    assert rows == [(2, {"title": "Login", "description": "Email, then password"})]
+
+
+def test_csv_with_undefined_bytes_is_rejected():
+    with pytest.raises(ValueError, match="neither UTF-8 nor Windows-1252"):
+        list(iter_rows("csv", io.BytesIO(b"title\nLogin \x81\n")))
+
+
+def test_csv_without_known_columns_is_rejected():
+    with pytest.raises(ValueError, match="'title' or 'description'"):
+        list(iter_rows("csv", io.BytesIO(b"foo;bar\n1;2\n")))
+
+
+def test_parse_requirement_row():
+    assert parse_requirement_row({"description": "Login\nwith email", "priority": "Élevée"}) == {
+        "title": "Login", "description": "Login\nwith email", "category": "functionality",
+        "priority": "high", "status": "draft",
+    }
+    with pytest.raises(ValueError, match="Unknown priority"):
+        parse_requirement_row({"title": "Login", "priority": "urgent-ish"})
+
+
+def test_import_excel_csv(backend, client):
+    backend.projects_collection.insert_one({"id": "p1", "user": "user@example.com", "collaborators": []})
+    response = client.post("/projects/p1/requirements/import", data={
+        "file": (io.BytesIO(CSV.encode("cp1252")), "exigences.csv"),
+    })
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 2
+    titles = {r["title"]: r["priority"] for r in backend.requirements_collection.find({"project_id": "p1"})}
+    assert titles == {"Connexion": "high", "Déconnexion": "low"}
@@ -0,0 +1,20 @@
+import pytest
+
+ENDPOINTS = ["/generation_cache/stats", "/extraction_cache/stats", "/generation_usage/stats"]
+
+
+@pytest.fixture
+def admin_client(backend):
+    backend.users_collection.insert_one({"username": "admin@example.com", "role": "admin"})
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = "admin@example.com"
+    return client
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_stats_need_an_admin(backend, client, admin_client, endpoint):
+    backend.users_collection.insert_one({"username": "user@example.com", "role": "user"})
+    assert backend.app.test_client().get(endpoint).status_code == 401
+    assert client.get(endpoint).status_code == 403
+    assert admin_client.get(endpoint).status_code == 200
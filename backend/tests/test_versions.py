@@ -0,0 +1,62 @@
+import pytest
+
+import versions
+
+
+@pytest.fixture(autouse=True)
+def collection(database, monkeypatch):
+    collection = database["versions"]
+    collection.create_index([("history_id", 1), ("version", 1)], unique=True)
+    monkeypatch.setattr(versions, "versions_collection", collection)
+    monkeypatch.setattr(versions, "VERSION_SNAPSHOT_INTERVAL", 3)
+    return collection
+
+
+def text(version):
+    lines = [f"Scenario ({i}): step {i}\n" for i in range(1, 6)]
+    lines[version % 5] = f"Scenario ({version % 5 + 1}): edited in v{version}\n"
+    return "".join(lines) + f"Notes for v{version}\n" * (version % 2)
+
+
+def test_delta_round_trip():
+    old, new = text(1), text(2)
+    assert versions.apply_delta(old, versions.compute_delta(old, new)) == new
+    assert versions.compute_delta(old, old) == []
+
+
+def test_rebuild_across_snapshot_boundaries(collection):
+    for version in range(1, 9):
+        assert versions.record_version("h", text(version)) == version
+
+    kinds = [d["kind"] for d in collection.find({"history_id": "h"}).sort("version", 1)]
+    assert kinds == ["snapshot", "delta", "delta"] * 2 + ["snapshot", "delta"]
+    for version in range(1, 9):
+        assert versions.rebuild("h", version) == text(version)
+    assert versions.get_version("h", 5)["text"] == text(5)
+    assert versions.get_version("h", 9) is None
+    assert versions.rebuild("h", 9) is None
+
+
+def test_first_edit_keeps_the_original_as_version_one():
+    assert versions.record_version("h", text(2), previous_text=text(1), previous_metadata={"source": "generated"},
+                                   source="edit") == 2
+    first, second = versions.list_versions("h")
+    assert (first["source"], second["source"]) == ("generated", "edit")
+    assert versions.rebuild("h", 1) == text(1)
+    assert versions.rebuild("h", 2) == text(2)
+
+
+def test_unchanged_text_records_nothing():
+    versions.record_version("h", text(1))
+    assert versions.record_version("h", text(1)) == 1
+    assert len(versions.list_versions("h")) == 1
+
+
+def test_diff_versions():
+    versions.record_version("h", text(1))
+    versions.record_version("h", text(2))
+    diff = versions.diff_versions("h", 1, 2)
+    assert diff.startswith("--- v1\n+++ v2\n")
+    assert "+Scenario (3): edited in v2\n" in diff
+    assert versions.diff_versions("h", 1, 1) == ""
+    assert versions.diff_versions("h", 1, 3) is None
@@ -0,0 +1,78 @@
+"""Token usage and latency of model calls, to measure prompt caching.
+
+Every call's input, cache write, cache read and output token counts are
+logged and added to totals per kind of call (test cases, chat, ...) for
+this worker process, served to admins by GET /generation_usage/stats. Time
+to first token is averaged separately for calls that did and didn't read
+from the prompt cache, since that is where a cache hit shows. Streams closed
+before the API reported their output count carry an estimate instead,
+counted in ``estimated_output_calls``.
+"""
+import threading
+
+USAGE_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+
+def usage_counts(usage):
+    """Token counts of an API ``usage`` object or dict, missing fields as 0."""
+    if usage is None:
+        return dict.fromkeys(USAGE_FIELDS, 0)
+    if isinstance(usage, dict):
+        return {field: usage.get(field) or 0 for field in USAGE_FIELDS}
+    return {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+
+
+class UsageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def record(self, kind, usage, first_token_seconds=None, seconds=None, estimated=False):
+        counts = usage_counts(usage)
+        cached = counts["cache_read_input_tokens"] > 0
+        print(
+            f"Model usage ({kind}): input={counts['input_tokens']} "
+            f"cache_write={counts['cache_creation_input_tokens']} cache_read={counts['cache_read_input_tokens']} "
+            f"output={counts['output_tokens']}{' (estimated)' if estimated else ''}"
+            + (f" first_token={first_token_seconds:.3f}s" if first_token_seconds is not None else "")
+            + (f" total={seconds:.3f}s" if seconds is not None else "")
+        )
+        with self._lock:
+            totals = self._kinds.setdefault(kind, {
+                "calls": 0,
+                "cache_hits": 0,
+                "estimated_output_calls": 0,
+                **dict.fromkeys(USAGE_FIELDS, 0),
+                "first_token": {"cached": [0, 0.0], "uncached": [0, 0.0]},
+            })
+            totals["calls"] += 1
+            totals["cache_hits"] += cached
+            totals["estimated_output_calls"] += estimated
+            for field in USAGE_FIELDS:
+                totals[field] += counts[field]
+            if first_token_seconds is not None:
+                timing = totals["first_token"]["cached" if cached else "uncached"]
+                timing[0] += 1
+                timing[1] += first_token_seconds
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for kind, totals in self._kinds.items():
+                prompt_tokens = sum(totals[field] for field in USAGE_FIELDS[:3])
+                result[kind] = {
+                    **{key: value for key, value in totals.items() if key != "first_token"},
+                    "cache_read_ratio": totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+                    "mean_first_token_seconds": {
+                        name: total / count if count else None
+                        for name, (count, total) in totals["first_token"].items()
+                    },
+                }
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._kinds.clear()
+
+
+generation_usage = UsageStats()
@@ -0,0 +1,153 @@
+"""Revision history for test cases, stored as deltas on versions_collection.
+
+Every edit of a history item records a version. Most versions hold only the
+line ranges that changed since the previous one; every
+VERSION_SNAPSHOT_INTERVAL versions a full snapshot is stored instead, so
+rebuilding any version replays at most that many deltas.
+"""
+import difflib
+import os
+from datetime import datetime, timezone
+
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+# Injected by app.py
+versions_collection = None
+
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", 10))
+
+METADATA_PROJECTION = {"_id": 0, "ops": 0, "text": 0}
+
+
+def compute_delta(old_text, new_text):
+    """Line ranges of ``old_text`` to replace, as ``[start, end, new_text]``."""
+    old_lines = old_text.splitlines(keepends=True)
+    new_lines = new_text.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        [i1, i2, "".join(new_lines[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_delta(old_text, ops):
+    old_lines = old_text.splitlines(keepends=True)
+    parts = []
+    position = 0
+    for start, end, text in ops:
+        parts.extend(old_lines[position:start])
+        parts.append(text)
+        position = end
+    parts.extend(old_lines[position:])
+    return "".join(parts)
+
+
+def latest_version(history_id):
+    return versions_collection.find_one(
+        {"history_id": history_id},
+        METADATA_PROJECTION,
+        sort=[("version", DESCENDING)]
+    )
+
+
+def rebuild(history_id, version):
+    """Text of ``version``, replayed from the nearest snapshot at or before it.
+
+    Returns None if the version doesn't exist.
+    """
+    snapshot = versions_collection.find_one(
+        {"history_id": history_id, "version": {"$lte": version}, "kind": "snapshot"},
+        sort=[("version", DESCENDING)]
+    )
+    if not snapshot:
+        return None
+    text = snapshot["text"]
+    replayed = snapshot["version"]
+    deltas = versions_collection.find(
+        {"history_id": history_id, "version": {"$gt": snapshot["version"], "$lte": version}},
+        {"_id": 0, "version": 1, "ops": 1}
+    ).sort("version", 1)
+    for delta in deltas:
+        text = apply_delta(text, delta["ops"])
+        replayed = delta["version"]
+    return text if replayed == version else None
+
+
+def _insert_version(history_id, version, text, previous_text, metadata):
+    document = {
+        "history_id": history_id,
+        "version": version,
+        "timestamp": metadata.get("timestamp") or datetime.now(timezone.utc),
+        "length": len(text),
+    }
+    document.update({k: v for k, v in metadata.items() if k != "timestamp" and v})
+    if previous_text is None or (version - 1) % VERSION_SNAPSHOT_INTERVAL == 0:
+        document.update({"kind": "snapshot", "text": text})
+    else:
+        document.update({"kind": "delta", "ops": compute_delta(previous_text, text)})
+    versions_collection.insert_one(document)
+
+
+def record_version(history_id, text, previous_text=None, previous_metadata=None, **metadata):
+    """Record ``text`` as the next version of a history item.
+
+    The first time an item is edited, ``previous_text`` is stored as version 1
+    so the original output is kept. Returns the new version number, or the
+    current one if the text didn't change.
+    """
+    history_id = str(history_id)
+    for attempt in range(3):
+        latest = latest_version(history_id)
+        try:
+            if latest is None:
+                if previous_text is None or previous_text == text:
+                    _insert_version(history_id, 1, text, None, metadata)
+                    return 1
+                _insert_version(history_id, 1, previous_text, None, previous_metadata or {})
+                base_version, base_text = 1, previous_text
+            else:
+                base_version = latest["version"]
+                base_text = rebuild(history_id, base_version)
+            if base_text == text:
+                return base_version
+            _insert_version(history_id, base_version + 1, text, base_text, metadata)
+            return base_version + 1
+        except DuplicateKeyError:
+            # Another save took this version number; rebase on top of it
+            if attempt == 2:
+                raise
+
+
+def list_versions(history_id):
+    return list(versions_collection.find({"history_id": str(history_id)}, METADATA_PROJECTION).sort("version", 1))
+
+
+def get_version(history_id, version):
+    """Metadata and rebuilt text of one version, or None."""
+    history_id = str(history_id)
+    document = versions_collection.find_one({"history_id": history_id, "version": version}, METADATA_PROJECTION)
+    if not document:
+        return None
+    document["text"] = rebuild(history_id, version)
+    return document
+
+
+def diff_versions(history_id, from_version, to_version):
+    """Unified diff between two versions, or None if either doesn't exist."""
+    history_id = str(history_id)
+    old_text = rebuild(history_id, from_version)
+    new_text = rebuild(history_id, to_version)
+    if old_text is None or new_text is None:
+        return None
+    return "".join(difflib.unified_diff(
+        old_text.splitlines(keepends=True),
+        new_text.splitlines(keepends=True),
+        fromfile=f"v{from_version}",
+        tofile=f"v{to_version}"
+    ))
+
+
+def delete_versions(history_id):
+    versions_collection.delete_many({"history_id": str(history_id)})
@@ -1148,8 +1148,12 @@ const handleChatSubmit = async (e) => {
                 content: parsed.confirmation || "✅ Modifications appliquées avec succès." 
               }]);
               
+              // Follow the history item the server saved the changes to, so
+              // the next message continues the same conversation
+              if (parsed.history_id) setActiveHistoryId(parsed.history_id);
+              
               // Update history
-              fetchAndUpdateHistory(updatedTests, activeHistoryId);
+              fetchAndUpdateHistory(updatedTests, parsed.history_id || activeHistoryId);
             }
             // Handle regular text chunks
             else if (parsed.chunk) {